@@ -0,0 +1,404 @@
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from mbp.musicbeelibrary import MBLibrary
+from mbp.track import Track
+
+try:
+	import resource
+except ImportError:
+	# Not available on Windows, RSS is then not reported
+	resource = None
+
+
+def max_rss_mb():
+	"""Returns the peak resident set size of this process in MB, or None if it can not be determined."""
+	if not resource:
+		return None
+	rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# ru_maxrss is in bytes on macOS and in kilobytes everywhere else
+	return rss / 1024 ** 2 if sys.platform == 'darwin' else rss / 1024
+
+
+def timed(func, *args, repeat=1, **kwargs):
+	"""Calls func repeat times and returns the last result and the best wall clock time in seconds."""
+	best = None
+	result = None
+	for _ in range(repeat):
+		start = time.perf_counter()
+		result = func(*args, **kwargs)
+		elapsed = time.perf_counter() - start
+		best = elapsed if best is None else min(best, elapsed)
+	return result, best
+
+
+# Measures the memory of a library read from file_path and the throughput of Track.get
+def bench_tracks(file_path):
+	tracemalloc.start()
+	mbl = MBLibrary(file_path)
+	library_size = tracemalloc.get_traced_memory()[0]
+	tracemalloc.stop()
+
+	print('{:30}{}'.format('Tracks:', len(mbl.tracks)))
+	print('{:30}{:.1f} MB'.format('Library memory:', library_size / 1024 ** 2))
+	print('{:30}{:.0f} B'.format('Memory per track:', library_size / len(mbl.tracks)))
+	if max_rss_mb():
+		print('{:30}{:.1f} MB'.format('Peak RSS:', max_rss_mb()))
+
+	tags = ['artist', 'play_count', 'total_time', 'name', 'size']
+	tracks = mbl.tracks
+
+	def get_all():
+		for t in tracks:
+			for tag in tags:
+				t.get(tag)
+
+	_, elapsed = timed(get_all, repeat=5)
+	print('{:30}{:.2f} M/s'.format('Track.get throughput:', len(tracks) * len(tags) / elapsed / 10 ** 6))
+
+
+# Simulates a month of daily saves of the library at file_path in a SnapshotStore and measures its size and load times
+def bench_store(file_path, days=30, plays_per_day=50, keyframe_interval=7):
+	from mbp.snapshotstore import SnapshotStore
+
+	days = int(days)
+	tracks = [Track(**t.data) for t in MBLibrary(file_path).tracks]
+	rnd = random.Random(0)
+	start = datetime.date(2000, 1, 1)
+
+	with tempfile.TemporaryDirectory() as folder:
+		store = SnapshotStore(folder, keyframe_interval=int(keyframe_interval))
+		full = SnapshotStore(os.path.join(folder, 'full'), keyframe_interval=1)
+
+		for day in range(days):
+			# Play some random tracks every day
+			for t in rnd.sample(tracks, int(plays_per_day)):
+				t.play_count += 1
+				t.play_date = datetime.datetime(2000, 1, 1) + datetime.timedelta(days=day)
+
+			library = MBLibrary(tracks=tracks)
+			store.save(library, start + datetime.timedelta(days=day))
+			full.save(library, start + datetime.timedelta(days=day))
+
+		def size(path):
+			return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path) if os.path.isfile(os.path.join(path, f)))
+
+		print('{:30}{}'.format('Days:', days))
+		print('{:30}{:.1f} MB'.format('Full snapshots:', size(full.folder) / 1024 ** 2))
+		print('{:30}{:.1f} MB'.format('Keyframes and deltas:', size(store.folder) / 1024 ** 2))
+
+		full_times = [timed(full.load_columns, start + datetime.timedelta(days=day))[1] for day in range(days)]
+		times = [timed(store.load_columns, start + datetime.timedelta(days=day))[1] for day in range(days)]
+		print('{:30}{:.1f} ms'.format('Full snapshot load (mean):', sum(full_times) / days * 1000))
+		print('{:30}{:.1f} ms'.format('Delta load (mean):', sum(times) / days * 1000))
+		print('{:30}{:.1f} ms'.format('Delta load (max):', max(times) * 1000))
+
+
+# Diffs the library at file_path against a copy with some plays, renames, additions and removals
+def bench_diff(file_path, plays=1000, renames=100, changes=200):
+	old = MBLibrary(file_path)
+	tracks = [Track(**t.data) for t in old.tracks]
+	rnd = random.Random(0)
+
+	for t in rnd.sample(tracks, int(plays)):
+		t.play_count += 1
+	for t in rnd.sample(tracks, int(renames)):
+		t.name = (t.name or '') + ' (Remastered)'
+	for t in rnd.sample(tracks, int(changes)):
+		tracks.remove(t)
+	tracks += [Track(name='New {}'.format(i), artist='New', play_count=1) for i in range(int(changes))]
+	new = MBLibrary(tracks=tracks)
+
+	diff, elapsed = timed(new.diff, old, repeat=5)
+	subbed, sub_elapsed = timed(new.__sub__, old, repeat=5)
+
+	print('{:30}{} / {}'.format('Tracks:', len(new.tracks), len(old.tracks)))
+	print('{:30}{}'.format('Diff result:', diff))
+	print('{:30}{:.1f} ms'.format('Diff:', elapsed * 1000))
+	print('{:30}{:.1f} ms'.format('Subtraction:', sub_elapsed * 1000))
+	print('{:30}{}'.format('Tracks in subtraction:', len(subbed.tracks)))
+
+
+# Runs the recommendations for the most played tracks of the library at file_path against a local Last.fm stand-in
+def bench_recommend(file_path, based_on=100, latency=0.05, error_rate=0.02, workers=8):
+	from concurrent.futures import ThreadPoolExecutor
+
+	from lastfm.lastfmapi import LastFMAPI
+	from lastfm.standin import StandInServer, similar_tracks_fixtures
+	from mbp.ranking import Ranking
+	from mbp.recommender import Recommender
+	from mbp.tagtracker import TagTracker
+
+	based_on = int(based_on)
+	tracker = TagTracker(lambda t: t, 'play_count', unique=False)
+	mbl = MBLibrary(file_path, tagtrackers=[tracker])
+	ranking = Ranking(tracker, top=based_on)
+	top = [ranking.get_entry(i) for i in range(1, min(based_on, ranking.get_length()) + 1)]
+
+	with StandInServer(similar_tracks_fixtures(top), latency=float(latency), jitter=float(latency), error_rate=float(error_rate), seed=0) as standin:
+		api = LastFMAPI('benchmark', api_root=standin.url, workers=int(workers), requests_per_second=1000, backoff=0.05)
+
+		def get_similar(t):
+			start = time.perf_counter()
+			api.get_similar_tracks_sanitized(t.get('artist'), t.get('name'))
+			return time.perf_counter() - start
+
+		start = time.perf_counter()
+		with ThreadPoolExecutor(max_workers=int(workers)) as executor:
+			latencies = sorted(executor.map(get_similar, top))
+		elapsed = time.perf_counter() - start
+
+		# The first run requests the similar tracks, after that they are in the graph and only the scoring is left
+		recommender = Recommender(ranking, api, based_on=based_on, amount=10, library=mbl)
+		_, recommend_elapsed = timed(recommender.get_recommendations)
+		_, score_elapsed = timed(recommender.get_recommendations, repeat=5)
+
+		print('{:30}{}'.format('Requests:', standin.request_count))
+		print('{:30}{}'.format('Injected errors:', standin.error_count))
+		print('{:30}{:.1f} /s'.format('Lookups:', len(top) / elapsed))
+		for percentile in (50, 95, 99):
+			print('{:30}{:.0f} ms'.format('Latency p{}:'.format(percentile), latencies[min(len(latencies) - 1, len(latencies) * percentile // 100)] * 1000))
+		print('{:30}{:.2f} s'.format('Recommendations:', recommend_elapsed))
+		print('{:30}{} tracks, {} edges'.format('Similarity graph:', len(recommender.graph.nodes), len(recommender.graph.edge_targets)))
+		print('{:30}{:.1f} ms'.format('Scoring:', score_elapsed * 1000))
+
+
+# Compares the library summary with the sum and max over the Tracks it replaces, counting the Tracks they create
+def bench_summary(file_path):
+	mbl = MBLibrary(file_path)
+	created = [0]
+	track_init = Track.__init__
+
+	def counting_init(self, *args, **kwargs):
+		created[0] += 1
+		track_init(self, *args, **kwargs)
+
+	def old_summary():
+		tracks = mbl.tracks
+		return (sum(tracks).get('size'), sum(tracks).get('play_count'), sum(tracks).get('play_count') / len(tracks),
+				sum(tracks).get('total_time'), sum([t.get('play_count') * t.get('total_time') for t in tracks]),
+				max(tracks).get('name'), max(tracks).get('play_count'), max(tracks).get('total_time') * max(tracks).get('play_count'))
+
+	def new_summary():
+		mbl.invalidate_index()
+		return mbl.summary
+
+	# Import numpy before measuring
+	new_summary()
+
+	for name, func in (('sum/max over Tracks', old_summary), ('LibrarySummary', new_summary)):
+		created[0] = 0
+		Track.__init__ = counting_init
+		tracemalloc.start()
+		try:
+			_, elapsed = timed(func)
+			peak = tracemalloc.get_traced_memory()[1]
+		finally:
+			tracemalloc.stop()
+			Track.__init__ = track_init
+
+		print(name)
+		print('{:30}{:.1f} ms'.format('  Time:', elapsed * 1000))
+		print('{:30}{}'.format('  Tracks created:', created[0]))
+		print('{:30}{:.1f} MB'.format('  Peak allocated:', peak / 1024 ** 2))
+
+
+# Saves days of libraries with random plays and measures the throughput of the daily aggregates backfill per process count
+def bench_backfill(file_path, days=60, plays_per_day=50):
+	from mbp.aggregates import DailyAggregates
+	from mbp.snapshotstore import SnapshotStore
+
+	days = int(days)
+	tracks = [Track(**t.data) for t in MBLibrary(file_path).tracks]
+	rnd = random.Random(0)
+
+	with tempfile.TemporaryDirectory() as folder:
+		store = SnapshotStore(folder)
+		for day in range(days):
+			for t in rnd.sample(tracks, int(plays_per_day)):
+				t.play_count += 1
+			store.save(MBLibrary(tracks=tracks), datetime.date(2000, 1, 1) + datetime.timedelta(days=day))
+
+		print('{:30}{}'.format('Days:', days))
+		processes = 1
+		single = None
+		while True:
+			aggregates = DailyAggregates(folder)
+			aggregates.days = {}
+			_, elapsed = timed(aggregates.backfill, processes=processes)
+			single = single if single else elapsed
+			print('{:30}{:.1f} snapshots/s ({:.1f}x)'.format(f'{processes} processes:', days / elapsed, single / elapsed))
+
+			if processes >= (os.cpu_count() or 1):
+				break
+			processes = min(processes * 2, os.cpu_count() or 1)
+
+
+# Measures the daily -saveOnly save of a copy of the library at file_path when the export did not change, was touched,
+# had some tracks played, or was saved already
+def bench_saveonly(file_path, backend='snapshots', plays=50):
+	import re
+	import shutil
+
+	from mbp.musicbeelibrary import read_library_xml, save_library_file
+
+	cwd = os.getcwd()
+	date = datetime.date(2000, 1, 1)
+
+	with tempfile.TemporaryDirectory() as folder:
+		export_path = os.path.join(folder, 'export.xml')
+		shutil.copyfile(file_path, export_path)
+		os.chdir(folder)
+		try:
+			for name in ('First save:', 'Unchanged export:', 'Touched export:', 'Played tracks:', 'Saved already:'):
+				if name == 'Touched export:':
+					os.utime(export_path)
+				elif name == 'Played tracks:':
+					# Play the first tracks once more
+					with open(export_path, 'r', encoding='utf-8') as export_file:
+						xml = export_file.read()
+					xml = re.sub('<key>Play Count</key><integer>([0-9]+)</integer>', lambda m: '<key>Play Count</key><integer>{}</integer>'.format(int(m.group(1)) + 1), xml, count=int(plays))
+					with open(export_path, 'w', encoding='utf-8') as export_file:
+						export_file.write(xml)
+				if name != 'Saved already:':
+					date += datetime.timedelta(days=1)
+
+				(result, reused, decoded), elapsed = timed(save_library_file, export_path, backend=backend, date=date)
+				print('{:30}{:.1f} ms ({}, {} reused, {} decoded)'.format(name, elapsed * 1000, result, reused, decoded))
+
+			_, elapsed = timed(read_library_xml, export_path, columnar=True)
+			print('{:30}{:.1f} ms'.format('Full read for comparison:', elapsed * 1000))
+		finally:
+			os.chdir(cwd)
+
+
+# Saves two months of libraries with random plays, where half of the tracks of every artist and album are written in
+# lower case, and times the monthly report of the last day with the Last.fm API offline. Exits with 1 if it fails
+def bench_report(file_path, backend='snapshots', plays_per_day=50):
+	import contextlib
+	import io
+
+	from main import show_stats_over_time
+	from mbp.musicbeelibrary import save_library
+
+	tracks = [Track(**t.data) for t in MBLibrary(file_path).tracks]
+	for t in tracks[::2]:
+		t.artist = t.artist.lower() if t.artist else t.artist
+		t.album = t.album.lower() if t.album else t.album
+	rnd = random.Random(0)
+	start = datetime.date(2020, 2, 1)
+	end = datetime.date(2020, 3, 31)
+
+	cwd = os.getcwd()
+	stdin = sys.stdin
+	with tempfile.TemporaryDirectory() as folder:
+		os.chdir(folder)
+		try:
+			with open('lastfmapi.mbc', 'w', encoding='utf-8') as settings_file:
+				settings_file.write('api_key=none\noffline=1\n')
+
+			for day in range((end - start).days + 1):
+				for t in rnd.sample(tracks, int(plays_per_day)):
+					t.play_count += 1
+				save_library(MBLibrary(tracks=[Track(**t.data) for t in tracks]), backend=backend, date=start + datetime.timedelta(days=day))
+
+			# The report waits for enter at the end
+			sys.stdin = io.StringIO('\n')
+			report = io.StringIO()
+			try:
+				with contextlib.redirect_stdout(report):
+					_, elapsed = timed(show_stats_over_time, date=end, backend=backend)
+			except Exception:
+				print(report.getvalue())
+				raise
+		finally:
+			sys.stdin = stdin
+			os.chdir(cwd)
+
+	print('{:30}{:.1f} ms'.format('Monthly report:', elapsed * 1000))
+	print('{:30}{}'.format('Report lines:', len(report.getvalue().splitlines())))
+
+
+# Modules that must not be imported when a script is loaded, they are only needed on some paths
+LAZY_MODULES = ('matplotlib', 'numpy', 'dateutil', 'requests', 'sqlite3', 'lastfm', 'mbp.plots', 'mbp.periodgrapher', 'mbp.columnar')
+
+
+# Imports a script in a new interpreter with -X importtime
+# Returns the cumulative import time in ms of the script and of every module it imports, and the LAZY_MODULES among them
+# Raises a RuntimeError with the output of the interpreter if the import fails
+def measure_imports(file_path):
+	import subprocess
+
+	module = os.path.splitext(os.path.basename(file_path))[0]
+	folder = os.path.dirname(os.path.abspath(file_path))
+	result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=folder, capture_output=True, text=True)
+	if result.returncode:
+		raise RuntimeError(result.stderr)
+
+	# Lines are 'import time: self [us] | cumulative | imported package', an import is listed after the imports it
+	# makes, which are indented. Only keep the imports made by module, not the ones of the interpreter startup.
+	imports = {}
+	nested = {}
+	for line in result.stderr.splitlines():
+		if line.startswith('import time:') and not line.endswith('imported package'):
+			_, cumulative, name = line[len('import time:'):].split('|')
+			nested[name.strip()] = int(cumulative) / 1000
+			if not name[1:].startswith(' '):
+				if name.strip() == module:
+					imports = nested
+				nested = {}
+
+	lazy = sorted({lazy_module for lazy_module in LAZY_MODULES for name in imports if name == lazy_module or name.startswith(lazy_module + '.')})
+	return imports.get(module, 0), imports, lazy
+
+
+# Measures the import time of a script with -X importtime and checks it against a budget, exits with 1 if it fails
+def bench_imports(file_path, budget_ms=100):
+	module = os.path.splitext(os.path.basename(file_path))[0]
+	try:
+		total, imports, lazy = measure_imports(file_path)
+	except RuntimeError as error:
+		print(error)
+		sys.exit(1)
+
+	slowest = sorted(((ms, name) for name, ms in imports.items() if name != module), reverse=True)[:5]
+
+	print('{:30}{:.1f} ms (budget {} ms)'.format(f'Import {module}:', total, budget_ms))
+	for ms, name in slowest:
+		print('{:30}{:.1f} ms'.format('  ' + name, ms))
+	if lazy:
+		print('{:30}{}'.format('Imported too early:', ', '.join(lazy)))
+
+	if total > float(budget_ms) or lazy:
+		print('Import time budget exceeded')
+		sys.exit(1)
+
+
+BENCHMARKS = {
+	'tracks': bench_tracks,
+	'store': bench_store,
+	'diff': bench_diff,
+	'recommend': bench_recommend,
+	'summary': bench_summary,
+	'backfill': bench_backfill,
+	'saveonly': bench_saveonly,
+	'report': bench_report,
+	'imports': bench_imports,
+}
+
+
+def main(args):
+	if len(args) < 3 or args[1] not in BENCHMARKS:
+		print('Use this program as follows: python benchmark.py {} PATH_TO_FILE [OPTIONS]'.format('|'.join(BENCHMARKS)))
+		sys.exit()
+
+	BENCHMARKS[args[1]](*args[2:])
+
+
+if __name__ == '__main__':
+	main(sys.argv)
@@ -0,0 +1,165 @@
+import json
+import sqlite3
+import threading
+import time
+
+DAY = 24 * 60 * 60
+
+# How long responses of a method stay valid, in seconds
+TTLS = {
+	'track.getsimilar': 30 * DAY,
+	'artist.getsimilar': 30 * DAY,
+	'artist.getinfo': 7 * DAY,
+	'album.getinfo': 7 * DAY,
+}
+DEFAULT_TTL = DAY
+
+
+def make_key(method, args):
+	"""Returns the cache key of a request: the method and the arguments sorted by name, with case and surrounding
+	whitespace of the values ignored, so 'Artist ' and 'artist' share a response."""
+	normalized = sorted([str(name), str(value).strip().lower()] for name, value in args)
+	return json.dumps([method, normalized])
+
+
+class ResponseCache:
+	"""
+	ResponseCache stores Last.fm API responses in an SQLite database, keyed by method and arguments.
+	Responses expire after the TTL of their method. When the stored responses get bigger than max_size bytes the least
+	recently used ones are removed. hits and misses count the lookups.
+
+	The access times of hits are kept in memory and only written when responses are stored, before the least recently
+	used ones are removed, or when the cache is closed, so a hit does not write to disk:
+	with ResponseCache('lastfmcache.db') as cache:
+		cache.get('track.getsimilar', [('artist', 'Artist'), ('track', 'Song')])
+
+	Use ':memory:' as file_path for a cache that is not stored on disk.
+	"""
+
+	def __init__(self, file_path='lastfmcache.db', max_size=50 * 1024 ** 2, ttls=None):
+		"""
+		:param file_path: path of the SQLite database
+		:param max_size: maximum size in bytes of all stored responses
+		:param ttls: dict of method to TTL in seconds, overrides TTLS
+		"""
+		self.file_path = file_path
+		self.max_size = max_size
+		self.ttls = dict(TTLS, **(ttls if ttls else {}))
+		self.hits = 0
+		self.misses = 0
+		# Key to access time of the hits that are not written yet
+		self.accessed = {}
+
+		# The API can be used from several threads, they share the connection
+		self.lock = threading.Lock()
+		self.connection = sqlite3.connect(file_path, check_same_thread=False)
+		self.connection.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, method TEXT, response TEXT, created REAL, accessed REAL, size INTEGER)')
+		self.connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+		self.connection.commit()
+
+		# Total size of the stored responses
+		self.size = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+	def get_ttl(self, method):
+		return self.ttls.get(method, DEFAULT_TTL)
+
+	def get(self, method, args):
+		"""Returns the stored response of the request, or None if it is not stored or has expired."""
+		key = make_key(method, args)
+		now = time.time()
+		with self.lock:
+			row = self.connection.execute('SELECT response, created FROM responses WHERE key = ?', (key,)).fetchone()
+			if row is None or now - row[1] > self.get_ttl(method):
+				self.misses += 1
+				return None
+
+			self.hits += 1
+			self.accessed[key] = now
+		return json.loads(row[0])
+
+	def write_accessed(self):
+		"""Writes the access times of the hits since the last write, without committing. Hold the lock."""
+		if self.accessed:
+			self.connection.executemany('UPDATE responses SET accessed = ? WHERE key = ?', [(now, key) for key, now in self.accessed.items()])
+			self.accessed = {}
+
+	def get_all(self, method):
+		"""Yields the (args, response, created) of every stored response of method that has not expired. The args are
+		the normalized ones of the cache key, see make_key."""
+		with self.lock:
+			rows = self.connection.execute('SELECT key, response, created FROM responses WHERE method = ? AND created >= ?',
+										   (method, time.time() - self.get_ttl(method))).fetchall()
+		for key, response, created in rows:
+			yield json.loads(key)[1], json.loads(response), created
+
+	def put(self, method, args, response, created=None):
+		"""
+		Stores the response of the request, replacing any stored response.
+		:param created: time the response was received, now if omitted
+		"""
+		data = json.dumps(response)
+		now = time.time()
+		key = make_key(method, args)
+		with self.lock:
+			self.write_accessed()
+			replaced = self.connection.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+			self.connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)', (key, method, data, created if created else now, now, len(data)))
+			self.size += len(data) - (replaced[0] if replaced else 0)
+
+			if self.size > self.max_size:
+				self.evict()
+			self.connection.commit()
+
+	def evict(self):
+		"""Removes expired responses, then the least recently used ones until the cache fits in max_size."""
+		now = time.time()
+		for method in [row[0] for row in self.connection.execute('SELECT DISTINCT method FROM responses')]:
+			self.connection.execute('DELETE FROM responses WHERE method = ? AND created < ?', (method, now - self.get_ttl(method)))
+
+		size = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+		removed = []
+		for key, response_size in self.connection.execute('SELECT key, size FROM responses ORDER BY accessed'):
+			if size <= self.max_size:
+				break
+			removed.append((key,))
+			size -= response_size
+		self.connection.executemany('DELETE FROM responses WHERE key = ?', removed)
+		self.size = size
+
+	def seed(self, file_path):
+		"""
+		Stores the responses in a JSON file, so the API can be used offline with them.
+		The file holds a list of {'method': method, 'args': [[name, value], ...], 'response': response}.
+		"""
+		with open(file_path, 'r', encoding='utf-8') as seed_file:
+			for entry in json.load(seed_file):
+				self.put(entry['method'], entry['args'], entry['response'])
+
+	def clear(self):
+		with self.lock:
+			self.connection.execute('DELETE FROM responses')
+			self.connection.commit()
+			self.accessed = {}
+			self.size = 0
+
+	def __len__(self):
+		with self.lock:
+			return self.connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+	def get_stats(self):
+		"""Returns a string with the number of stored responses, hits and misses."""
+		return '{} responses, {} hits, {} misses'.format(len(self), self.hits, self.misses)
+
+	def close(self):
+		"""Writes the access times of the hits and closes the database."""
+		with self.lock:
+			self.write_accessed()
+			self.connection.commit()
+			self.connection.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
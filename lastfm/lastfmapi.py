@@ -1,25 +1,58 @@
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
+from requests.adapters import HTTPAdapter
 
+from lastfm.ratelimit import TokenBucket
 from mbp.track import Track
 
-API_ROOT = 'http://ws.audioscrobbler.com/2.0/?api_key={}&method={}&format=json{}'
+API_ROOT = 'http://ws.audioscrobbler.com/2.0/'
+
+# Last.fm allows about 5 requests per second averaged over 5 minutes
+REQUESTS_PER_SECOND = 5
+
+# HTTP statuses and Last.fm error codes (rate limit exceeded, temporarily unavailable) that are retried
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RETRY_ERRORS = (11, 16, 29)
 
 
 class LastFMAPI:
 
-	def __init__(self, key, secret='', registered_to='', application_name=''):
+	def __init__(self, key, secret='', registered_to='', application_name='', cache=None, offline=False, api_root=API_ROOT,
+				workers=4, requests_per_second=REQUESTS_PER_SECOND, retries=3, backoff=0.5, timeout=10):
 		"""
 		:param key:
 		:param secret:
 		:param registered_to:
 		:param application_name:
+		:param cache: ResponseCache responses are looked up in before they are requested, and stored in after
+		:param offline: if True no requests are made, requests not in the cache return an empty dict
+		:param api_root: URL of the API
+		:param workers: number of requests the *_many methods make at the same time
+		:param requests_per_second: maximum average number of requests per second
+		:param retries: number of times a failed request is retried
+		:param backoff: seconds to wait before the first retry, doubled for every next retry
+		:param timeout: seconds to wait for a response
 		"""
 		self.key = key
 		self.secret = secret
 		self.registered_to = registered_to
 		self.application_name = application_name
+		self.cache = cache
+		self.offline = offline
+		self.api_root = api_root
+		self.workers = workers
+		self.retries = retries
+		self.backoff = backoff
+		self.timeout = timeout
+
+		self.rate_limiter = TokenBucket(requests_per_second)
+
+		# One session keeps the connections to the API open between requests
+		self.session = requests.Session()
+		self.session.mount(api_root, HTTPAdapter(pool_connections=1, pool_maxsize=workers))
 
 	def request(self, method, args):
 		"""
@@ -28,13 +61,59 @@ class LastFMAPI:
 		:param args: arguments to add to the url, in a list of tuples, ie [[key, value], [key, value]]
 		:return: JSON data from the REST API
 		"""
-		arg_string = ''
-		for arg in args:
-			arg_string += '&{}={}'.format(arg[0], arg[1])
+		if self.cache:
+			data = self.cache.get(method, args)
+			if data is not None:
+				return data
+
+		if self.offline:
+			return {}
+
+		data = self.fetch(method, args)
+		# Errors are not cached, they are returned as {'error': code, 'message': message}
+		if self.cache and 'error' not in data:
+			self.cache.put(method, args, data)
+		return data
+
+	def fetch(self, method, args):
+		"""
+		Requests method from the API, retrying with exponential backoff when the API is busy or unavailable.
+		:return: JSON data from the REST API, the last error response if all retries failed
+		"""
+		params = [('api_key', self.key), ('method', method), ('format', 'json')] + [tuple(arg) for arg in args]
 
-		ret = requests.get(API_ROOT.format(self.key, method, arg_string))
+		for attempt in range(self.retries + 1):
+			wait = self.backoff * 2 ** attempt
+			self.rate_limiter.acquire()
+			try:
+				ret = self.session.get(self.api_root, params=params, timeout=self.timeout)
+			except (requests.ConnectionError, requests.Timeout):
+				if attempt == self.retries:
+					raise
+				time.sleep(wait)
+				continue
 
-		return json.loads(ret.content)
+			try:
+				data = json.loads(ret.content)
+			except ValueError:
+				data = {'error': ret.status_code, 'message': ret.reason}
+
+			retry = ret.status_code in RETRY_STATUSES or data.get('error') in RETRY_ERRORS
+			if not retry or attempt == self.retries:
+				return data
+
+			# Respect the wait the API asks for, if it does
+			retry_after = ret.headers.get('Retry-After')
+			time.sleep(float(retry_after) if retry_after and retry_after.isdigit() else wait)
+
+	def request_many(self, requests_args):
+		"""
+		Makes several requests at the same time, see request.
+		:param requests_args: list of (method, args)
+		:return: list of the JSON data of every request, in the same order
+		"""
+		with ThreadPoolExecutor(max_workers=self.workers) as executor:
+			return list(executor.map(lambda request_args: self.request(*request_args), requests_args))
 
 	def get_album_info(self, artist, album):
 		"""
@@ -73,3 +152,12 @@ class LastFMAPI:
 			# print(self.get_similar_tracks(artist, track))
 			return []
 
+	def get_similar_tracks_many(self, tracks):
+		"""
+		Returns the similar tracks of several tracks at once, requested at the same time.
+		:param tracks: list of (artist, track)
+		:return: list of lists of Tracks, see get_similar_tracks_sanitized
+		"""
+		with ThreadPoolExecutor(max_workers=self.workers) as executor:
+			return list(executor.map(lambda t: self.get_similar_tracks_sanitized(*t), tracks))
+
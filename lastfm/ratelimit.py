@@ -0,0 +1,34 @@
+import threading
+import time
+
+
+class TokenBucket:
+	"""
+	TokenBucket limits how often something happens: it holds up to capacity tokens and gains rate tokens per second.
+	Every acquire takes a token, waiting until one is available. Safe to use from several threads.
+	"""
+
+	def __init__(self, rate, capacity=None):
+		"""
+		:param rate: tokens gained per second, the average number of acquires per second
+		:param capacity: maximum number of tokens, the number of acquires that can happen at once, rate if omitted
+		"""
+		self.rate = rate
+		self.capacity = capacity if capacity else rate
+		self.tokens = self.capacity
+		self.last = time.monotonic()
+		self.lock = threading.Lock()
+
+	def acquire(self):
+		"""Takes a token, waits until there is one if needed."""
+		while True:
+			with self.lock:
+				now = time.monotonic()
+				self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+				self.last = now
+
+				if self.tokens >= 1:
+					self.tokens -= 1
+					return
+				wait = (1 - self.tokens) / self.rate
+			time.sleep(wait)
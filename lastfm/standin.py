@@ -0,0 +1,179 @@
+import http.server
+import json
+import random
+import sys
+import threading
+import time
+from urllib.parse import urlparse, parse_qsl
+
+from lastfm.cache import make_key
+
+# Methods the stand-in serves
+METHODS = ('track.getsimilar', 'artist.getsimilar', 'artist.getinfo', 'album.getinfo')
+
+# Arguments every request has that are not part of the fixture
+_COMMON_ARGS = ('api_key', 'method', 'format')
+
+
+class StandInServer:
+	"""
+	StandInServer is a local stand-in for the Last.fm API, serving METHODS from recorded fixtures so LastFMAPI and the
+	Recommender can be tested and benchmarked offline. Point a LastFMAPI at it with api_root=server.url.
+
+	Fixture files hold a list of {'method': method, 'args': [[name, value], ...], 'response': response}, the same format
+	ResponseCache.seed reads. Requests without a fixture get Last.fm's 'not found' error.
+
+	Every response is delayed by latency plus a random part up to jitter seconds, and error_rate of the requests fail
+	with a 503 'temporary error', so retries and tail latency can be measured.
+	"""
+
+	def __init__(self, fixtures=None, latency=0.0, jitter=0.0, error_rate=0.0, port=0, seed=None):
+		"""
+		:param fixtures: path of a fixture file, or a list of fixtures
+		:param latency: seconds every response is delayed
+		:param jitter: maximum seconds every response is delayed on top of latency
+		:param error_rate: fraction of requests that fail
+		:param port: port to listen on, a free port if 0
+		:param seed: seed of the random latency and errors
+		"""
+		self.latency = latency
+		self.jitter = jitter
+		self.error_rate = error_rate
+		self.random = random.Random(seed)
+		self.lock = threading.Lock()
+		self.request_count = 0
+		self.error_count = 0
+
+		self.responses = {}
+		if isinstance(fixtures, str):
+			self.load_fixtures(fixtures)
+		elif fixtures:
+			for fixture in fixtures:
+				self.add_fixture(fixture['method'], fixture['args'], fixture['response'])
+
+		self.server = http.server.ThreadingHTTPServer(('127.0.0.1', port), self.create_handler())
+		self.server.daemon_threads = True
+		self.thread = None
+
+	@property
+	def url(self):
+		return 'http://127.0.0.1:{}/2.0/'.format(self.server.server_port)
+
+	def load_fixtures(self, file_path):
+		with open(file_path, 'r', encoding='utf-8') as fixture_file:
+			for fixture in json.load(fixture_file):
+				self.add_fixture(fixture['method'], fixture['args'], fixture['response'])
+
+	def add_fixture(self, method, args, response):
+		self.responses[make_key(method, args)] = response
+
+	def respond(self, query):
+		"""Returns the HTTP status and JSON data of a request with the query string query."""
+		args = [[name, value] for name, value in parse_qsl(query) if name not in _COMMON_ARGS]
+		method = dict(parse_qsl(query)).get('method')
+
+		with self.lock:
+			self.request_count += 1
+			delay = self.latency + self.random.random() * self.jitter
+			fail = self.random.random() < self.error_rate
+			if fail:
+				self.error_count += 1
+		time.sleep(delay)
+
+		if fail:
+			return 503, {'error': 16, 'message': 'There was a temporary error processing your request.'}
+		if method not in METHODS:
+			return 400, {'error': 3, 'message': 'Invalid Method - No method with that name in this package'}
+		response = self.responses.get(make_key(method, args))
+		if response is None:
+			return 404, {'error': 6, 'message': 'Not found'}
+		return 200, response
+
+	def create_handler(self):
+		standin = self
+
+		class Handler(http.server.BaseHTTPRequestHandler):
+			# Keep connections open, like the API does
+			protocol_version = 'HTTP/1.1'
+			# Headers and body are written separately, without this they wait for delayed ACKs
+			disable_nagle_algorithm = True
+
+			def do_GET(self):
+				status, data = standin.respond(urlparse(self.path).query)
+				body = json.dumps(data).encode('utf-8')
+				self.send_response(status)
+				self.send_header('Content-Type', 'application/json')
+				self.send_header('Content-Length', str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+
+			def log_message(self, format, *args):
+				pass
+
+		return Handler
+
+	def start(self):
+		"""Starts serving in a background thread, returns self."""
+		self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+		self.thread.start()
+		return self
+
+	def stop(self):
+		self.server.shutdown()
+		self.server.server_close()
+
+	def __enter__(self):
+		return self.start()
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.stop()
+
+
+def record_fixtures(api, requests_args, file_path):
+	"""
+	Makes requests with a LastFMAPI and saves the responses as a fixture file for StandInServer.
+	:param api: LastFMAPI to request with, usually one for the real API
+	:param requests_args: list of (method, args)
+	:param file_path: path of the fixture file
+	:return: number of fixtures saved, error responses are left out
+	"""
+	fixtures = []
+	for (method, args), response in zip(requests_args, api.request_many(requests_args)):
+		if 'error' not in response:
+			fixtures.append({'method': method, 'args': [list(arg) for arg in args], 'response': response})
+
+	with open(file_path, 'w', encoding='utf-8') as fixture_file:
+		json.dump(fixtures, fixture_file)
+	return len(fixtures)
+
+
+def similar_tracks_fixtures(tracks, similar=50, seed=0):
+	"""
+	Returns synthetic track.getsimilar fixtures for tracks: every track is similar to similar random other tracks.
+	:param tracks: list of Tracks
+	"""
+	rnd = random.Random(seed)
+	fixtures = []
+	for t in tracks:
+		similars = rnd.sample(tracks, min(similar, len(tracks)))
+		fixtures.append({
+			'method': 'track.getsimilar',
+			'args': [['artist', t.get('artist')], ['track', t.get('name')]],
+			'response': {'similartracks': {'track': [{'name': s.get('name'), 'artist': {'name': s.get('artist')}, 'match': rnd.random()} for s in similars]}},
+		})
+	return fixtures
+
+
+if __name__ == '__main__':
+	# python -m lastfm.standin FIXTURE_FILE [PORT] [LATENCY] [ERROR_RATE] serves FIXTURE_FILE until interrupted
+	if len(sys.argv) < 2:
+		print('Use this program as follows: python -m lastfm.standin FIXTURE_FILE [PORT] [LATENCY] [ERROR_RATE]')
+		sys.exit()
+
+	options = sys.argv[2:] + [0, 0, 0][len(sys.argv[2:]):]
+	standin = StandInServer(sys.argv[1], port=int(options[0]), latency=float(options[1]), error_rate=float(options[2]))
+	print('Serving {} fixtures at {}'.format(len(standin.responses), standin.url))
+	try:
+		standin.server.serve_forever()
+	except KeyboardInterrupt:
+		standin.server.server_close()
@@ -1,27 +1,55 @@
 import datetime
 import sys
 
-import dateutil
-import matplotlib.pyplot as plt
-import numpy
-
-from lastfm.lastfmapi import LastFMAPI
 from mbp.config import Config
-from mbp.musicbeelibrary import MBLibrary, read_library_xml, save_library, find_closest_mbl
-from mbp.periodgrapher import PeriodGrapher
-from mbp.plots import barh_plot, scatter_plot
+from mbp.musicbeelibrary import MBLibrary, save_library_file, find_closest_mbl
 from mbp.ranking import Ranking, ColumnTitle
-from mbp.recommender import Recommender
 from mbp.tagtracker import TagTracker
 
+# matplotlib, numpy, dateutil and the Last.fm client are slow to import and not needed by -saveOnly on most days,
+# so they are imported in the functions that use them. Check with: python benchmark.py imports main.py
+
 
 # TODO: fix MBLirary subtraction: subtracting one from itself results in ValueError (MBLibrary tracks list is empty which results in (if tracks:) being false)
 
 
+# Creates a TagTracker of tag with the plays, or the play time in hours, from the totals of a period as returned by
+# DailyAggregates.window and HistoryDatabase.period_totals
+# Trackers that are shown together have to share case_map, so differently capitalized values get the same key in all
+def totals_tracker(totals, tag, play_time=False, case_map=None):
+	tracker = TagTracker(tag, unique=False)
+	if case_map is not None:
+		tracker.case_map = case_map
+	for key, (plays, time) in totals.items():
+		if key is not None:
+			# Differently capitalized values are added up under the first capitalization, like TagTracker.evaluate does
+			tracker.add_value(tracker.case_map.setdefault(key.lower(), key), time / 3600000 if play_time else plays)
+	return tracker
+
+
+# Returns a case map with the first capitalization of every value in sorted order of the totals, so the keys of the
+# trackers it is shared by do not depend on the order the tracks or totals are in
+def totals_case_map(*totals):
+	case_map = {}
+	for key in sorted(key for period in totals for key in period if key is not None):
+		case_map.setdefault(key.lower(), key)
+	return case_map
+
+
 # Has some predefined plots and stuff, shows lifetime stats as well
-def show_stats(file_path):
+# If render_folder is passed the plots are written to files in it with an index.html instead of shown
+def show_stats(file_path, render_folder=None):
+	import numpy
+	from matplotlib import pyplot as plt
+
+	from mbp.plots import barh_plot, scatter_plot, render_plots
+
 	print('MusicBee Stats')
 	print('Reading library file at "' + file_path + '"')
+
+	# Trackers that use the same function share the work for it
+	length_interval = lambda t: int(t.get('total_time') / 1000 - (t.get('total_time') / 1000) % 30)
+
 	mbl = MBLibrary(file_path, tagtrackers=[
 		# Counts the play count for each artist separately
 		TagTracker('artist', 'play_count', unique=False),
@@ -36,18 +64,17 @@ def show_stats(file_path):
 		# Sums the total play time of songs per artist
 		TagTracker('artist', 'total_time', unique=False),
 		# Calculates the total time played for each artist
-		TagTracker('artist', tag_data=lambda t: t.get('play_count') * t.get('total_time'), unique=False),
+		TagTracker('artist', ('play_count', 'total_time'), unique=False),
 		# Counts the number of songs that start with a particular letter
 		TagTracker(tag=lambda t: t.get('name')[0]),
 		# Calculates the total size played for each artist
-		TagTracker('artist', tag_data=lambda t: t.get('play_count') * t.get('size'), unique=False),
+		TagTracker('artist', ('play_count', 'size'), unique=False),
 		# Counts the total play count per release year
 		TagTracker('year', 'play_count', unique=False),
 		# Counts the number of tracks in every duration with intervals of 30s
-		TagTracker(tag=lambda t: int(t.get('total_time') / 1000 - (t.get('total_time') / 1000) % 30)),
+		TagTracker(tag=length_interval),
 		# Sums the play count for each interval of 30s of length of songs
-		TagTracker(tag=lambda t: int(t.get('total_time') / 1000 - (t.get('total_time') / 1000) % 30),
-				   tag_data='play_count', unique=False),
+		TagTracker(tag=length_interval, tag_data='play_count', unique=False),
 		# Counts the number of songs of artists that start with the same letter as the artists' names
 		TagTracker(tag='artist', tag_data=lambda t: t.get('artist')[0] == t.get('name')[0], unique=False),
 		# Tracks the length of songs for each name length
@@ -58,22 +85,22 @@ def show_stats(file_path):
 		# Counts the play count per album
 		TagTracker(tag='album', tag_data='play_count', unique=False),
 		# Sums the total time listened to per album
-		TagTracker(tag='album', tag_data=lambda t: t.get('play_count') * t.get('total_time'), unique=False),
+		TagTracker(tag='album', tag_data=('play_count', 'total_time'), unique=False),
 
 		TagTracker(tag=lambda t: int(t.get('play_count') - (t.get('play_count') % 100))),
 	])
 
+	summary = mbl.summary
 	print(('{:20}{}\n' * 4 + '{:20}{:.1f}{}\n' * 3 + '{} {}, {} times for a total of {:.1f} hours')
-		  .format('Tracks found:', len(mbl.tracks),
+		  .format('Tracks found:', summary.track_count,
 				  'Artists found:', len(mbl.tagtrackers[2].data),
-				  'File size:', str(round(sum(mbl.tracks).get('size') / (1024 ** 3), 1)) + 'GB',
-				  'Total play count:', sum(mbl.tracks).get('play_count'),
-				  'Average play count:', sum(mbl.tracks).get('play_count') / len(mbl.tracks), '',
-				  'Total time:', sum(mbl.tracks).get('total_time') / 3600000, 'h',
-				  'Total time played:',
-				  sum([track.get('play_count') * track.get('total_time') for track in mbl.tracks]) / 3600000, 'h',
-				  'Most played:', max(mbl.tracks).get('name'), max(mbl.tracks).get('play_count'),
-				  max(mbl.tracks).get('total_time') * max(mbl.tracks).get('play_count') / 3600000))
+				  'File size:', str(round(summary.total_size / (1024 ** 3), 1)) + 'GB',
+				  'Total play count:', summary.total_play_count,
+				  'Average play count:', summary.mean_play_count, '',
+				  'Total time:', summary.total_time / 3600000, 'h',
+				  'Total time played:', summary.total_play_time / 3600000, 'h',
+				  'Most played:', summary.most_played_name, summary.most_played_play_count,
+				  summary.most_played_total_time * summary.most_played_play_count / 3600000))
 
 	# print(mbl.tagtrackers[-1].data)
 
@@ -131,112 +158,126 @@ def show_stats(file_path):
 				counter += 1
 		c += 1
 
-	x_data = numpy.asarray(x_data)
-	y_data = numpy.asarray(y_data)
+	# Groups have different sizes, so one array per group
+	x_data = [numpy.asarray(x) for x in x_data]
+	y_data = [numpy.asarray(y) for y in y_data]
 
 	color = numpy.asarray(
 		[tuple(numpy.random.randint(256, size=3) / 255) for key in total_size_length_by_bitrate.keys()])
 
-	barh_plot(sorted_artists_by_play_count_over_number_of_tracks, 'Average play count per song per artist',
-			  'Play count')
-	barh_plot(sorted_genres_by_play_count, 'Total play count by genre', 'Play count')
-	barh_plot({artist: total_time / 60000 for artist, total_time in
-			   sorted(mbl.tagtrackers[5].data.items(), key=lambda item: item[1], reverse=True)},
-			  'Total time (min) by artist')
-	barh_plot(sorted_artists_by_play_count, 'Play count per artist', 'Play count')
-	barh_plot(sorted_artists_by_play_time, 'Play time per artist', 'Play time (h)')
-	barh_plot(sorted_first_letter_song_name, 'Count of songs starting with letter')
-	barh_plot(sorted_artists_by_play_size, 'Play size per artist', 'Play size (mb)')
-	barh_plot(sorted_year_by_play_count, 'Play count by year', 'Play count')
-	barh_plot(sorted_tracks_by_length, 'Amount of tracks per length interval of 30s')
-	barh_plot(sorted_tracks_play_count_by_length, 'Play count per interval of length of song')
-	barh_plot(sorted_artist_song_first_letter, 'Number of songs that start with the same letter as the artist name')
-	barh_plot(sorted_album_by_play_count, 'Play count per album')
-	barh_plot(sorted_album_by_play_time, 'Play time per album', x_label='Play time (h)')
-	barh_plot(sorted_tracks_by_play_count_interval, 'Number of tracks per play count interval of 100', y_scale='log')
-	barh_plot(sorted_tracks_by_play_count_interval, 'Number of tracks per play count interval of 100')
-
-	scatter_plot(numpy.array(scatter_name_time_length)[..., 0], numpy.array(scatter_name_time_length)[..., 1],
-				 'Length of name vs length of song', x_label='Length of name', y_label='Length of song (s)')
-	scatter_plot(x_data, y_data, 'Length of song vs size of song grouped by bitrate', subsets=True, color=color,
-				 label=groups, x_label='Length of song (s)', y_label='Size of song (mb)')
+	# Every plot as (function, args, kwargs), so they can be shown or rendered to files
+	plot_specs = [
+		(barh_plot, (sorted_artists_by_play_count_over_number_of_tracks, 'Average play count per song per artist', 'Play count'), {}),
+		(barh_plot, (sorted_genres_by_play_count, 'Total play count by genre', 'Play count'), {}),
+		(barh_plot, ({artist: total_time / 60000 for artist, total_time in
+					  sorted(mbl.tagtrackers[5].data.items(), key=lambda item: item[1], reverse=True)}, 'Total time (min) by artist'), {}),
+		(barh_plot, (sorted_artists_by_play_count, 'Play count per artist', 'Play count'), {}),
+		(barh_plot, (sorted_artists_by_play_time, 'Play time per artist', 'Play time (h)'), {}),
+		(barh_plot, (sorted_first_letter_song_name, 'Count of songs starting with letter'), {}),
+		(barh_plot, (sorted_artists_by_play_size, 'Play size per artist', 'Play size (mb)'), {}),
+		(barh_plot, (sorted_year_by_play_count, 'Play count by year', 'Play count'), {}),
+		(barh_plot, (sorted_tracks_by_length, 'Amount of tracks per length interval of 30s'), {}),
+		(barh_plot, (sorted_tracks_play_count_by_length, 'Play count per interval of length of song'), {}),
+		(barh_plot, (sorted_artist_song_first_letter, 'Number of songs that start with the same letter as the artist name'), {}),
+		(barh_plot, (sorted_album_by_play_count, 'Play count per album'), {}),
+		(barh_plot, (sorted_album_by_play_time, 'Play time per album'), {'x_label': 'Play time (h)'}),
+		(barh_plot, (sorted_tracks_by_play_count_interval, 'Number of tracks per play count interval of 100'), {'y_scale': 'log'}),
+		(barh_plot, (sorted_tracks_by_play_count_interval, 'Number of tracks per play count interval of 100'), {}),
+		(scatter_plot, (numpy.array(scatter_name_time_length)[..., 0], numpy.array(scatter_name_time_length)[..., 1], 'Length of name vs length of song'), {'x_label': 'Length of name', 'y_label': 'Length of song (s)'}),
+		(scatter_plot, (x_data, y_data, 'Length of song vs size of song grouped by bitrate'), {'subsets': True, 'color': color, 'label': groups, 'x_label': 'Length of song (s)', 'y_label': 'Size of song (mb)'}),
+	]
+
+	if render_folder:
+		# Render to files without a display, in parallel
+		print('Plots written to', render_plots(plot_specs, render_folder, formats=('png', 'svg')))
+		return
+
+	for function, plot_args, plot_kwargs in plot_specs:
+		function(*plot_args, **plot_kwargs)
 
 	# Show all created plots
 	plt.show()
 
 
 # Shows stats about the difference of play counts between the new library object and the old
-def show_stats_over_time(date=datetime.date.today(), month_diff=1):
-	# Find relevant MBLibraries
-	new_mbl, new_mbl_date = find_closest_mbl(date)
-	old_mbl, old_mbl_date = find_closest_mbl(date - dateutil.relativedelta.relativedelta(months=month_diff))
-	oldest_mbl, oldest_mbl_date = find_closest_mbl(date - dateutil.relativedelta.relativedelta(months=month_diff * 2))
+def show_stats_over_time(date=datetime.date.today(), month_diff=1, backend='snapshots'):
+	import dateutil.relativedelta
+
+	from lastfm.cache import ResponseCache
+	from lastfm.lastfmapi import LastFMAPI, API_ROOT
+	from mbp.aggregates import track_plays
+	from mbp.recommender import Recommender
+
+	# Find relevant MBLibraries, the oldest one is only needed for the number of songs played in the previous period
+	new_mbl, new_mbl_date = find_closest_mbl(date, backend=backend)
+	old_mbl, old_mbl_date = find_closest_mbl(date - dateutil.relativedelta.relativedelta(months=month_diff), backend=backend)
+	oldest_mbl, oldest_mbl_date = find_closest_mbl(date - dateutil.relativedelta.relativedelta(months=month_diff * 2), backend=backend)
+
+	# Plays per artist, album and song are summed from the daily aggregates, or queried from the history database,
+	# instead of subtracting whole libraries
+	def get_totals(period_totals):
+		new = {dimension: period_totals(old_mbl_date, new_mbl_date, dimension) for dimension in ('artist', 'album', 'name')}
+		old = {dimension: period_totals(oldest_mbl_date, old_mbl_date, dimension) for dimension in ('artist', 'album', 'name')}
+		return new, old
+
+	if backend == 'sqlite':
+		from mbp.historydb import HistoryDatabase
+		with HistoryDatabase('mbls/history.db') as database:
+			new_totals, old_totals = get_totals(database.period_totals)
+	else:
+		from mbp.aggregates import DailyAggregates
+		aggregates = DailyAggregates('mbls/')
+		aggregates.backfill()
+		new_totals, old_totals = get_totals(aggregates.window)
 
-	# Subtract the old stats from the new stats to get the stats over time
+	# Subtract the old stats from the new stats to get the tracks played over time
 	subbed_mbl = new_mbl - old_mbl
 
-	# Get the stats from the last overview
-	old_subbed_mbl = old_mbl - oldest_mbl
+	# Every tracker of a tag shares a case map seeded from the totals, so the columns of a ranking and the rankings they
+	# are compared with have the same keys, and the same capitalization is shown on both backends
+	case_maps = {dimension: totals_case_map(new_totals[dimension], old_totals[dimension]) for dimension in ('artist', 'album', 'name')}
 
 	# Track stats
-	new_tracker_artist_play_count = TagTracker('artist', 'play_count', unique=False)
 	new_tracker_artist_song_count = TagTracker('artist')
-	new_tracker_artist_play_time = TagTracker('artist', tag_data=lambda item: item.get('play_count') * item.get('total_time') / 3600000, unique=False)
-	new_tracker_album_play_count = TagTracker('album', 'play_count', unique=False)
-	new_tracker_album_play_time = TagTracker('album', tag_data=lambda item: item.get('play_count') * item.get('total_time') / 3600000, unique=False)
-	new_tracker_song_play_count = TagTracker('name', 'play_count', unique=False)
+	new_tracker_artist_song_count.case_map = case_maps['artist']
 	new_tracker_song_play_count_track = TagTracker(lambda t: t, 'play_count', unique=False)
-	new_tracker_song_play_time = TagTracker('name', tag_data=lambda item: item.get('play_count') * item.get('total_time') / 3600000, unique=False)
-	new_tracker_artist_song_name = TagTracker('artist', tag_data=lambda item: None if item.get('play_count') == 0 else 1, unique=False)
 	new_tag_mbl = MBLibrary(tracks=subbed_mbl.tracks, tagtrackers=[
-		new_tracker_artist_play_count,
 		new_tracker_artist_song_count,
-		new_tracker_artist_play_time,
-		new_tracker_album_play_count,
-		new_tracker_album_play_time,
-		new_tracker_song_play_count,
-		new_tracker_song_play_count_track,
-		new_tracker_song_play_time,
-		new_tracker_artist_song_name
+		new_tracker_song_play_count_track
 	])
 
-	old_tracker_artist_play_count = TagTracker('artist', 'play_count', unique=False)
-	old_tracker_artist_song_count = TagTracker('artist')
-	old_tracker_artist_play_time = TagTracker('artist', tag_data=lambda item: item.get('play_count') * item.get('total_time') / 3600000, unique=False)
-	old_tracker_album_play_count = TagTracker('album', 'play_count', unique=False)
-	old_tracker_album_play_time = TagTracker('album', tag_data=lambda item: item.get('play_count') * item.get('total_time') / 3600000, unique=False)
-	old_tracker_song_play_count = TagTracker('name', 'play_count', unique=False)
-	old_tag_mbl = MBLibrary(tracks=old_subbed_mbl.tracks, tagtrackers=[
-		old_tracker_artist_play_count,
-		old_tracker_artist_song_count,
-		old_tracker_artist_play_time,
-		old_tracker_album_play_count,
-		old_tracker_album_play_time,
-		old_tracker_song_play_count
-	])
+	new_tracker_artist_play_count = totals_tracker(new_totals['artist'], 'artist', case_map=case_maps['artist'])
+	new_tracker_artist_play_time = totals_tracker(new_totals['artist'], 'artist', play_time=True, case_map=case_maps['artist'])
+	new_tracker_album_play_count = totals_tracker(new_totals['album'], 'album', case_map=case_maps['album'])
+	new_tracker_album_play_time = totals_tracker(new_totals['album'], 'album', play_time=True, case_map=case_maps['album'])
+	new_tracker_song_play_count = totals_tracker(new_totals['name'], 'name', case_map=case_maps['name'])
+	new_tracker_song_play_time = totals_tracker(new_totals['name'], 'name', play_time=True, case_map=case_maps['name'])
+
+	old_tracker_artist_play_count = totals_tracker(old_totals['artist'], 'artist', case_map=case_maps['artist'])
+	old_tracker_album_play_count = totals_tracker(old_totals['album'], 'album', case_map=case_maps['album'])
+	old_tracker_song_play_count = totals_tracker(old_totals['name'], 'name', case_map=case_maps['name'])
+
+	# The plays of the days are counted under the tags of every day, the songs under the tags at the end of the period,
+	# an artist whose songs were all renamed to another artist has plays but no songs
+	for key in new_tracker_artist_play_count.data:
+		new_tracker_artist_song_count.data.setdefault(key, 0)
 
 	# Create Artist ranking
-	artist_ranking = Ranking(new_tracker_artist_play_count, '{:>5}', diff_ranking=Ranking(old_tracker_artist_play_count, '{:>5}'), col_titles=[ColumnTitle('Artist'), ColumnTitle('Plays', '{:>5}')])
+	artist_ranking = Ranking(new_tracker_artist_play_count, '{:>5}', diff_ranking=Ranking(old_tracker_artist_play_count, '{:>5}', top=10), col_titles=[ColumnTitle('Artist'), ColumnTitle('Plays', '{:>5}')], top=10)
 	artist_ranking.add_tagtracker(new_tracker_artist_play_count - old_tracker_artist_play_count, ['({:+d})', '{:>7}'], col_title=ColumnTitle('', '{:6}'))
 	artist_ranking.add_tagtracker(new_tracker_artist_play_time, '{:>8.1f}h', col_title=ColumnTitle('Time', '{:>10}'))
 	artist_ranking.add_tagtracker(new_tracker_artist_song_count, '{:>7}', col_title=ColumnTitle('Songs', '{:>7}'))
 
 	# Create Album ranking
-	album_ranking = Ranking(new_tracker_album_play_count, '{:>5}', diff_ranking=Ranking(old_tracker_album_play_count, '{:>5}'), col_titles=[ColumnTitle('Album'), ColumnTitle('Plays')])
+	album_ranking = Ranking(new_tracker_album_play_count, '{:>5}', diff_ranking=Ranking(old_tracker_album_play_count, '{:>5}', top=10), col_titles=[ColumnTitle('Album'), ColumnTitle('Plays')], top=10)
 	album_ranking.add_tagtracker(new_tracker_album_play_count - old_tracker_album_play_count, ['({:+d})', '{:>7}'], col_title=ColumnTitle('', '{:6}'))
 	album_ranking.add_tagtracker(new_tracker_album_play_time, '{:>8.1f}h', col_title=ColumnTitle('Time', '{:>10}'))
 
 	# Create Song ranking
-	song_ranking = Ranking(new_tracker_song_play_count, '{:>5}', diff_ranking=Ranking(old_tracker_song_play_count, '{:>5}'), col_titles=[ColumnTitle('Song'), ColumnTitle('Plays')])
+	song_ranking = Ranking(new_tracker_song_play_count, '{:>5}', diff_ranking=Ranking(old_tracker_song_play_count, '{:>5}', top=10), col_titles=[ColumnTitle('Song'), ColumnTitle('Plays')], top=10)
 	song_ranking.add_tagtracker(new_tracker_song_play_count - old_tracker_song_play_count, ['({:+d})', '{:>7}'], col_title=ColumnTitle('', '{:6}'))
 	song_ranking.add_tagtracker(new_tracker_song_play_time, '{:>8.1f}h', col_title=ColumnTitle('Time', '{:>10}'))
 
-	# Create recommendations
-	api_settings = Config('lastfmapi.mbc')
-	api = LastFMAPI(key=api_settings.get_setting('api_key')[0])
-	ranking_t = Ranking(new_tracker_song_play_count_track, '{:>5}')
-	recommender = Recommender(ranking_t, api, based_on=15, amount=10)
-
 	# Print all the stuff
 	print('Over the last {} days you have added {} new songs and you listened to:'.format((new_mbl_date - old_mbl_date).days, len(new_mbl.tracks) - len(old_mbl.tracks)))
 
@@ -253,26 +294,39 @@ def show_stats_over_time(date=datetime.date.today(), month_diff=1):
 	print(album_ranking.get_string(count=10))
 
 	# Print top 5 most listened to songs
+	# Played tracks are counted, so different songs with the same name count as different songs
 	new_song_count = sum([1 for t in new_tag_mbl.tracks if t.get('play_count') > 0])
-	old_song_count = sum([1 for t in old_tag_mbl.tracks if t.get('play_count') > 0])
+	old_song_count = int((track_plays(oldest_mbl.columns, old_mbl.columns) > 0).sum())
 	print('{} ({:+d}) songs:'.format(new_song_count, new_song_count - old_song_count))
 	print(song_ranking.get_string(count=10))
 
 	# Print top 10 risers
 	print('Biggest increases:')
-	print(Ranking(new_tracker_song_play_count - old_tracker_song_play_count, '{:+5d}', col_titles=[ColumnTitle('Song'), ColumnTitle('Increase')]).get_string())
+	print(Ranking(new_tracker_song_play_count - old_tracker_song_play_count, '{:+5d}', col_titles=[ColumnTitle('Song'), ColumnTitle('Increase')], top=10).get_string())
 
 	# Print top 10 fallers
 	print('Biggest decreases:')
-	print(Ranking(new_tracker_song_play_count - old_tracker_song_play_count, '{:+5d}', col_titles=[ColumnTitle('Song'), ColumnTitle('Decrease')], reverse=False).get_string())
+	print(Ranking(new_tracker_song_play_count - old_tracker_song_play_count, '{:+5d}', col_titles=[ColumnTitle('Song'), ColumnTitle('Decrease')], reverse=False, top=10).get_string())
 
-	# TODO: populate fake tagtrackers and use ranking
-	# Print recommendations
-	print('Based on the songs you have listened to most this month, you might also like:')
-	format_string = '{:<16.16} {:<24.24} {:<4}'
-	print(format_string.format('Artist', 'Song', 'Match'))
-	for r in recommender.get_recommendations():
-		print(format_string.format(r[0].get('artist'), r[0].get('name'), f'{r[2] * 100:.1f}%'))
+	# Create recommendations
+	api_settings = Config('lastfmapi.mbc')
+	# Responses are cached on disk, with offline=1 in lastfmapi.mbc only cached responses are used
+	# api_root in lastfmapi.mbc points to another server, e.g. a lastfm.standin
+	offline = api_settings.get_setting('offline')
+	api_root = api_settings.get_setting('api_root')
+	with ResponseCache('lastfmcache.db') as cache:
+		api = LastFMAPI(key=api_settings.get_setting('api_key')[0], cache=cache, offline=bool(offline and offline[0]),
+						api_root=api_root[0] if api_root else API_ROOT)
+		ranking_t = Ranking(new_tracker_song_play_count_track, '{:>5}', top=15)
+		recommender = Recommender(ranking_t, api, based_on=15, amount=10, library=new_mbl)
+
+		# TODO: populate fake tagtrackers and use ranking
+		# Print recommendations
+		print('Based on the songs you have listened to most this month, you might also like:')
+		format_string = '{:<16.16} {:<24.24} {:<4}'
+		print(format_string.format('Artist', 'Song', 'Match'))
+		for r in recommender.get_recommendations():
+			print(format_string.format(r[0].get('artist'), r[0].get('name'), f'{r[2] * 100:.1f}%'))
 
 	print()
 
@@ -280,8 +334,7 @@ def show_stats_over_time(date=datetime.date.today(), month_diff=1):
 	print('All combined this makes for:\n'
 		  ' {} total play count\n'
 		  ' {:.1f}h total hours listened'
-		  .format(str(sum(new_tag_mbl.tracks).get('play_count')),
-				  sum([track.get('play_count') * track.get('total_time') for track in new_tag_mbl.tracks]) / 3600000))
+		  .format(str(new_tag_mbl.summary.total_play_count), new_tag_mbl.summary.total_play_time / 3600000))
 
 	# TODO: fix this
 	# pg = PeriodGrapher(date, date - dateutil.relativedelta.relativedelta(months=month_diff))
@@ -294,7 +347,7 @@ def show_stats_over_time(date=datetime.date.today(), month_diff=1):
 
 def main(args, today=datetime.date.today(), save=True):
 	if len(args) < 2:
-		print('Use this program as follows: python main.py PATH_TO_FILE [-saveOnly]')
+		print('Use this program as follows: python main.py PATH_TO_FILE [-saveOnly | -render FOLDER]')
 		sys.exit()
 
 	# Load or create config
@@ -306,21 +359,29 @@ def main(args, today=datetime.date.today(), save=True):
 	if not config.get_setting('month'):
 		config.set_setting('month', 1)
 
+	# Libraries are saved as snapshot files, or with backend=sqlite in config.mbc in mbls/history.db
+	backend = config.get_setting('backend')
+	backend = backend[0] if backend else 'snapshots'
+
 	file_path = sys.argv[1]
 
 	if len(args) > 1 and '-saveOnly' in args:
 		# User only wants to save the stats, not show any graphs and shit
-		new_mbl = read_library_xml(file_path)
-
+		# The export is only read if it changed since the last time, and then only the tracks that changed are decoded
 		if save:
-			save_library(new_mbl)
+			result, reused, decoded = save_library_file(file_path, backend=backend)
+			if result == 'saved':
+				print('Saved the library: {} tracks reused, {} tracks read from the library file'.format(reused, decoded))
 
 		# Check for first of the month or new year for stats
 		if today.day == config.get_setting('month')[0]:
-			show_stats_over_time(date=today)
+			show_stats_over_time(date=today, backend=backend)
 		if today.day == config.get_setting('year')[0] and today.month == config.get_setting('year')[1]:
 			# Print yearly stats
-			show_stats_over_time(date=today, month_diff=12)
+			show_stats_over_time(date=today, month_diff=12, backend=backend)
+	elif '-render' in args and args.index('-render') + 1 < len(args):
+		# User wants the interesting stuff as files, e.g. on a machine without a display
+		show_stats(file_path, render_folder=args[args.index('-render') + 1])
 	else:
 		# User wants to see some interesting stuff
 		show_stats(file_path)
@@ -0,0 +1,330 @@
+import datetime
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from mbp.snapshotstore import DELTA_EXTENSION, SnapshotStore, date_stamp, parse_stamp
+
+# Tags the plays of a day are split over
+DIMENSIONS = ('artist', 'album', 'genre', 'name')
+
+AGGREGATES_VERSION = 4
+
+
+def track_plays(previous, columns):
+	"""
+	Returns the plays of every track of columns since the library previous, as an array in the order of columns.
+	Tracks that were in the previous library only count their new plays, new tracks count all their plays. Tracks are
+	matched like LibraryDiff does, so renamed and moved tracks are not new.
+	:param previous: ColumnarLibrary of the library before, or None to count all plays of columns
+	:param columns: ColumnarLibrary of the library after
+	"""
+	import numpy as np
+
+	plays = np.asarray(columns.get('play_count')).copy()
+	if previous is not None:
+		prev_rows, rows_in_both = previous.match_tracks(columns)
+		plays[rows_in_both] -= np.asarray(previous.get('play_count'))[prev_rows]
+	return plays
+
+
+def day_aggregates(previous, columns, dimensions=DIMENSIONS):
+	"""
+	Returns the plays and play time between two libraries per value of every dimension, as a JSON compatible dict of
+	dimension to {value: [plays, play time in ms]}. Values without plays are left out.
+	:param previous: ColumnarLibrary of the library before, or None to count all plays of columns
+	:param columns: ColumnarLibrary of the library after
+	:param dimensions: categorical tags to split the plays over
+	"""
+	import numpy as np
+
+	plays = track_plays(previous, columns)
+	play_time = plays * np.asarray(columns.get('total_time'))
+
+	result = {}
+	for dimension in dimensions:
+		codes = np.asarray(columns.get(dimension))
+		valid = codes >= 0
+		size = len(columns.categories[dimension])
+		plays_sums = np.zeros(size, dtype=np.int64)
+		time_sums = np.zeros(size, dtype=np.int64)
+		np.add.at(plays_sums, codes[valid], plays[valid])
+		np.add.at(time_sums, codes[valid], play_time[valid])
+
+		keys = columns.categories[dimension]
+		result[dimension] = {keys[i]: [plays_sums[i].item(), time_sums[i].item()] for i in np.flatnonzero(plays_sums | time_sums)}
+	return result
+
+
+def aggregate_range(folder, base, dates):
+	"""
+	Computes the day_aggregates of consecutive saved libraries. Runs in a worker process, every library is read once.
+	:param folder: folder of the SnapshotStore
+	:param base: datetime.date of the library before dates[0], or None if dates[0] is the first library
+	:param dates: sorted list of datetime.dates with a saved library
+	:return: list of (date stamp, base date stamp or None, aggregates)
+	"""
+	store = SnapshotStore(folder)
+	previous = store.load_columns(base) if base else None
+
+	results = []
+	for date in dates:
+		columns = store.load_columns(date)
+		results.append((date_stamp(date), date_stamp(base) if base else None, day_aggregates(previous, columns)))
+		previous = columns
+		base = date
+	return results
+
+
+class DailyAggregates:
+	"""
+	DailyAggregates holds the plays and play time of every day with a saved library, per artist, album, genre and song
+	name, counted since the library saved before it. They are cached in the folder of the libraries together with the
+	modification time and size of the files they were computed from, so only days that were saved or rewritten since
+	the last run have to be computed. save_library adds the day of every library it saves, the days saved before are
+	computed by backfill.
+	The cache has a line for every day, new days are appended to it, a later line of a day replaces an earlier one. A
+	line that can not be decoded, e.g. one whose append was interrupted, is skipped, so its day is computed again.
+
+	aggregates = DailyAggregates('mbls/')
+	aggregates.backfill()
+	keys, matrix = aggregates.get_matrix('artist', start, end)
+	totals = aggregates.window(start, end, 'artist')
+
+	backfill reads the libraries in worker processes, each worker takes a run of consecutive days so it reads every
+	library once.
+	"""
+
+	FILE_NAME = 'aggregates.jsonl'
+
+	def __init__(self, folder='mbls/', read=True):
+		"""
+		:param folder: folder the libraries are saved in, see SnapshotStore
+		:param read: False to not read the cache, e.g. to only append a day with add_unchanged
+		"""
+		self.folder = folder
+		self.path = os.path.join(folder, self.FILE_NAME)
+		# Date stamp to {'base': date stamp or None, 'sources': files it was computed from, dimension: {value: [plays, play time]}}
+		self.days = {}
+		# Whether the cache file is of another version or has a broken line, and has to be rewritten instead of appended to
+		self.outdated = False
+		if read:
+			self.read()
+
+	def read(self):
+		"""Reads the cache, a cache of another version is ignored and lines that can not be decoded are skipped."""
+		if not os.path.exists(self.path):
+			return
+		with open(self.path, 'r', encoding='utf-8') as cache_file:
+			try:
+				version = json.loads(cache_file.readline() or '{}').get('version')
+			except ValueError:
+				version = None
+			if version != AGGREGATES_VERSION:
+				self.outdated = True
+				return
+			for line in cache_file:
+				try:
+					stamp, day = json.loads(line)
+				except ValueError:
+					self.outdated = True
+					continue
+				self.days[stamp] = day
+
+	def save(self):
+		"""Rewrites the cache with only the current line of every day."""
+		with open(self.path, 'w', encoding='utf-8') as cache_file:
+			cache_file.write(json.dumps({'version': AGGREGATES_VERSION}) + '\n')
+			for stamp in sorted(self.days):
+				cache_file.write(json.dumps([stamp, self.days[stamp]]) + '\n')
+		self.outdated = False
+
+	def append(self, stamps):
+		"""Appends the lines of the days of stamps to the cache."""
+		exists = os.path.exists(self.path)
+		# A line cut off by an interrupted append is ended first, so it does not break the line appended after it
+		if exists and os.path.getsize(self.path):
+			with open(self.path, 'rb') as cache_file:
+				cache_file.seek(-1, os.SEEK_END)
+				broken = cache_file.read(1) != b'\n'
+		else:
+			broken = False
+		with open(self.path, 'a', encoding='utf-8') as cache_file:
+			if broken:
+				cache_file.write('\n')
+			if not exists:
+				cache_file.write(json.dumps({'version': AGGREGATES_VERSION}) + '\n')
+			for stamp in stamps:
+				cache_file.write(json.dumps([stamp, self.days[stamp]]) + '\n')
+
+	def get_dates(self):
+		"""Returns the sorted list of dates that have aggregates."""
+		return sorted(parse_stamp(stamp) for stamp in self.days)
+
+	@staticmethod
+	def get_sources(store, date):
+		"""Returns the [name, modification time, size] of the files the library of date is read from: its own file and
+		the keyframe it is a delta of."""
+		paths = [store.find_path(date)]
+		if paths[0].endswith(DELTA_EXTENSION):
+			paths.append(store.find_keyframe(date))
+
+		sources = []
+		for path in paths:
+			stat = os.stat(path)
+			sources.append([os.path.basename(path), stat.st_mtime_ns, stat.st_size])
+		return sources
+
+	def backfill(self, processes=None, store=None):
+		"""
+		Computes the aggregates of every saved library that has none yet, or whose library or previous library was saved
+		again since, in parallel. A single run of days, like the one day save_library adds, is computed in this process.
+		:param processes: number of worker processes, the number of cores if omitted
+		:param store: SnapshotStore of the libraries, the one in folder if omitted
+		:return: list of the dates that were computed
+		"""
+		store = store if store else SnapshotStore(self.folder)
+		dates = store.index.dates
+		bases = [None] + dates[:-1]
+
+		# Days of libraries that were deleted are dropped
+		stamps = {date_stamp(date) for date in dates}
+		removed = [stamp for stamp in self.days if stamp not in stamps]
+		for stamp in removed:
+			del self.days[stamp]
+
+		missing = []
+		sources = {}
+		for date, base in zip(dates, bases):
+			sources[date] = self.get_sources(store, date) + (self.get_sources(store, base) if base else [])
+			day = self.days.get(date_stamp(date))
+			if not day or day['base'] != (date_stamp(base) if base else None) or day['sources'] != sources[date]:
+				missing.append(date)
+		if not missing:
+			if removed or self.outdated:
+				self.save()
+			return []
+
+		# Split the missing days into runs of consecutive libraries, a few per process so the work stays balanced
+		processes = processes if processes else os.cpu_count() or 1
+		positions = {date: i for i, date in enumerate(dates)}
+		run_length = max(1, -(-len(missing) // (processes * 4)))
+		runs = []
+		for date in missing:
+			if runs and len(runs[-1][1]) < run_length and positions[runs[-1][1][-1]] + 1 == positions[date]:
+				runs[-1][1].append(date)
+			else:
+				runs.append((bases[positions[date]], [date]))
+
+		if len(runs) == 1:
+			results = [aggregate_range(store.folder, *runs[0])]
+		else:
+			with ProcessPoolExecutor(max_workers=processes) as executor:
+				results = list(executor.map(aggregate_range, [store.folder] * len(runs), [base for base, _ in runs], [run for _, run in runs]))
+
+		for run in results:
+			for stamp, base, aggregates in run:
+				aggregates['base'] = base
+				aggregates['sources'] = sources[parse_stamp(stamp)]
+				self.days[stamp] = aggregates
+
+		if removed or self.outdated:
+			self.save()
+		else:
+			self.append([date_stamp(date) for date in missing])
+		return missing
+
+	def add_day(self, store, date, columns, previous=None):
+		"""
+		Adds the day of a library that was just saved, counted against the library saved before it. The cache is not
+		read, the day is appended to it, and only the previous library is read if it is not passed. Days saved before
+		that have no aggregates yet are left to backfill.
+		:param store: SnapshotStore the library was saved in
+		:param date: datetime.date of the library
+		:param columns: ColumnarLibrary of the library
+		:param previous: ColumnarLibrary of the library saved before it, if it was read already
+		"""
+		base = store.index.closest(date - datetime.timedelta(days=1))
+		base = base[0] if base else None
+		if previous is None and base:
+			previous = store.load_columns(base)
+
+		self.add(store, date, base, day_aggregates(previous if base else None, columns))
+
+	def add_unchanged(self, store, date):
+		"""Adds a day saved with SnapshotStore.save_unchanged, it has no plays. No library and not even the cache is read,
+		the day is appended to the cache."""
+		base = store.index.closest(date - datetime.timedelta(days=1))[0]
+		self.add(store, date, base, {dimension: {} for dimension in DIMENSIONS})
+
+	def add(self, store, date, base, day):
+		"""Appends the aggregates of the day of date, counted against the library of base, to the cache."""
+		day['base'] = date_stamp(base) if base else None
+		day['sources'] = self.get_sources(store, date) + (self.get_sources(store, base) if base else [])
+		self.days[date_stamp(date)] = day
+		self.append([date_stamp(date)])
+
+	def get_matrix(self, dimension, start, end, value=0):
+		"""
+		Returns the aggregates of dimension between start and end as a time series. Differently capitalized values share
+		a column, like TagTracker counts them together, under the first capitalization that is seen. The first saved
+		library has no library to count its plays against, its day is left out.
+		:param dimension: one of DIMENSIONS
+		:param start: datetime.date first day
+		:param end: datetime.date last day, inclusive
+		:param value: 0 for plays, 1 for play time in ms
+		:return: list of the values of dimension and a matrix with a row for every day and a column for every value
+		"""
+		import numpy as np
+
+		# Lower case value to its column, and the capitalization of every column
+		key_columns = {}
+		keys = []
+		rows = []
+		for date in self.get_dates():
+			day = self.days[date_stamp(date)]
+			if start <= date <= end and day['base'] is not None:
+				columns = []
+				for key in day[dimension]:
+					if key.lower() not in key_columns:
+						key_columns[key.lower()] = len(keys)
+						keys.append(key)
+					columns.append(key_columns[key.lower()])
+				rows.append(((date - start).days, columns, [v[value] for v in day[dimension].values()]))
+
+		matrix = np.zeros(((end - start).days + 1, len(keys)), dtype=np.int64)
+		for day, columns, values in rows:
+			np.add.at(matrix[day], columns, values)
+		return keys, matrix
+
+	def window(self, start, end, dimension):
+		"""
+		Sums the aggregates of dimension over the days after start up to and including end, which are the plays between
+		the library of start and the library of end. Returns the same as HistoryDatabase.period_totals.
+		:param start: datetime.date, usually a day with a saved library
+		:param end: datetime.date last day, inclusive
+		:param dimension: one of DIMENSIONS
+		:return: dict of value of dimension to (plays, play time in ms), without values that have no plays, in sorted
+			order of value
+		"""
+		totals = {}
+		for stamp, day in self.days.items():
+			if start < parse_stamp(stamp) <= end:
+				for key, (plays, play_time) in day[dimension].items():
+					total = totals.get(key, (0, 0))
+					totals[key] = (total[0] + plays, total[1] + play_time)
+		# The days are in the order they were computed in, sorting makes the order of ties independent of it
+		return {key: totals[key] for key in sorted(totals) if totals[key] != (0, 0)}
+
+
+if __name__ == '__main__':
+	# python -m mbp.aggregates [FOLDER] [PROCESSES] computes the daily aggregates of the libraries saved in FOLDER
+	folder = sys.argv[1] if len(sys.argv) > 1 else 'mbls/'
+	processes = int(sys.argv[2]) if len(sys.argv) > 2 else None
+
+	start = time.perf_counter()
+	dates = DailyAggregates(folder).backfill(processes=processes)
+	elapsed = time.perf_counter() - start
+	print('Computed {} days in {:.2f} s, {:.1f} snapshots/s'.format(len(dates), elapsed, len(dates) / elapsed if dates else 0))
@@ -0,0 +1,319 @@
+import datetime
+import json
+import re
+
+import numpy as np
+
+from mbp import plist
+from mbp.track import Track, TAG_NAMES
+
+# Tags stored as int64 arrays, with the default value Track uses when the tag is missing
+NUMERIC = {'track_id': -1, 'year': 0, 'size': 0, 'total_time': 0, 'play_count': 0, 'bitrate': 0}
+# Tags stored as datetime64 arrays, missing dates are NaT
+DATES = ('date_added', 'play_date')
+# Tags stored as integer codes into a list of distinct strings, missing strings have code -1
+CATEGORICAL = ('name', 'artist', 'album', 'genre', 'location')
+
+DATE_DTYPE = 'datetime64[s]'
+
+# Tags a track is matched on between two libraries, and the tags of its identity (see Track.identity)
+MATCH_TAGS = ('location', 'name', 'artist', 'album', 'size')
+IDENTITY_TAGS = ('name', 'artist', 'album', 'size')
+
+_HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+_HASH_SHIFT = np.uint64(32)
+
+
+def _to_year(year):
+	"""Converts a year the same way Track does: strings are searched for the first 4 consecutive digits."""
+	if isinstance(year, str):
+		match = re.search('[0-9]{4}', year)
+		return int(match.group()) if match else 0
+	return int(year)
+
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_SECOND = datetime.timedelta(seconds=1)
+_NAT = np.iinfo(np.int64).min
+
+
+def _date_array(dates):
+	"""Converts a list of datetimes, plist date strings and Nones to a datetime64 array, None becomes NaT."""
+	seconds = []
+	for date in dates:
+		if date is None:
+			seconds.append(_NAT)
+		else:
+			if isinstance(date, str):
+				date = plist.decode_date(date)
+			# Much faster than letting numpy convert the datetime objects
+			seconds.append((date - _EPOCH) // _SECOND)
+	return np.array(seconds, dtype=np.int64).view(DATE_DTYPE)
+
+
+def _mix(hashes):
+	"""Scrambles 64 bit hashes, the shift after the multiplication keeps small codes like -2 and 2 from colliding."""
+	hashes = hashes * _HASH_MULTIPLIER
+	return hashes ^ (hashes >> _HASH_SHIFT)
+
+
+def _lookup(hashes, other_hashes):
+	"""Looks up every hash of other_hashes in hashes, the first one wins for duplicates. Returns the index arrays (rows,
+	other_rows) of the hashes that were found."""
+	order = np.argsort(hashes, kind='stable')
+	positions = np.minimum(np.searchsorted(hashes[order], other_hashes), max(len(hashes) - 1, 0))
+	found = hashes[order][positions] == other_hashes if len(hashes) else np.zeros(len(other_hashes), dtype=bool)
+
+	other_rows = np.flatnonzero(found)
+	return order[positions[other_rows]], other_rows
+
+
+class ColumnarLibrary:
+	"""
+	ColumnarLibrary stores a library as one NumPy array per tag instead of a list of Tracks.
+	Strings (names, artists, albums, genres and locations) are dictionary encoded: the column holds integer codes into
+	a list of the distinct strings, in order of first appearance.
+
+	Aggregations over the whole library are vectorized:
+	cl.total('play_count')
+	cl.group_sum('artist', 'play_count', 'total_time')
+	"""
+
+	def __init__(self, columns, categories):
+		"""
+		:param columns: dict of tag name to NumPy array, every array has the same length
+		:param categories: dict of categorical tag name to the list of strings its codes refer to
+		"""
+		self.columns = columns
+		self.categories = categories
+
+	@classmethod
+	def from_records(cls, records):
+		"""Creates a ColumnarLibrary from an iterable of dicts of tag name to value, as read from the XML or an .mbl."""
+		values = {tag: [] for tag in TAG_NAMES}
+		lookups = {tag: {} for tag in CATEGORICAL}
+
+		for record in records:
+			for tag, default in NUMERIC.items():
+				value = record.get(tag)
+				values[tag].append(default if value is None else value)
+			for tag in DATES:
+				values[tag].append(record.get(tag))
+			for tag in CATEGORICAL:
+				value = record.get(tag)
+				if value is None:
+					values[tag].append(-1)
+				else:
+					# setdefault hands out the next code to strings we have not seen yet
+					values[tag].append(lookups[tag].setdefault(value, len(lookups[tag])))
+
+		values['year'] = [_to_year(year) for year in values['year']]
+
+		columns = {}
+		for tag in NUMERIC:
+			columns[tag] = np.array(values[tag], dtype=np.int64)
+		for tag in DATES:
+			columns[tag] = _date_array(values[tag])
+		for tag in CATEGORICAL:
+			columns[tag] = np.array(values[tag], dtype=np.int32)
+
+		return cls(columns, {tag: list(lookups[tag]) for tag in CATEGORICAL})
+
+	@classmethod
+	def from_tracks(cls, tracks, tags=None):
+		"""
+		Creates a ColumnarLibrary from a list of Tracks.
+		:param tracks: list of Tracks
+		:param tags: optional list of the tags to create columns for, all tags if omitted
+		"""
+		columns = {}
+		categories = {}
+
+		# Tracks are already converted, so every tag can be read into its column at once
+		for tag in (tags if tags else TAG_NAMES):
+			if tag in NUMERIC:
+				columns[tag] = np.fromiter((getattr(t, tag) for t in tracks), dtype=np.int64, count=len(tracks))
+			elif tag in DATES:
+				columns[tag] = _date_array([getattr(t, tag) for t in tracks])
+			else:
+				lookup = {}
+				columns[tag] = np.array([-1 if v is None else lookup.setdefault(v, len(lookup)) for v in (getattr(t, tag) for t in tracks)], dtype=np.int32)
+				categories[tag] = list(lookup)
+
+		return cls(columns, categories)
+
+	@classmethod
+	def from_xml(cls, file_path):
+		"""Reads an 'iTunes Music Library.xml' file straight into columns, no Tracks are created."""
+		from mbp.musicbeelibrary import iter_track_data
+		return cls.from_records(iter_track_data(file_path))
+
+	@classmethod
+	def from_mbl(cls, file_path):
+		"""Reads an .mbl file straight into columns, no Tracks are created."""
+		with open(file_path, 'r', encoding='utf-8') as mbl_file:
+			return cls.from_records(json.loads(line) for line in mbl_file)
+
+	def __len__(self):
+		return len(next(iter(self.columns.values())))
+
+	def get(self, tag):
+		"""Returns the array of tag. For categorical tags these are the codes, see strings()."""
+		return self.columns[tag]
+
+	def strings(self, tag):
+		"""Returns the values of a categorical tag as an array of strings, None where the tag is missing."""
+		lookup = np.array(self.categories[tag] + [None], dtype=object)
+		# Code -1 indexes the None appended at the end
+		return lookup[self.columns[tag]]
+
+	def keys(self):
+		"""
+		Returns a key for every track that is unique within this library: a tuple of location, name, artist, album and
+		size, followed by how many tracks before it had the same tuple.
+		"""
+		seen = {}
+		keys = []
+		for key in zip(*(self.strings(tag).tolist() for tag in ('location', 'name', 'artist', 'album')), self.columns['size'].tolist()):
+			occurrence = seen.get(key, 0)
+			seen[key] = occurrence + 1
+			keys.append(key + (occurrence,))
+		return keys
+
+	def hashes(self, other, tags):
+		"""
+		Combines tags into one 64 bit hash per track, for this library and other, with the strings of other recoded into
+		the codes of this library so equal tags give equal hashes. Collisions are astronomically unlikely.
+		:return: hash arrays (hashes, other_hashes)
+		"""
+		hashes = np.zeros(len(self), dtype=np.uint64)
+		other_hashes = np.zeros(len(other), dtype=np.uint64)
+
+		for tag in tags:
+			codes = np.asarray(self.columns[tag])
+			other_codes = np.asarray(other.columns[tag])
+			if tag in CATEGORICAL and other.categories[tag] is not self.categories[tag]:
+				# Recode the strings of other into the codes of this library, strings this library lacks get -2
+				lookup = {string: code for code, string in enumerate(self.categories[tag])}
+				recode = np.array([lookup.get(string, -2) for string in other.categories[tag]] + [-1], dtype=np.int64)
+				other_codes = recode[other_codes]
+
+			hashes = _mix(hashes ^ codes.astype(np.uint64))
+			other_hashes = _mix(other_hashes ^ other_codes.astype(np.uint64))
+		return hashes, other_hashes
+
+	def match(self, other):
+		"""
+		Finds the tracks of other in this library, matched on location, name, artist, album and size.
+		:param other: ColumnarLibrary
+		:return: index arrays (rows, other_rows), track rows[i] of this library is track other_rows[i] of other
+		"""
+		return _lookup(*self.hashes(other, MATCH_TAGS))
+
+	def match_tracks(self, other):
+		"""
+		Finds the tracks of other in this library like LibraryDiff joins them: on location, name, artist, album and size
+		first, then the tracks left over on both sides on location (or track_id if they have no location), and the ones
+		left after that on name, artist, album and size. Renamed, re-tagged and moved tracks are still found.
+		:param other: ColumnarLibrary
+		:return: index arrays (rows, other_rows), see match
+		"""
+		rows, other_rows = self.match(other)
+		left = np.ones(len(self), dtype=bool)
+		left[rows] = False
+		other_left = np.ones(len(other), dtype=bool)
+		other_left[other_rows] = False
+
+		has_location = np.asarray(self.columns['location']) >= 0
+		other_has_location = np.asarray(other.columns['location']) >= 0
+		has_id = ~has_location & (np.asarray(self.columns['track_id']) >= 0)
+		other_has_id = ~other_has_location & (np.asarray(other.columns['track_id']) >= 0)
+		steps = ((('location',), has_location, other_has_location), (('track_id',), has_id, other_has_id), (IDENTITY_TAGS, True, True))
+
+		found = [(rows, other_rows)]
+		for tags, can_match, other_can_match in steps:
+			# Usually every track matched exactly, or tracks were only added or only removed
+			if not left.any() or not other_left.any():
+				break
+
+			hashes, other_hashes = self.hashes(other, tags)
+			candidates = np.flatnonzero(left & can_match)
+			other_candidates = np.flatnonzero(other_left & other_can_match)
+			rows, other_rows = _lookup(hashes[candidates], other_hashes[other_candidates])
+			rows, other_rows = candidates[rows], other_candidates[other_rows]
+			left[rows] = False
+			other_left[other_rows] = False
+			found.append((rows, other_rows))
+
+		return np.concatenate([rows for rows, _ in found]), np.concatenate([other_rows for _, other_rows in found])
+
+	def take(self, indices):
+		"""Returns a new ColumnarLibrary with only the tracks at indices (an index array or boolean mask)."""
+		return ColumnarLibrary({tag: np.asarray(array)[indices] for tag, array in self.columns.items()}, self.categories)
+
+	def concat(self, other):
+		"""Returns a new ColumnarLibrary with the tracks of other appended to the tracks of this library."""
+		columns = {}
+		categories = {}
+		for tag, array in self.columns.items():
+			if tag in CATEGORICAL:
+				# Recode the strings of other into the strings of this library, adding the ones it does not have
+				lookup = {string: code for code, string in enumerate(self.categories[tag])}
+				recode = np.array([lookup.setdefault(string, len(lookup)) for string in other.categories[tag]] + [-1], dtype=array.dtype)
+				columns[tag] = np.concatenate([array, recode[other.columns[tag]]])
+				categories[tag] = list(lookup)
+			else:
+				columns[tag] = np.concatenate([array, other.columns[tag]])
+		return ColumnarLibrary(columns, categories)
+
+	def to_tracks(self):
+		"""Converts the columns back to a list of Tracks."""
+		values = {}
+		for tag in NUMERIC:
+			values[tag] = self.columns[tag].tolist()
+		for tag in DATES:
+			# NaT becomes None, the rest become datetime.datetime
+			values[tag] = self.columns[tag].astype(object).tolist()
+		for tag in CATEGORICAL:
+			values[tag] = self.strings(tag).tolist()
+
+		return [Track(**dict(zip(TAG_NAMES, row))) for row in zip(*(values[tag] for tag in TAG_NAMES))]
+
+	def product(self, *tags):
+		"""Returns the element-wise product of the numeric tags, e.g. product('play_count', 'total_time')."""
+		result = self.columns[tags[0]]
+		for tag in tags[1:]:
+			result = result * self.columns[tag]
+		return result
+
+	def total(self, *tags):
+		"""Returns the sum over all tracks of the (product of the) numeric tags."""
+		return int(self.product(*tags).sum())
+
+	def group_sum(self, key, *tags):
+		"""
+		Sums the (product of the) numeric tags per value of key.
+		:param key: categorical or numeric tag to group by
+		:param tags: numeric tags to sum, multiplied first if there are several, counts tracks if omitted
+		:return: dict of key value to sum
+		"""
+		values = self.product(*tags) if tags else np.ones(len(self), dtype=np.int64)
+
+		if key in CATEGORICAL:
+			codes = self.columns[key]
+			valid = codes >= 0
+			sums = np.zeros(len(self.categories[key]), dtype=values.dtype)
+			np.add.at(sums, codes[valid], values[valid])
+			present = np.bincount(codes[valid], minlength=len(self.categories[key])) > 0
+			return {self.categories[key][i]: sums[i].item() for i in np.flatnonzero(present)}
+
+		uniques, inverse = np.unique(self.columns[key], return_inverse=True)
+		sums = np.zeros(len(uniques), dtype=values.dtype)
+		np.add.at(sums, inverse, values)
+		return dict(zip(uniques.tolist(), sums.tolist()))
+
+	def histogram(self, tag, bin_width):
+		"""Returns a dict of the lower bound of every bin of bin_width to the number of tracks with tag in that bin."""
+		bins = self.columns[tag] - self.columns[tag] % bin_width
+		uniques, counts = np.unique(bins, return_counts=True)
+		return dict(zip(uniques.tolist(), counts.tolist()))
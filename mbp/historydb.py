@@ -0,0 +1,274 @@
+import datetime
+import json
+import os
+import sqlite3
+import sys
+
+from mbp import plist
+from mbp.musicbeelibrary import MBLibrary
+
+# Tags stored in the tracks table, the rest of the tags change with every play and are stored in the plays table
+TRACK_TAGS = ('name', 'artist', 'album', 'genre', 'year', 'size', 'total_time', 'date_added', 'location', 'bitrate')
+PLAY_TAGS = ('track_id', 'play_count', 'play_date')
+
+# Tags period aggregates can be grouped by
+DIMENSIONS = ('name', 'artist', 'album', 'genre', 'year')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tracks (
+	id INTEGER PRIMARY KEY,
+	key TEXT NOT NULL,
+	version TEXT UNIQUE NOT NULL,
+	name TEXT, artist TEXT, album TEXT, genre TEXT, year INTEGER, size INTEGER, total_time INTEGER,
+	date_added TEXT, location TEXT, bitrate INTEGER
+);
+CREATE TABLE IF NOT EXISTS days (date TEXT PRIMARY KEY) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS plays (
+	date TEXT NOT NULL,
+	track INTEGER NOT NULL REFERENCES tracks (id),
+	track_id INTEGER,
+	play_count INTEGER,
+	play_date TEXT,
+	PRIMARY KEY (track, date)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS plays_date ON plays (date, track, play_count);
+CREATE INDEX IF NOT EXISTS tracks_key ON tracks (key, id);
+CREATE INDEX IF NOT EXISTS tracks_artist ON tracks (artist, id, total_time);
+CREATE INDEX IF NOT EXISTS tracks_album ON tracks (album, id, total_time);
+CREATE INDEX IF NOT EXISTS tracks_genre ON tracks (genre, id, total_time);
+'''
+
+# The state of every track on a date: its latest row in plays on or before that date, unless that row marks it removed
+_STATE = '''
+SELECT plays.track, plays.track_id, plays.play_count, plays.play_date FROM plays
+JOIN (SELECT track, MAX(date) AS date FROM plays WHERE date <= :{0} GROUP BY track) AS latest
+ON plays.track = latest.track AND plays.date = latest.date
+WHERE plays.play_count IS NOT NULL
+'''
+
+# Plays between two states, see period_totals. The tracks left over after joining on key are joined on location or
+# track_id first and then on identity, a track on one side only takes the first track it matches on the other side
+_PERIOD_TOTALS = '''
+WITH end_state AS (
+	SELECT tracks.key, tracks.location, state.track_id, tracks.name, tracks.artist, tracks.album, tracks.size,
+		tracks.total_time, tracks.{2} AS value, state.play_count
+	FROM ({0}) AS state JOIN tracks ON tracks.id = state.track
+),
+start_state AS (
+	SELECT tracks.key, tracks.location, state.track_id, tracks.name, tracks.artist, tracks.album, tracks.size, state.play_count
+	FROM ({1}) AS state JOIN tracks ON tracks.id = state.track
+),
+end_left AS (SELECT * FROM end_state WHERE key NOT IN (SELECT key FROM start_state)),
+start_left AS (SELECT * FROM start_state WHERE key NOT IN (SELECT key FROM end_state)),
+by_file AS (
+	SELECT end_left.key, MIN(start_left.key) AS start_key FROM end_left JOIN start_left
+	ON start_left.location = end_left.location
+		OR (start_left.location IS NULL AND end_left.location IS NULL AND end_left.track_id >= 0 AND start_left.track_id = end_left.track_id)
+	GROUP BY end_left.key
+),
+by_identity AS (
+	SELECT end_left.key, MIN(start_left.key) AS start_key FROM end_left JOIN start_left
+	ON start_left.name IS end_left.name AND start_left.artist IS end_left.artist AND start_left.album IS end_left.album AND start_left.size IS end_left.size
+	WHERE end_left.key NOT IN (SELECT key FROM by_file) AND start_left.key NOT IN (SELECT start_key FROM by_file)
+	GROUP BY end_left.key
+),
+matched AS (
+	SELECT key, key AS start_key FROM end_state WHERE key NOT IN (SELECT key FROM end_left)
+	UNION ALL SELECT key, start_key FROM by_file
+	UNION ALL SELECT key, start_key FROM by_identity
+)
+SELECT end_state.value, SUM(end_state.play_count - COALESCE(start_state.play_count, 0)),
+	SUM((end_state.play_count - COALESCE(start_state.play_count, 0)) * end_state.total_time)
+FROM end_state LEFT JOIN matched ON matched.key = end_state.key
+LEFT JOIN start_state ON start_state.key = matched.start_key
+{3}
+GROUP BY end_state.value
+HAVING SUM(end_state.play_count - COALESCE(start_state.play_count, 0)) != 0
+	OR SUM((end_state.play_count - COALESCE(start_state.play_count, 0)) * end_state.total_time) != 0
+ORDER BY end_state.value
+'''
+
+
+def _iso(date):
+	return date.isoformat()
+
+
+class HistoryDatabase:
+	"""
+	HistoryDatabase stores the daily libraries in an SQLite database instead of a file per day.
+	Every version of a track is stored once in the tracks table, a track whose tags are edited gets a new row with the
+	same key (see ColumnarLibrary.keys) as long as its location, name, artist, album and size stay the same. The plays
+	table holds a row for a track on every day it was added, its play count, play date or track id changed, or it was
+	removed (play_count NULL), so a day only takes space for the tracks that were played. The library of a day is the
+	latest row of every track on or before that day.
+
+	Libraries have to be added in order of date, a day can not be added before a day that is already stored.
+
+	Play counts and play time over a period are aggregated in SQL:
+	with HistoryDatabase('mbls/history.db') as db:
+		db.period_totals(datetime.date(2020, 3, 1), datetime.date(2020, 3, 31), 'artist')
+	"""
+
+	def __init__(self, file_path='mbls/history.db'):
+		"""
+		:param file_path: path of the SQLite database, created if it does not exist
+		"""
+		folder = os.path.dirname(file_path)
+		if folder and not os.path.exists(folder):
+			os.makedirs(folder)
+
+		self.file_path = file_path
+		self.connection = sqlite3.connect(file_path)
+		self.connection.executescript(_SCHEMA)
+		self.connection.commit()
+
+	def close(self):
+		self.connection.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def get_dates(self):
+		"""Returns the sorted list of dates that have a library."""
+		return [datetime.date.fromisoformat(row[0]) for row in self.connection.execute('SELECT date FROM days ORDER BY date')]
+
+	def closest(self, date, after=False):
+		"""Returns the date with a library closest to date, on or after date if after is True, else on or before."""
+		if after:
+			row = self.connection.execute('SELECT date FROM days WHERE date >= ? ORDER BY date LIMIT 1', (_iso(date),)).fetchone()
+		else:
+			row = self.connection.execute('SELECT date FROM days WHERE date <= ? ORDER BY date DESC LIMIT 1', (_iso(date),)).fetchone()
+		return datetime.date.fromisoformat(row[0]) if row else None
+
+	def has_date(self, date):
+		return self.connection.execute('SELECT 1 FROM days WHERE date = ?', (_iso(date),)).fetchone() is not None
+
+	def get_state(self, date):
+		"""Returns a dict of track id in the database to (track_id, play_count, play_date) of every track on date."""
+		return {row[0]: row[1:] for row in self.connection.execute(_STATE.format('date'), {'date': _iso(date)})}
+
+	def add(self, columns, date):
+		"""
+		Stores a library as the library of date.
+		:param columns: ColumnarLibrary of the library
+		:param date: datetime.date of the library, after the last date in the database
+		"""
+		import numpy as np
+
+		last = self.closest(datetime.date.max)
+		if last and date <= last:
+			raise ValueError(f'Can not add {date}, the database already has libraries up to {last}')
+
+		track_ids = self.store_tracks(columns)
+		previous = self.get_state(last) if last else {}
+
+		values = {tag: np.asarray(columns.get(tag)).tolist() for tag in ('track_id', 'play_count')}
+		values['play_date'] = [plist.encode_date(d) if d else None for d in columns.get('play_date').astype(object).tolist()]
+
+		rows = []
+		for i, track in enumerate(track_ids):
+			state = (values['track_id'][i], values['play_count'][i], values['play_date'][i])
+			if previous.pop(track, None) != state:
+				rows.append((_iso(date), track) + state)
+		# Tracks that are left were removed
+		rows += [(_iso(date), track, None, None, None) for track in previous]
+
+		self.connection.executemany('INSERT OR REPLACE INTO plays VALUES (?, ?, ?, ?, ?)', rows)
+		self.connection.execute('INSERT INTO days VALUES (?)', (_iso(date),))
+		self.connection.commit()
+
+	def add_unchanged(self, date):
+		"""Stores the library of the last date in the database again as the library of date, which only adds the day."""
+		last = self.closest(datetime.date.max)
+		if not last or date <= last:
+			raise ValueError(f'Can not add {date} unchanged, the last library in the database is {last}')
+
+		self.connection.execute('INSERT INTO days VALUES (?)', (_iso(date),))
+		self.connection.commit()
+
+	def store_tracks(self, columns):
+		"""Adds the tracks of columns that are not in the tracks table yet. Returns the id in the tracks table of every
+		track."""
+		import numpy as np
+
+		from mbp.columnar import DATES
+
+		values = {}
+		for tag in TRACK_TAGS:
+			if tag in DATES:
+				values[tag] = [plist.encode_date(d) if d else None for d in columns.get(tag).astype(object).tolist()]
+			elif tag in columns.categories:
+				values[tag] = columns.strings(tag).tolist()
+			else:
+				values[tag] = np.asarray(columns.get(tag)).tolist()
+
+		# A version is the key plus every stored tag, so a track only gets a new row when one of its tags changed
+		rows = []
+		for key, row in zip(columns.keys(), zip(*(values[tag] for tag in TRACK_TAGS))):
+			rows.append((json.dumps(key), json.dumps([key[-1], row])) + row)
+		self.connection.executemany('INSERT OR IGNORE INTO tracks (key, version, {0}) VALUES (?, ?, {1})'.format(
+			', '.join(TRACK_TAGS), ', '.join('?' * len(TRACK_TAGS))), rows)
+
+		# Only the versions of columns are looked up, on the unique index of version, instead of reading the whole table
+		self.connection.execute('CREATE TEMP TABLE IF NOT EXISTS incoming (position INTEGER PRIMARY KEY, version TEXT NOT NULL)')
+		self.connection.execute('DELETE FROM incoming')
+		self.connection.executemany('INSERT INTO incoming VALUES (?, ?)', ((i, row[1]) for i, row in enumerate(rows)))
+		ids = [row[0] for row in self.connection.execute('SELECT tracks.id FROM incoming JOIN tracks ON tracks.version = incoming.version ORDER BY incoming.position')]
+		self.connection.execute('DELETE FROM incoming')
+		return ids
+
+	def load_columns(self, date):
+		"""Returns the ColumnarLibrary of the library of date, raises a ValueError if there is none."""
+		from mbp.columnar import ColumnarLibrary
+
+		if not self.has_date(date):
+			raise ValueError(f'No library for {date} in {self.file_path}')
+
+		query = 'SELECT {0}, state.track_id, state.play_count, state.play_date FROM ({1}) AS state JOIN tracks ON tracks.id = state.track ORDER BY tracks.id'.format(
+			', '.join('tracks.' + tag for tag in TRACK_TAGS), _STATE.format('date'))
+		tags = TRACK_TAGS + PLAY_TAGS
+		return ColumnarLibrary.from_records(dict(zip(tags, row)) for row in self.connection.execute(query, {'date': _iso(date)}))
+
+	def load(self, date, tagtrackers=None):
+		"""Returns the MBLibrary of date, evaluated with tagtrackers."""
+		return MBLibrary(columns=self.load_columns(date), tagtrackers=tagtrackers)
+
+	def period_totals(self, start, end, dimension='artist', key=None):
+		"""
+		Returns the play count and play time of every value of dimension between the libraries of start and end, as a
+		dict of value to (play count, play time in ms). Tracks are matched like LibraryDiff does: on their key first (see
+		ColumnarLibrary.keys), the tracks left over on location (or track_id if they have no location), and the ones left
+		after that on name, artist, album and size, so renamed, re-tagged and moved tracks do not count as new tracks.
+		Tracks that were not in the library of start count all plays. Values without plays are left out, the values are
+		in sorted order like DailyAggregates.window returns them, so ties are ranked the same by both.
+		:param start: datetime.date, the closest library on or before it is used
+		:param end: datetime.date, the closest library on or before it is used
+		:param dimension: one of DIMENSIONS
+		:param key: only return the totals of this value of dimension
+		"""
+		if dimension not in DIMENSIONS:
+			raise ValueError(f'Can not group by {dimension}, only by one of {DIMENSIONS}')
+
+		query = _PERIOD_TOTALS.format(_STATE.format('end'), _STATE.format('start'), dimension, 'WHERE end_state.value = :key' if key is not None else '')
+		params = {'start': _iso(start), 'end': _iso(end), 'key': key}
+		return {row[0]: (row[1], row[2]) for row in self.connection.execute(query, params)}
+
+	def import_store(self, store):
+		"""Adds every library of a SnapshotStore that is newer than the last date in the database. Returns the dates."""
+		last = self.closest(datetime.date.max)
+		dates = [date for date in store.index.dates if not last or date > last]
+		for date in dates:
+			self.add(store.load_columns(date), date)
+		return dates
+
+
+if __name__ == '__main__':
+	# python -m mbp.historydb [FOLDER] imports the libraries saved in FOLDER (mbls/ by default) into FOLDER/history.db
+	from mbp.snapshotstore import SnapshotStore
+
+	folder = sys.argv[1] if len(sys.argv) > 1 else 'mbls/'
+	with HistoryDatabase(os.path.join(folder, 'history.db')) as database:
+		print('Imported', len(database.import_store(SnapshotStore(folder))), 'libraries')
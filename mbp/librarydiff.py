@@ -0,0 +1,78 @@
+import operator
+
+from mbp.track import TAG_NAMES
+
+# Returns all tags of a Track as a tuple, to compare two Tracks at once
+_all_tags = operator.attrgetter(*TAG_NAMES)
+
+
+class LibraryDiff:
+	"""
+	LibraryDiff joins the tracks of a new and an old version of a library and sorts them into:
+	changed - (new, old) pairs of the same track of which any tag changed
+	added - tracks of new that are not in old
+	removed - tracks of old that are not in new
+	renamed - (new, old) pairs of a track whose name, artist, album or size changed but is still the same file
+
+	Tracks are joined on Track.identity. Tracks without a match there are joined on location, or on track_id if they
+	have no location, and then count as renamed. Unchanged tracks are not stored.
+	"""
+
+	def __init__(self, new, old):
+		"""
+		:param new: list of Tracks of the new library
+		:param old: list of Tracks of the old library
+		"""
+		self.changed = []
+		self.added = []
+		self.removed = []
+		self.renamed = []
+
+		# Tracks of old per identity, tracks with the same identity are matched in order
+		old_tracks = {}
+		for t in old:
+			old_tracks.setdefault(t.identity, []).append(t)
+
+		unmatched = []
+		for t in new:
+			candidates = old_tracks.get(t.identity)
+			if candidates:
+				old_track = candidates.pop(0)
+				if _all_tags(t) != _all_tags(old_track):
+					self.changed.append((t, old_track))
+			else:
+				unmatched.append(t)
+
+		# Fall back to the file for the tracks that are left over on both sides
+		left_over = {}
+		for candidates in old_tracks.values():
+			for t in candidates:
+				left_over.setdefault(self.fallback_key(t), []).append(t)
+		# Tracks without location and track_id can not be matched
+		no_key = left_over.pop(None, [])
+
+		for t in unmatched:
+			key = self.fallback_key(t)
+			candidates = left_over.get(key) if key else None
+			if candidates:
+				self.renamed.append((t, candidates.pop(0)))
+			else:
+				self.added.append(t)
+
+		self.removed = [t for candidates in left_over.values() for t in candidates] + no_key
+
+	@staticmethod
+	def fallback_key(track):
+		"""Returns the key tracks are matched on when their identity does not match, or None if there is none."""
+		if track.location:
+			return 'location', track.location
+		if track.track_id >= 0:
+			return 'track_id', track.track_id
+		return None
+
+	def matched(self):
+		"""Returns all (new, old) pairs of tracks that changed, renamed tracks included."""
+		return self.changed + self.renamed
+
+	def __str__(self):
+		return '{} changed, {} added, {} removed, {} renamed'.format(len(self.changed), len(self.added), len(self.removed), len(self.renamed))
@@ -1,121 +1,323 @@
 import datetime
-import glob
 import json
 import os
+import re
 import xml.etree.ElementTree as ET
-from mbp import track
-from mbp.track import Track, encode_track
+from mbp import plist, track
+from mbp.librarydiff import LibraryDiff
+from mbp.tagtracker import TagTrackerPlan
+from mbp.track import Track
+from mbp.trackindex import TrackIndex
+
+# Extension of binary snapshot files, see mbp.snapshot
+SNAPSHOT_EXTENSION = '.mbs'
+# Fingerprint of the export the last library was saved from, see save_library_file
+EXPORT_RECORD = 'mbls/export.json'
+# Fingerprints of the tracks in that export, see read_library_xml_incremental
+TRACK_FINGERPRINTS = 'mbls/fingerprints.npy'
+
+# The start of the Tracks dict, the start of a track in it (its key and the opening of its <dict>) and the end of it
+_TRACKS_START = re.compile(rb'<key>Tracks</key>\s*<dict>')
+_TRACK_START = re.compile(rb'\s*<key>(\d+)</key>\s*<dict>')
+_TRACKS_END = re.compile(rb'\s*</dict>')
 
 
 class MBLibrary:
 	"""MBLibrary handles MusicBee's iTunes XML Library file."""
 
-	def __init__(self, file_path="", tracks=None, tagtrackers=None):
-		"""Initializes an MBLibrary object. Reads the file at file_path and stores all tracks found in a list of Tracks."""
+	def __init__(self, file_path="", tracks=None, tagtrackers=None, columns=None):
+		"""
+		Initializes an MBLibrary object. Reads the file at file_path and stores all tracks found in a list of Tracks.
+		:param file_path: path to an 'iTunes Music Library.xml' file
+		:param tracks: list of Tracks, if passed file_path is not read
+		:param tagtrackers: list of TagTrackers that every track is evaluated with
+		:param columns: ColumnarLibrary, if passed the Tracks are only created when the tracks are used
+		"""
 		if not tagtrackers:
 			self.tagtrackers = []
 		else:
 			self.tagtrackers = tagtrackers
 
-		# If tracks are passed, throw them through tagtrackers and return
-		if type(tracks) is list:
-			self.tracks = tracks
+		self._tracks = None
+		self._columns = columns
+		self._index = None
+		self._summary = None
 
-			if self.tagtrackers:
-				for t in tracks:
-					for tagtracker in self.tagtrackers:
-						tagtracker.evaluate(t)
+		# If tracks or columns are passed, throw them through tagtrackers and return
+		if type(tracks) is list or columns is not None:
+			if type(tracks) is list:
+				self._tracks = tracks
 
+			self.evaluate_tagtrackers(self.tagtrackers)
 			return
 
 		# Else read the file path
 		if not file_path:
 			raise ValueError('Pass either a file path or a list of tracks.')
 
-		tree = ET.parse(file_path)
-		root = tree.getroot()
-
-		# List to store tracks
-		self.tracks = []
-
-		add_next = False
-		tag_next = ""
-
-		# Every track
-		for single_track in root[0][11]:
-			data = {}
-
-			# Loop over every tag in the track and add them to the data if we need to save it
-			for child in single_track:
-				text = child.text
-
-				# Add this one if last one said so
-				if add_next:
-					data[track.TAG_NAMES[track.TAGS.index(tag_next)]] = text
-					add_next = False
-
-				# If this tag is a tag we need
-				if text in track.TAGS:
-					add_next = True
-					tag_next = text
-
-			# If we have saved any tag, add a new Track
-			if any(data.values()):
-				t = Track(**data)
-
-				for tracker in self.tagtrackers:
-					tracker.evaluate(t)
-
-				self.tracks.append(t)
+		# Stream the tracks from the file, evaluating the tagtrackers that need a Track as every track is read
+		declarative = [tt for tt in self.tagtrackers if tt.is_declarative()]
+		self._tracks = list(iter_library_xml(file_path, tagtrackers=[tt for tt in self.tagtrackers if tt not in declarative]))
+		self.evaluate_tagtrackers(declarative)
+
+	@property
+	def tracks(self):
+		"""List of the Tracks in this library, created from the columns on first use if the library is columnar."""
+		if self._tracks is None:
+			self._tracks = self._columns.to_tracks()
+		return self._tracks
+
+	@tracks.setter
+	def tracks(self, tracks):
+		self._tracks = tracks
+		self._columns = None
+		self._index = None
+		self._summary = None
+
+	@property
+	def summary(self):
+		"""LibrarySummary of this library, computed on first use."""
+		if self._summary is None:
+			from mbp.columnar import ColumnarLibrary
+			from mbp.summary import LibrarySummary, SUMMARY_TAGS
+			if self._columns is not None:
+				self._summary = LibrarySummary(self._columns)
+			else:
+				self._summary = LibrarySummary(ColumnarLibrary.from_tracks(self._tracks, tags=SUMMARY_TAGS), tracks=self._tracks)
+		return self._summary
+
+	@property
+	def index(self):
+		"""TrackIndex of the tracks of this library, built on first use. Call invalidate_index after changing tracks in place."""
+		if self._index is None:
+			self._index = TrackIndex(self.tracks)
+		return self._index
+
+	def invalidate_index(self):
+		"""Drops the index and summary, so they are built again from the changed tracks."""
+		self._index = None
+		self._summary = None
+
+	@property
+	def columns(self):
+		"""ColumnarLibrary of this library, created from the tracks on first use if the library is not columnar."""
+		if self._columns is None:
+			# numpy is only needed for the columnar backend
+			from mbp.columnar import ColumnarLibrary
+			self._columns = ColumnarLibrary.from_tracks(self._tracks)
+		return self._columns
+
+	def evaluate_tagtrackers(self, tagtrackers):
+		"""
+		Evaluates every track of this library with the given TagTrackers. Declarative TagTrackers are evaluated with a
+		single vectorized group-by over the columns, the others are called for every Track.
+		"""
+		remaining = tagtrackers
+		declarative = [tt for tt in tagtrackers if tt.is_declarative()]
+		if declarative:
+			columns = self._columns
+			if columns is None:
+				# Only create the columns the trackers need
+				from mbp.columnar import ColumnarLibrary
+				tags = {tag for tt in declarative for tag in tt.get_tags()}
+				columns = ColumnarLibrary.from_tracks(self.tracks, tags=[tag for tag in track.TAG_NAMES if tag in tags])
+			remaining = [tt for tt in tagtrackers if not tt.evaluate_columns(columns)]
+
+		if remaining:
+			# Trackers that share a tag share the work for it in a single pass
+			plan = TagTrackerPlan(remaining)
+			for t in self.tracks:
+				plan.evaluate(t)
+			plan.finish()
 
 	def __contains__(self, item):
 		if isinstance(item, Track):
-			for t in self.tracks:
-				if t == item:
-					return True
-				elif t.get('name') == item.get('name') and t.get('artist') == item.get('artist'):
-					return True
+			return self.index.contains(item)
 		return False
 
+	def contains_many(self, items):
+		"""Returns a list with for every item in items whether it is in this library, see __contains__."""
+		return [item in self for item in items]
+
+	def diff(self, other):
+		"""Returns the LibraryDiff of this library against the older library other."""
+		return LibraryDiff(self.tracks, other.tracks)
+
 	# Arithmetic functions only subtract and add play counts of same tracks
-	# Assumptions: locations of music files are equal between libraries
-	# If not the case, change Track.encode_track
+	# Tracks are matched on Track.identity, falling back to their location, see LibraryDiff
 	def __sub__(self, other):
-		# TODO: rewrite with track == track (equality operator for Track) instead of encode_track
-		# how to efficiently equate tracks to eachother?
-		# first sort then search? delete found tracks?
-		tracks_new = {}
-		# Add all self tracks to dict
-		for t in self.tracks:
-			if t.get('play_count') > 0:
-				tracks_new[encode_track(t)] = Track(**t.data)
-
-		# Loop over other's tracks and subtract them with a None check before
-		for t in other.tracks:
-			try:
-				if encode_track(t) in tracks_new:
-					# Subtract if you find the same track in the other MBL
-					tracks_new[encode_track(t)].data['play_count'] -= t.get('play_count')
-					# Remove the track if the play count results to 0
-					if tracks_new[encode_track(t)].data['play_count'] == 0:
-						del tracks_new[encode_track(t)]
-			except IndexError:
-				print(t.get('track_id'), t.get('name'))
+		tracks_new = []
+		diff = self.diff(other)
+
+		# Tracks that are in both libraries get the difference in play count, unless they were not played
+		for new, old in diff.matched():
+			if new.play_count > 0 and new.play_count != old.play_count:
+				t = Track(**new.data)
+				t.play_count -= old.play_count
+				tracks_new.append(t)
+
+		# New tracks keep all their plays
+		for new in diff.added:
+			if new.play_count > 0:
+				tracks_new.append(Track(**new.data))
 
 		# Create a new MBLibrary with that list of tracks
-		return MBLibrary(tracks=list(tracks_new.values()))
+		return MBLibrary(tracks=tracks_new)
 
 	def __rsub__(self, other):
 		return MBLibrary(tracks=self.tracks)
 
 
 # Reads an 'iTunes Music Library.xml' file, with optional tagtrackers
-def read_library_xml(file_path, tagtrackers=None):
+# If lazy is True a generator of Tracks is returned instead of an MBLibrary, see iter_library_xml
+# If columnar is True the file is read into a ColumnarLibrary without creating any Tracks
+def read_library_xml(file_path, tagtrackers=None, lazy=False, columnar=False):
+	if lazy:
+		return iter_library_xml(file_path, tagtrackers=tagtrackers)
+	if columnar:
+		from mbp.columnar import ColumnarLibrary
+		return MBLibrary(columns=ColumnarLibrary.from_xml(file_path), tagtrackers=tagtrackers)
 	return MBLibrary(file_path, tagtrackers=tagtrackers)
 
 
+# Incrementally parses an 'iTunes Music Library.xml' file and yields a Track as soon as its <dict> is closed
+# Every track element is freed after it has been read, so memory use does not grow with the size of the library
+def iter_library_xml(file_path, tagtrackers=None):
+	plan = TagTrackerPlan(tagtrackers if tagtrackers else [])
+
+	for data in iter_track_data(file_path):
+		t = Track(**data)
+		plan.evaluate(t)
+		yield t
+
+	plan.finish()
+
+
+# Incrementally parses an 'iTunes Music Library.xml' file and yields the data of every track as a dict of tag names
+def iter_track_data(file_path):
+	# Depth of the element that is currently open: plist (0) > dict (1) > Tracks dict (2) > track dict (3)
+	depth = -1
+	last_key = None
+	tracks_dict = None
+
+	for event, elem in ET.iterparse(file_path, events=('start', 'end')):
+		if event == 'start':
+			depth += 1
+
+			# The Tracks dict is found by its key in the root dict, every dict in there is a single track
+			if depth == 2 and elem.tag == 'dict' and last_key == 'Tracks':
+				tracks_dict = elem
+			continue
+
+		depth -= 1
+
+		if depth == 2 and tracks_dict is not None and elem.tag == 'dict':
+			data = plist.decode_dict(elem, key_map=track.TAG_MAP)
+
+			# Everything read so far has been handled, free it
+			tracks_dict.clear()
+
+			# Only yield the track if we have saved any tag
+			if any(data.values()):
+				yield data
+		elif depth == 2:
+			# Playlists and other nested structures are not used, free them as well
+			elem.clear()
+		elif depth == 1:
+			# Remember the key of the next value in the root dict
+			last_key = elem.text if elem.tag == 'key' else None
+
+			# Children of the root dict (Tracks, Playlists, ...) are no longer needed once closed
+			if elem is tracks_dict:
+				tracks_dict = None
+			elem.clear()
+
+
+# Finds the raw <dict> of every track in the bytes of an 'iTunes Music Library.xml' file
+# Returns a list of (key, start, end) of every track, or None if the Tracks dict is not laid out as expected
+def find_track_spans(data):
+	match = _TRACKS_START.search(data)
+	if not match:
+		return None
+
+	spans = []
+	position = match.end()
+	while True:
+		match = _TRACK_START.match(data, position)
+		if not match:
+			break
+		start = match.end() - len(b'<dict>')
+		end = data.find(b'</dict>', start)
+		# A track dict does not contain other dicts, a nested one would end the track at its own </dict>
+		if end == -1 or data.find(b'<dict', match.end(), end) != -1:
+			return None
+		position = end + len(b'</dict>')
+		spans.append((int(match.group(1)), start, position))
+
+	return spans if _TRACKS_END.match(data, position) else None
+
+
+# Reads an 'iTunes Music Library.xml' file into columns, only decoding the tracks that changed since the last read
+# Every track's raw <dict> is fingerprinted, tracks with the same key and fingerprint as in fingerprints are copied from
+# previous, the ColumnarLibrary that was read from the file the fingerprints are of
+# Returns the MBLibrary, the fingerprints of this file (an array of key, fingerprint rows, or None if the file could not
+# be split into tracks), and the number of reused and decoded tracks
+def read_library_xml_incremental(file_path, previous=None, fingerprints=None, tagtrackers=None):
+	import hashlib
+
+	import numpy as np
+
+	from mbp.columnar import ColumnarLibrary
+
+	with open(file_path, 'rb') as xml_file:
+		data = xml_file.read()
+
+	spans = find_track_spans(data)
+	if spans is None:
+		columns = ColumnarLibrary.from_xml(file_path)
+		return MBLibrary(columns=columns, tagtrackers=tagtrackers), None, 0, len(columns)
+
+	view = memoryview(data)
+	keys = [key for key, _, _ in spans]
+	new_fingerprints = [int.from_bytes(hashlib.blake2b(view[start:end], digest_size=8).digest(), 'little') for _, start, end in spans]
+
+	# Row in previous of every track whose fingerprint did not change, -1 for the others
+	rows = np.full(len(spans), -1, dtype=np.int64)
+	if previous is not None and fingerprints is not None:
+		old_fingerprints = dict(zip(fingerprints[:, 0].tolist(), fingerprints[:, 1].tolist()))
+		previous_rows = {track_id: row for row, track_id in enumerate(np.asarray(previous.get('track_id')).tolist())}
+		for i, (key, fingerprint) in enumerate(zip(keys, new_fingerprints)):
+			if old_fingerprints.get(key) == fingerprint and key in previous_rows:
+				rows[i] = previous_rows[key]
+
+	reused = np.flatnonzero(rows >= 0)
+	records = []
+	decoded = []
+	for i in np.flatnonzero(rows < 0).tolist():
+		record = plist.decode_dict(ET.fromstring(view[spans[i][1]:spans[i][2]].tobytes()), key_map=track.TAG_MAP)
+		# Only keep the track if we have saved any tag, like iter_track_data
+		if any(record.values()):
+			records.append(record)
+			decoded.append(i)
+
+	columns = ColumnarLibrary.from_records(records)
+	if len(reused):
+		columns = previous.take(rows[reused]).concat(columns)
+
+	# Put the tracks back in the order of the file
+	columns = columns.take(np.argsort(np.concatenate([reused, np.array(decoded, dtype=np.int64)]), kind='stable'))
+
+	fingerprints = np.array([keys, new_fingerprints], dtype=np.uint64).T
+	return MBLibrary(columns=columns, tagtrackers=tagtrackers), fingerprints, len(reused), len(decoded)
+
+
 # Reads an .mbl file
-def read_mbl(file_path, tagtrackers=None):
+# If columnar is True the file is read into a ColumnarLibrary without creating any Tracks
+def read_mbl(file_path, tagtrackers=None, columnar=False):
+	if columnar:
+		from mbp.columnar import ColumnarLibrary
+		return MBLibrary(columns=ColumnarLibrary.from_mbl(file_path), tagtrackers=tagtrackers)
+
 	tracks = []
 	with open(file_path, 'r', encoding='utf-8') as mbl_file:
 		for line in mbl_file:
@@ -125,55 +327,186 @@ def read_mbl(file_path, tagtrackers=None):
 	return MBLibrary(tracks=tracks, tagtrackers=tagtrackers)
 
 
-# Saves the library stats to a datestamped mbl file in the mbls folder
-def save_library(mblibrary):
-	if not os.path.exists('mbls/'):
-		os.makedirs('mbls/')
+# Reads a binary snapshot (.mbs) file, the numeric columns are memory mapped
+def read_snapshot(file_path, tagtrackers=None):
+	from mbp.snapshot import read_snapshot_columns
+	return MBLibrary(columns=read_snapshot_columns(file_path), tagtrackers=tagtrackers)
 
-	dt = datetime.datetime.now()
-	today = '{:0>4}{:0>2}{:0>2}'.format(str(dt.year), str(dt.month), str(dt.day))
-	lib_name = 'mbls/{:0>4}{:0>2}{:0>2}.mbl'.format(str(dt.year), str(dt.month), str(dt.day))
 
-	# Check if today's date is in the list of files, if so don't save anything
-	for file in glob.glob('mbls/*.mbl'):
-		if today in file:
-			return
+# Reads a saved library, either a binary snapshot or an .mbl file
+def read_library_file(file_path, tagtrackers=None):
+	if file_path.endswith(SNAPSHOT_EXTENSION):
+		return read_snapshot(file_path, tagtrackers=tagtrackers)
+	return read_mbl(file_path, tagtrackers=tagtrackers)
+
+
+# Saves the library stats for today (or date), in the mbls folder as a full snapshot or as a delta against the last one,
+# or with backend='sqlite' in the history database mbls/history.db
+# For snapshots the aggregates of the day are added for the reports too, counted against previous (the ColumnarLibrary
+# of the last saved library) if it was read already
+def save_library(mblibrary, backend='snapshots', date=None, previous=None):
+	today = date if date else datetime.date.today()
+
+	if backend == 'sqlite':
+		from mbp.historydb import HistoryDatabase
+
+		with HistoryDatabase('mbls/history.db') as database:
+			# Check if today's library has been saved already, if so don't save anything
+			if not database.has_date(today):
+				database.add(mblibrary.columns, today)
+		return
+
+	from mbp.aggregates import DailyAggregates
+	from mbp.snapshotstore import SnapshotStore
+
+	store = SnapshotStore('mbls/')
+
+	# Check if today's library has been saved already, if so don't save anything
+	if store.find_path(today):
+		return
+
+	store.save(mblibrary, today)
+	DailyAggregates(store.folder, read=False).add_day(store, today, mblibrary.columns, previous)
+
+
+# Returns the size, modification time and SHA-1 of the export file at file_path as a dict
+# The SHA-1 is only computed if the size or modification time differ from the ones in record
+def export_fingerprint(file_path, record=None):
+	import hashlib
+
+	stat = os.stat(file_path)
+	fingerprint = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+	if record and record['size'] == fingerprint['size'] and record['mtime'] == fingerprint['mtime']:
+		fingerprint['sha1'] = record['sha1']
+		return fingerprint
+
+	sha1 = hashlib.sha1()
+	with open(file_path, 'rb') as export_file:
+		for chunk in iter(lambda: export_file.read(1 << 20), b''):
+			sha1.update(chunk)
+	fingerprint['sha1'] = sha1.hexdigest()
+	return fingerprint
 
-	# Write the library to file
-	with open(lib_name, 'w', encoding='utf-8') as mbl_file:
-		for track in mblibrary.tracks:
-			mbl_file.write(str(track) + '\n')
 
-# Finds the closest older .mbl file to given date
-# It keeps expanding the windows for which it will accept a date, so if there is only today's mbl file and you're
-# looking for one, in the end it'll return today's mbl file
-def find_closest_mbl(date, diff_inc=1, tagtrackers=None):
+# Saves the library stats for today (or date) from the export at file_path, like save_library, but only reads the export
+# if it changed since the last saved library. The size, modification time and SHA-1 of the export are kept in
+# mbls/export.json, if they are the same today is saved as a pointer to the last saved library. If they are not, only
+# the tracks that changed are decoded, see read_library_xml_incremental.
+# Returns 'exists' if today was saved already, 'unchanged' if the export did not change or 'saved', and the number of
+# tracks that were reused from the last saved library and that were decoded from the export
+def save_library_file(file_path, backend='snapshots', date=None):
+	today = date if date else datetime.date.today()
+
+	if backend == 'sqlite':
+		from mbp.historydb import HistoryDatabase
+
+		# One connection is used for the whole save
+		with HistoryDatabase('mbls/history.db') as database:
+			return _save_library_file(file_path, backend, today, database=database)
+
+	from mbp.snapshotstore import SnapshotStore
+
+	return _save_library_file(file_path, backend, today, store=SnapshotStore('mbls/'))
+
+
+# Does the work of save_library_file with the open HistoryDatabase or SnapshotStore of backend
+def _save_library_file(file_path, backend, today, database=None, store=None):
+	if database:
+		exists = database.has_date(today)
+		last = database.closest(today)
+	else:
+		exists = store.find_path(today)
+		last = store.index.closest(today)
+		last = last[0] if last else None
+
+	if exists:
+		return 'exists', 0, 0
+
+	try:
+		with open(EXPORT_RECORD, 'r', encoding='utf-8') as record_file:
+			record = json.load(record_file)
+	except (IOError, ValueError):
+		record = None
+
+	# The record only applies if it was written for the last saved library
+	if record and (record.get('backend') != backend or not last or record.get('date') != last.isoformat()):
+		record = None
+	fingerprint = export_fingerprint(file_path, record)
+
+	if record and fingerprint['sha1'] == record['sha1']:
+		if database:
+			database.add_unchanged(today)
+		else:
+			from mbp.aggregates import DailyAggregates
+
+			store.save_unchanged(today)
+			DailyAggregates(store.folder, read=False).add_unchanged(store, today)
+		result = 'unchanged'
+		reused = 0
+		decoded = 0
+	else:
+		import numpy as np
+
+		# Only the tracks that changed since the last saved library are decoded, the others are copied from it
+		previous = None
+		fingerprints = None
+		if record and os.path.exists(TRACK_FINGERPRINTS):
+			previous = database.load_columns(last) if database else store.load_columns(last)
+			fingerprints = np.load(TRACK_FINGERPRINTS)
+
+		mblibrary, fingerprints, reused, decoded = read_library_xml_incremental(file_path, previous, fingerprints)
+		if database:
+			database.add(mblibrary.columns, today)
+		else:
+			save_library(mblibrary, backend=backend, date=today, previous=previous)
+		if fingerprints is not None:
+			np.save(TRACK_FINGERPRINTS, fingerprints)
+		elif os.path.exists(TRACK_FINGERPRINTS):
+			os.remove(TRACK_FINGERPRINTS)
+		result = 'saved'
+
+	fingerprint.update({'backend': backend, 'date': today.isoformat()})
+	with open(EXPORT_RECORD, 'w', encoding='utf-8') as record_file:
+		json.dump(fingerprint, record_file)
+	return result, reused, decoded
+
+
+# Finds the date of the saved library closest to given date, on or after date if diff_inc is positive, on or before if
+# negative. Libraries further than 365 days away are not accepted
+def find_closest_date(date, diff_inc=1, backend='snapshots'):
 	if diff_inc == 0:
 		raise ValueError("diff_inc can't be zero.")
 
-	found = False
+	target_date = datetime.date(date.year, date.month, date.day)
+
+	if backend == 'sqlite':
+		from mbp.historydb import HistoryDatabase
+
+		with HistoryDatabase('mbls/history.db') as database:
+			closest = database.closest(target_date, after=diff_inc > 0)
+	else:
+		from mbp.snapshotstore import SnapshotStore
+
+		# The index of the store finds the closest date with a bisect instead of trying every date
+		closest = SnapshotStore('mbls/').index.closest(target_date, after=diff_inc > 0)
+		closest = closest[0] if closest else None
+
+	if not closest or abs((closest - target_date).days) > 365:
+		raise ValueError('Cant find close mbl for date ' + date.strftime('%m/%d/%Y'))
 
-	files = glob.glob('mbls/*.mbl')
-	diff = 0
+	return closest
 
-	while not found:
-		# Check the target date with + diff and - diff because either side of the date works
-		# If we find a date that has an mbl file we return the MBLibrary and the date of that MBLibrary
 
-		# Backward slash because glob returns the path with \\ not with /
-		# target_date = datetime.date(date.year, date.month, date.day) - datetime.timedelta(days=diff)
-		# target_file = 'mbls\\{:0>4}{:0>2}{:0>2}.mbl'.format(target_date.year, target_date.month, target_date.day)
-		#
-		# if target_file in files:
-		# 	return read_mbl(target_file), target_date
+# Finds the saved library closest to given date, see find_closest_date
+def find_closest_mbl(date, diff_inc=1, tagtrackers=None, backend='snapshots'):
+	closest = find_closest_date(date, diff_inc=diff_inc, backend=backend)
 
-		target_date = datetime.date(date.year, date.month, date.day) + datetime.timedelta(days=diff)
-		target_file = 'mbls\\{:0>4}{:0>2}{:0>2}.mbl'.format(target_date.year, target_date.month, target_date.day)
+	if backend == 'sqlite':
+		from mbp.historydb import HistoryDatabase
 
-		if target_file in files:
-			return read_mbl(target_file, tagtrackers=tagtrackers), target_date
+		with HistoryDatabase('mbls/history.db') as database:
+			return database.load(closest, tagtrackers=tagtrackers), closest
 
-		diff += diff_inc
+	from mbp.snapshotstore import SnapshotStore
 
-		if diff > 365:
-			raise ValueError('Cant find close mbl for date ' + date.strftime('%m/%d/%Y'))
\ No newline at end of file
+	return SnapshotStore('mbls/').load(closest, tagtrackers=tagtrackers), closest
@@ -3,11 +3,10 @@ import datetime
 import numpy as np
 import matplotlib.pyplot as plt
 
-import mbp.musicbeelibrary
 from mbp import util
-from mbp.musicbeelibrary import MBLibrary
 from mbp.ranking import Ranking
 from mbp.tagtracker import TagTracker
+from mbp.timeseries import PlayTimeSeries
 
 
 class PeriodGrapher:
@@ -15,34 +14,27 @@ class PeriodGrapher:
 	Class which displays informative plots of song listening behaviour over a set period of time.
 	"""
 
-	def __init__(self, start_date, end_date):
+	def __init__(self, start_date, end_date, store=None):
 		"""
 		:param start_date: datetime.datetime starting date
 		:param end_date: datetime.datetime end date
+		:param store: SnapshotStore to read the libraries from, the one in mbls/ if omitted
 		"""
 		# Set dates
 		self.start_date = start_date
 		self.end_date = end_date
 
-		# Find first mbl
-		self.start_mbl, self.real_start_date = mbp.musicbeelibrary.find_closest_mbl(start_date - datetime.timedelta(days=1), diff_inc=-1)
-
-		# Create arrays to store mbls
 		self.total_days = (self.end_date - self.start_date).days + 1  # +1 to have an inclusive range for the end_date
-		self.stats = [0.] * (self.total_days + 1)
-
-		# TagTracker to calculate total amount of mins per artist
-		total_tracker_artist_play_time = TagTracker('artist', tag_data=lambda item: item.get('play_count') * item.get('total_time') / 60000, unique=False)
-		total_time = TagTracker(tag=lambda t: 'total_time', tag_data=lambda item: item.get('play_count') * item.get('total_time') / 60000, unique=False)
 
-		# Has the mbl over the complete period
-		self.period_mbl = MBLibrary(tracks=(
-					mbp.musicbeelibrary.find_closest_mbl(self.end_date)[0] - self.start_mbl).tracks, tagtrackers=[total_tracker_artist_play_time, total_time])
-		self.total_time_value = total_time.data['total_time']
+		# Minutes played per day per artist, read from all libraries in the period at once
+		self.series = PlayTimeSeries(start_date, end_date, tag='artist', store=store)
 
-		print(total_tracker_artist_play_time.data)
+		# TagTracker with the total amount of mins per artist
+		total_tracker_artist_play_time = TagTracker('artist', unique=False)
+		total_tracker_artist_play_time.data = self.series.get_totals()
+		self.total_time_value = self.series.matrix.sum()
 
-		self.artist_ranking = Ranking(total_tracker_artist_play_time)
+		self.artist_ranking = Ranking(total_tracker_artist_play_time, data_format='{:.0f} min')
 
 		print(self.artist_ranking.get_string())
 
@@ -58,78 +50,30 @@ class PeriodGrapher:
 
 		# x coordinates for bar plot
 		x = range(0, self.total_days)
-		ys = []
-		ys_keys = []
 
 		# Determine how many different artists will be displayed
-
+		ys_keys = []
 		for i in range(0, self.artist_ranking.get_length()):
-			if self.artist_ranking.get_score(i, zero_indexed=True) / self.total_time_value >= limit:
-				ys.append([0.] * self.total_days)
+			if self.total_time_value and self.artist_ranking.get_score(i, zero_indexed=True) / self.total_time_value >= limit:
 				ys_keys.append(self.artist_ranking.get_entry(i, zero_indexed=True))
 			else:
 				break
 
-		ys.append([0.] * self.total_days)
-
-		ys = np.array(ys)
-
-		# Loop through all days in the period
-		i = 0
-		# prev_i is used to remember for what entry an mbl was found
-		prev_i = 0
-		while i < self.total_days + 1:
-			target_date = self.real_start_date + datetime.timedelta(days=i)
-
-			# TagTrackers to track stats for one day for each artist in ys_keys
-			tts = []
-			for artist in ys_keys:
-				tts.append(TagTracker(tag=lambda t, artist=artist: artist if t.get('artist') == artist else None, tag_data=lambda item: item.get('play_count') * item.get('total_time') / 60000, unique=False))
-
-			tts.append(TagTracker(tag=lambda t: rest_key if t.get('artist') not in ys_keys else None, tag_data=lambda item: item.get('play_count') * item.get('total_time') / 60000, unique=False))
-
-			# We already know the first mbl
-			if i == 0:
-				MBLibrary(tracks=self.start_mbl.tracks, tagtrackers=tts)
-
-				self.stats[i] = tts
-				i += 1
-				continue
-
-			# Find closest mbl, add tagtrackers
-			target_date_mbl, real_target_date = mbp.musicbeelibrary.find_closest_mbl(target_date, tagtrackers=tts)
-
-			# Check if the dates match
-			if target_date != real_target_date:
-				# If not the same, skip i forward to the date for which we found this mbl
-				i += (real_target_date - target_date).days
-
-			# Enter the found mbls in the arrays
-			self.stats[i] = tts
-
-			# For every artist, add their value for this day to ys if they have a value
-			for j in range(0, len(ys_keys)):
-				if ys_keys[j] in tts[j].data:
-					ys[j][i - 1] = (tts[j] - self.stats[prev_i][j]).data[ys_keys[j]]
-					if not allow_negative and ys[j][i - 1] < 0:
-						ys[j][i - 1] = 0
-
-			# Now at rest, if applicable
-			if rest_key in tts[-1].data:
-				ys[-1][i - 1] = (tts[-1] - self.stats[prev_i][-1]).data[rest_key]
-				if not allow_negative and ys[-1][i - 1] < 0:
-					ys[-1][i - 1] = 0
-
-			# Go next and remember this entry as prev_i
-			prev_i = i
-			i += 1
+		# One row per displayed artist, the rest of the artists summed in the last row
+		columns = [self.series.keys.index(artist) for artist in ys_keys]
+		shown = np.zeros(len(self.series.keys), dtype=bool)
+		shown[columns] = True
+		matrix = self.series.matrix
+		ys = np.vstack([matrix[:, columns].T, matrix[:, ~shown].sum(axis=1)])
+		if not allow_negative:
+			ys = np.maximum(ys, 0)
 
 		fig, ax = plt.subplots()
 
 		ax.bar(x, ys[-1], label=rest_key)
 
 		# Keep track of the height of the current graph
-		bottom = ys[-1]
+		bottom = ys[-1].copy()
 		for i in range(0, len(ys) - 1):
 			# Add new bars on top of current height
 			ax.bar(x, ys[i], bottom=bottom, label=ys_keys[i])
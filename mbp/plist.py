@@ -0,0 +1,78 @@
+import base64
+import datetime
+
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def decode_date(text):
+	"""Converts a plist date string (e.g. 2020-01-31T12:00:00Z) to a naive UTC datetime.datetime."""
+	if text.endswith('Z'):
+		text = text[:-1]
+	return datetime.datetime.fromisoformat(text)
+
+
+def encode_date(date):
+	"""Converts a datetime.datetime back to a plist date string. Can be passed as default to json.dumps."""
+	if isinstance(date, datetime.datetime):
+		return date.strftime(DATE_FORMAT)
+	raise TypeError(f'Object of type {type(date).__name__} is not a date')
+
+
+# Converters for every plist element type that holds a single value, they get '' for an empty element
+# An empty <string/> is None, like a tag that is not in the dict, so optional tags such as location stay None
+CONVERTERS = {
+	'integer': int,
+	'real': float,
+	'string': lambda text: text if text else None,
+	'date': decode_date,
+	'data': base64.b64decode,
+}
+
+
+def decode_value(elem):
+	"""Converts a plist value element to the matching Python value, recursing into arrays and dicts."""
+	converter = CONVERTERS.get(elem.tag)
+	if converter:
+		return converter(elem.text if elem.text else '')
+	if elem.tag == 'true':
+		return True
+	if elem.tag == 'false':
+		return False
+	if elem.tag == 'dict':
+		return decode_dict(elem)
+	if elem.tag == 'array':
+		return [decode_value(child) for child in elem]
+	raise ValueError(f'Unknown plist element <{elem.tag}>')
+
+
+def decode_dict(elem, key_map=None):
+	"""
+	Decodes a plist <dict> element into a dict, pairing every <key> with the element that follows it.
+	:param elem: the <dict> element
+	:param key_map: optional dict of plist key to returned key, if passed only keys in key_map are decoded
+	:return: dict with the decoded values
+	"""
+	data = {}
+	key = None
+
+	for child in elem:
+		if child.tag == 'key':
+			key = child.text
+			continue
+
+		if key is None:
+			raise ValueError(f'Value <{child.tag}> in plist dict without a key')
+
+		if key_map is None:
+			data[key] = decode_value(child)
+		elif key in key_map:
+			# Convert single values right away, only nested values need decode_value
+			converter = CONVERTERS.get(child.tag)
+			if converter:
+				data[key_map[key]] = converter(child.text if child.text else '')
+			else:
+				data[key_map[key]] = decode_value(child)
+
+		key = None
+
+	return data
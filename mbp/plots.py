@@ -1,3 +1,7 @@
+import html
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy
 from matplotlib import pyplot as plt
 
@@ -29,6 +33,8 @@ def barh_plot(d, title, x_label=None, y_label=None, y_scale=None):
 	ax.set_yticklabels(d.keys())
 	ax.invert_yaxis()  # idk why tbh
 
+	return fig
+
 
 def scatter_plot(x, y, title, subsets=False, x_label=None, y_label=None, color=None, label=None):
 	plt.rcdefaults()
@@ -49,4 +55,54 @@ def scatter_plot(x, y, title, subsets=False, x_label=None, y_label=None, color=N
 	if x_label:
 		ax.set_xlabel(x_label)
 	if y_label:
-		ax.set_ylabel(y_label)
\ No newline at end of file
+		ax.set_ylabel(y_label)
+
+	return fig
+
+
+def render_plot(spec, file_path, formats):
+	"""
+	Renders one plot spec to files without a display, see render_plots. Runs in a worker process.
+	:return: the title of the plot and the names of the written files
+	"""
+	# Agg renders to files only, no display needed
+	plt.switch_backend('Agg')
+
+	function, args, kwargs = spec
+	fig = function(*args, **kwargs)
+
+	file_names = []
+	for file_format in formats:
+		fig.savefig(f'{file_path}.{file_format}', format=file_format, bbox_inches='tight')
+		file_names.append(os.path.basename(f'{file_path}.{file_format}'))
+
+	title = fig.axes[0].get_title() if fig.axes else ''
+	plt.close(fig)
+	return title, file_names
+
+
+def render_plots(specs, folder, formats=('png',), processes=None):
+	"""
+	Renders plots to files in folder in parallel worker processes, and writes an index.html that shows them all.
+	:param specs: list of plot specs (function, args, kwargs), e.g. (barh_plot, (d, 'Play count per artist'), {})
+	:param folder: folder to write the files to
+	:param formats: file formats to render every plot to, e.g. ('png', 'svg'), the first is shown in index.html
+	:param processes: number of worker processes, the number of cores if omitted
+	:return: path of index.html
+	"""
+	os.makedirs(folder, exist_ok=True)
+
+	paths = [os.path.join(folder, 'plot{:02}'.format(i)) for i in range(len(specs))]
+	with ProcessPoolExecutor(max_workers=processes) as executor:
+		results = list(executor.map(render_plot, specs, paths, [formats] * len(specs)))
+
+	index_path = os.path.join(folder, 'index.html')
+	with open(index_path, 'w', encoding='utf-8') as index_file:
+		index_file.write('<!DOCTYPE html>\n<html>\n<head><meta charset="utf-8"><title>MusicBee Stats</title></head>\n<body>\n')
+		for title, file_names in results:
+			index_file.write('<h2>{}</h2>\n<img src="{}" alt="{}">\n'.format(html.escape(title), html.escape(file_names[0]), html.escape(title)))
+			for file_name in file_names[1:]:
+				index_file.write('<a href="{0}">{0}</a>\n'.format(html.escape(file_name)))
+		index_file.write('</body>\n</html>\n')
+
+	return index_path
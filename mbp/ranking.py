@@ -1,3 +1,6 @@
+import heapq
+from collections import Counter
+
 FORMAT = '{:>3} {:28.28}'
 FORMAT_DIFF = '{:>3}{:>5} {:28.28}'
 
@@ -10,21 +13,39 @@ class Ranking:
 	Columns can be named with ColumnTitles.
 
 	Change in the ranking order can be displayed using a different Ranking for diff_ranking.
+
+	If top is passed only the top entries are sorted, the rest is only sorted when an entry below the top is asked for.
+	Ranks below the top are counted without sorting, see rank_keys.
 	"""
 
-	def __init__(self, tagtracker, data_format=None, diff_ranking=None, reverse=True, col_titles=None):
+	def __init__(self, tagtracker, data_format=None, diff_ranking=None, reverse=True, col_titles=None, top=None):
 		"""
 		:param tagtracker: The TagTracker from which this Ranking displays the data
 		:param data_format: Format string for the data column, can also be an array of formats that will be applied in order. Value is applied to the first entry, then the resulting string to the second entry, etc.
 		:param diff_ranking: The Ranking this will be compared with and the difference displayed, if ommited the difference column is not displayed
 		:param reverse: Determines the order of sorting, default is from higher to lower
 		:param col_titles: Accepts an list with two ColumnTitles, first member for the identifier (tag), second for the data (tag_data) in the passed TagTracker
+		:param top: Number of entries to sort, all entries are sorted if omitted
 		"""
 		self.tagtracker = tagtracker
 		self.data_format = data_format
 		self.col_titles = col_titles
+		self.reverse = reverse
+
+		data = self.tagtracker.data
+		if top is not None and top < len(data):
+			# heapq.nlargest and nsmallest give the same order as sorted, ties keep their order
+			select = heapq.nlargest if reverse else heapq.nsmallest
+			self.sorted_keys = select(top, data, key=data.get)
+			self.complete = False
+		else:
+			self.sorted_keys = sorted(data, key=data.get, reverse=reverse)
+			self.complete = True
 
-		self.sorted_keys = [i[0] for i in sorted(self.tagtracker.data.items(), key=lambda item: item[1], reverse=reverse)]
+		# Rank of every key in sorted_keys, built on first use, and of the keys below the top that were asked for
+		self.ranks = None
+		# Number of entries ahead of every value, counted on first use by rank_keys
+		self.ahead = None
 
 		self.diff_ranking = diff_ranking
 
@@ -32,17 +53,65 @@ class Ranking:
 		self.extra_data_formats = []
 		self.extra_cols = []
 
+	def sort_all(self):
+		"""Sorts all entries, if only the top entries were sorted."""
+		if not self.complete:
+			# Sorting the keys on data.get gives the same order as sorting the items, without building a tuple per entry
+			self.sorted_keys = sorted(self.tagtracker.data, key=self.tagtracker.data.get, reverse=self.reverse)
+			self.complete = True
+			self.ranks = None
+			self.ahead = None
+
 	def get_ranking(self, key):
-		return self.sorted_keys.index(key)
+		"""Returns the zero indexed rank of key, raises a ValueError if key is not in this Ranking."""
+		self.rank_keys([key])
+		if key not in self.ranks:
+			raise ValueError(f'{key} is not in the ranking')
+		return self.ranks[key]
+
+	def rank_keys(self, keys):
+		"""
+		Finds the ranks of keys, so get_ranking is a lookup for them. The rank of a key below the top is the number of
+		entries with a better value, plus the entries with the same value that come before it, as sorted keeps ties in
+		their order. The values are counted once per Ranking, the ties of all keys are found in a single pass.
+		"""
+		if self.ranks is None:
+			self.ranks = {k: i for i, k in enumerate(self.sorted_keys)}
+		data = self.tagtracker.data
+		missing = {k for k in keys if k not in self.ranks and k in data}
+		if self.complete or not missing:
+			return
+
+		if self.ahead is None:
+			counts = Counter(data.values())
+			self.ahead = {}
+			total = 0
+			for value in sorted(counts, reverse=self.reverse):
+				self.ahead[value] = total
+				total += counts[value]
+
+		# Entries seen so far with the value of a missing key
+		ties = dict.fromkeys((data[k] for k in missing), 0)
+		for k, v in data.items():
+			if v in ties:
+				if k in missing:
+					self.ranks[k] = self.ahead[v] + ties[v]
+					missing.discard(k)
+					if not missing:
+						break
+				ties[v] += 1
 
 	def get_entry(self, placement, zero_indexed=False):
-		return self.sorted_keys[placement - (0 if zero_indexed else 1)]
+		index = placement - (0 if zero_indexed else 1)
+		if index >= len(self.sorted_keys):
+			self.sort_all()
+		return self.sorted_keys[index]
 
 	def get_score(self, placement, zero_indexed=False):
 		return self.tagtracker.data[self.get_entry(placement, zero_indexed)]
 
 	def get_length(self):
-		return len(self.sorted_keys)
+		return len(self.tagtracker.data)
 
 	def add_tagtracker(self, tagtracker, data_format, col_title=None):
 		self.extra_tagtrackers.append(tagtracker)
@@ -54,9 +123,13 @@ class Ranking:
 		:param count: the amount of lines to print of the ranking (e.g. count=10 prints the top 10)
 		:return: string with top count, with all data from extra tagtrackers and column titles
 		"""
-		if count > len(self.sorted_keys):
+		if count > self.get_length():
 			# warn('Count is higher than number of entries, printing all.')
-			count = len(self.sorted_keys)
+			count = self.get_length()
+		if count > len(self.sorted_keys):
+			self.sort_all()
+		if self.diff_ranking:
+			self.diff_ranking.rank_keys(self.sorted_keys[:count])
 
 		# First line should be generated with column titles if we have those
 		if self.col_titles:
@@ -98,12 +171,12 @@ class Ranking:
 			# Generate entry and append extra_str
 			if self.diff_ranking:
 				try:
-					diff_value = self.diff_ranking.get_ranking(curr_entry) - self.sorted_keys.index(curr_entry)
+					diff_value = self.diff_ranking.get_ranking(curr_entry) - i
 
 					diff_string = '({:+d})'.format(diff_value)
 					res += FORMAT_DIFF.format(str(i + 1) + '.', diff_string, curr_entry) + self.data_format.format(self.tagtracker.data[curr_entry]) + extra_str + '\n'
 				except ValueError:
-					res += FORMAT_DIFF.format(str(i + 1) + '.', '(+' + str(len(self.sorted_keys) - i) + ')', curr_entry) + self.data_format.format(self.tagtracker.data[curr_entry]) + extra_str + '\n'
+					res += FORMAT_DIFF.format(str(i + 1) + '.', '(+' + str(self.get_length() - i) + ')', curr_entry) + self.data_format.format(self.tagtracker.data[curr_entry]) + extra_str + '\n'
 			else:
 				res += FORMAT.format(str(i + 1) + '.', curr_entry) + self.data_format.format(self.tagtracker.data[curr_entry]) + extra_str + '\n'
 
@@ -1,21 +1,55 @@
+import numpy as np
+
+from mbp.similaritygraph import SimilarityGraph, normalize
+from mbp.track import Track
 
 
 class Recommender:
 	"""
 	Recommender creates recommendations based on a Ranking.
 	This Ranking has to be about Tracks, otherwise it will not work.
+
+	The similar tracks of the top entries are kept in a SimilarityGraph, built from the cache of the LastFMAPI if it
+	has one, so only tracks that are not in the graph yet, or whose similar tracks expired, are requested. Tracks in library are not recommended.
+
+	Recommendations are ordered by the plays of the entries they are similar to times their similarity. The match of a
+	recommendation is the share of the plays of the entries that it is similar to, regardless of the similarity.
 	"""
 
-	def __init__(self, ranking, lastfm_api, based_on=5, amount=5):
+	def __init__(self, ranking, lastfm_api, based_on=5, amount=5, library=None, graph=None):
+		"""
+		:param ranking: Ranking of Tracks the recommendations are based on
+		:param lastfm_api: LastFMAPI to request similar tracks with
+		:param based_on: number of top entries of ranking to use
+		:param amount: number of recommendations
+		:param library: MBLibrary whose tracks are not recommended
+		:param graph: SimilarityGraph to use, created from the cache of lastfm_api if omitted
+		"""
 		self.ranking = ranking
-		self.based_on = min(based_on, len(self.ranking.sorted_keys))
+		self.based_on = min(based_on, self.ranking.get_length())
 		self.amount = amount
 		self.lastfm_api = lastfm_api
+		self.library = library
+		# Case folded (artist, name) of the tracks in library, built on first use
+		self.library_keys = None
 		self.max_score = sum([self.ranking.get_score(i, zero_indexed=True) for i in range(0, self.based_on)])
 
+		if graph is None:
+			graph = SimilarityGraph.from_cache(lastfm_api.cache) if lastfm_api.cache else SimilarityGraph()
+		self.graph = graph
+
+	def update_graph(self, entries):
+		"""Requests the similar tracks of the entries that are not in the graph yet, or whose response in the graph has
+		expired in the cache of the API, all at the same time."""
+		max_age = self.lastfm_api.cache.get_ttl('track.getsimilar') if self.lastfm_api.cache else None
+		missing = [e for e in entries if not self.graph.has_source(e.get('artist'), e.get('name'), max_age)]
+		responses = self.lastfm_api.request_many([('track.getsimilar', [['artist', e.get('artist')], ['track', e.get('name')]]) for e in missing])
+		for e, response in zip(missing, responses):
+			self.graph.add_response(e.get('artist'), e.get('name'), response)
+
 	def get_recommendations(self, based_on=None, amount=None):
 		if based_on:
-			self.based_on = min(based_on, len(self.ranking.sorted_keys))
+			self.based_on = min(based_on, self.ranking.get_length())
 			self.max_score = sum([self.ranking.get_score(i, zero_indexed=True) for i in range(0, self.based_on)])
 		if amount:
 			self.amount = amount
@@ -25,17 +59,36 @@ class Recommender:
 		for i in range(1, self.based_on + 1):
 			entries.append(self.ranking.get_entry(i))
 
-		recommendations = {}
+		self.update_graph(entries)
 
+		# Listening vector of the top entries, scored against the whole graph at once
+		weights = {}
 		for n in range(0, len(entries)):
-			e = entries[n]
-			similars = self.lastfm_api.get_similar_tracks_sanitized(e.get('artist'), e.get('name'))
-			for s in similars:
-				if s in recommendations:
-					recommendations[s] += self.ranking.get_score(n, zero_indexed=True)
-				else:
-					recommendations[s] = self.ranking.get_score(n, zero_indexed=True)
+			node = self.graph.get_node(entries[n].get('artist'), entries[n].get('name'))
+			weights[node] = weights.get(node, 0) + self.ranking.get_score(n, zero_indexed=True)
+		scores = self.graph.score(weights)
+		matches = self.graph.score(weights, similarity=False)
+
+		# Go through the candidates from the highest score, skipping the entries and tracks in the library
+		recs_sorted = []
+		for node in np.argsort(-scores, kind='stable').tolist():
+			if len(recs_sorted) == self.amount or scores[node] <= 0:
+				break
+			if node in weights:
+				continue
+
+			if self.in_library(self.graph.artists[node], self.graph.names[node]):
+				continue
+			t = Track(artist=self.graph.artists[node], name=self.graph.names[node])
+			recs_sorted.append([t, scores[node].item(), matches[node].item() / self.max_score])
 
-		recs_sorted = [[i[0], i[1], i[1] / self.max_score] for i in sorted(recommendations.items(), key=lambda item: item[1], reverse=True)]
+		return recs_sorted
 
-		return recs_sorted[0:self.amount]
\ No newline at end of file
+	def in_library(self, artist, name):
+		"""Returns whether library has a track by artist named name, ignoring case and surrounding whitespace."""
+		if self.library is None:
+			return False
+		if self.library_keys is None:
+			columns = self.library.columns
+			self.library_keys = set(map(normalize, columns.strings('artist').tolist(), columns.strings('name').tolist()))
+		return normalize(artist, name) in self.library_keys
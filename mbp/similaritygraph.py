@@ -0,0 +1,118 @@
+import time
+
+import numpy as np
+
+
+def normalize(artist, name):
+	"""Returns the key of a track in the graph, case and surrounding whitespace are ignored."""
+	return (artist or '').strip().lower(), (name or '').strip().lower()
+
+
+class SimilarityGraph:
+	"""
+	SimilarityGraph holds which tracks are similar to which, as returned by Last.fm's track.getsimilar, as a sparse
+	matrix: row i holds the similarity of track i to every other track.
+
+	Scoring a set of tracks is a sparse vector-matrix product: every track gets the sum of its similarity to the scored
+	tracks times their weight.
+	"""
+
+	def __init__(self):
+		# Key of every track (see normalize) to its index, and its artist and name as first seen
+		self.nodes = {}
+		self.artists = []
+		self.names = []
+
+		# Key of every track whose similar tracks are known to the time they were received
+		self.sources = {}
+		# Edges as lists of (source index, target index, weight), turned into arrays by to_csr
+		self.edge_sources = []
+		self.edge_targets = []
+		self.edge_weights = []
+
+		self.csr = None
+
+	@classmethod
+	def from_cache(cls, cache):
+		"""Creates a SimilarityGraph from the track.getsimilar responses stored in a ResponseCache that have not expired."""
+		graph = cls()
+		for args, response, created in cache.get_all('track.getsimilar'):
+			args = dict(args)
+			graph.add_response(args.get('artist'), args.get('track'), response, created)
+		return graph
+
+	def get_node(self, artist, name):
+		"""Returns the index of a track, adding it if it is not in the graph yet."""
+		key = normalize(artist, name)
+		if key not in self.nodes:
+			self.nodes[key] = len(self.nodes)
+			self.artists.append(artist)
+			self.names.append(name)
+		return self.nodes[key]
+
+	def has_source(self, artist, name, max_age=None):
+		"""Returns whether the similar tracks of a track are in the graph, and were received at most max_age seconds ago
+		if max_age is passed."""
+		created = self.sources.get(normalize(artist, name))
+		if created is None:
+			return False
+		return max_age is None or time.time() - created <= max_age
+
+	def add_response(self, artist, name, response, created=None):
+		"""
+		Adds the similar tracks in a track.getsimilar response for the track by artist named name, replacing the similar
+		tracks it had.
+		:param created: time the response was received, now if omitted
+		:return: False if the response has no similar tracks (e.g. it is an error), True otherwise
+		"""
+		try:
+			similars = response['similartracks']['track']
+		except (KeyError, TypeError):
+			return False
+
+		source = self.get_node(artist, name)
+		if normalize(artist, name) in self.sources:
+			kept = [i for i, s in enumerate(self.edge_sources) if s != source]
+			self.edge_sources = [self.edge_sources[i] for i in kept]
+			self.edge_targets = [self.edge_targets[i] for i in kept]
+			self.edge_weights = [self.edge_weights[i] for i in kept]
+		self.sources[normalize(artist, name)] = created if created else time.time()
+		for similar in similars:
+			self.edge_sources.append(source)
+			self.edge_targets.append(self.get_node(similar['artist']['name'], similar['name']))
+			self.edge_weights.append(float(similar.get('match', 1)))
+		self.csr = None
+		return True
+
+	def to_csr(self):
+		"""Returns the graph as the (indptr, indices, weights) arrays of a CSR matrix, built once after every change."""
+		if self.csr is None:
+			sources = np.array(self.edge_sources, dtype=np.int64)
+			order = np.argsort(sources, kind='stable')
+			indptr = np.zeros(len(self.nodes) + 1, dtype=np.int64)
+			np.cumsum(np.bincount(sources, minlength=len(self.nodes)), out=indptr[1:])
+			self.csr = indptr, np.array(self.edge_targets, dtype=np.int64)[order], np.array(self.edge_weights)[order]
+		return self.csr
+
+	def score(self, weights, similarity=True):
+		"""
+		Returns the score of every track in the graph: the sum of its similarity to the tracks in weights times their
+		weight.
+		:param weights: dict of track index to weight
+		:param similarity: False to count every similar track with similarity 1, the score is then the sum of the
+			weights of the tracks in weights it is similar to
+		:return: array of scores, indexed by track index
+		"""
+		indptr, indices, similarities = self.to_csr()
+		rows = np.array(list(weights), dtype=np.int64)
+		row_weights = np.array(list(weights.values()), dtype=float)
+
+		# Positions in indices of every edge of the rows, and the weight of the row they belong to
+		lengths = indptr[rows + 1] - indptr[rows]
+		offsets = np.repeat(indptr[rows] - np.cumsum(lengths) + lengths, lengths)
+		positions = offsets + np.arange(lengths.sum())
+
+		edge_weights = np.repeat(row_weights, lengths)
+		if similarity:
+			edge_weights *= similarities[positions]
+		return np.bincount(indices[positions], weights=edge_weights, minlength=len(self.nodes))
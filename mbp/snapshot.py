@@ -0,0 +1,119 @@
+import glob
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+
+from mbp.columnar import ColumnarLibrary, CATEGORICAL
+from mbp.musicbeelibrary import SNAPSHOT_EXTENSION
+
+# A snapshot file is laid out as follows, all numbers little endian:
+# MAGIC | version (uint16) | header length (uint32) | JSON header | padding | column and string blocks
+# Every block starts at a multiple of ALIGNMENT so numeric columns can be memory mapped straight from the file.
+# The header describes every block: {'length': tracks, 'columns': {tag: {'dtype', 'offset'}}, 'strings': {tag: {'offset', 'size', 'count'}}}
+# String tables hold the distinct strings of a categorical tag, utf-8 encoded and separated by a NUL byte.
+MAGIC = b'MBSNAP'
+VERSION = 1
+ALIGNMENT = 64
+
+_PREAMBLE = struct.Struct('<6sHI')
+
+
+def _align(offset):
+	return offset + (-offset % ALIGNMENT)
+
+
+def write_snapshot(columns, file_path):
+	"""
+	Writes a ColumnarLibrary to a binary snapshot file.
+	:param columns: ColumnarLibrary to write
+	:param file_path: path of the snapshot file
+	"""
+	blocks = []
+	for tag, array in columns.columns.items():
+		blocks.append(('columns', tag, np.ascontiguousarray(array)))
+	for tag in CATEGORICAL:
+		if tag in columns.categories:
+			blocks.append(('strings', tag, '\0'.join(columns.categories[tag]).encode('utf-8')))
+
+	# The header holds the offsets of the blocks, which depend on the size of the header, so lay out twice
+	header = {'length': len(columns), 'columns': {}, 'strings': {}}
+	for _ in range(2):
+		header_bytes = json.dumps(header).encode('utf-8')
+		offset = _align(_PREAMBLE.size + len(header_bytes))
+		for kind, tag, block in blocks:
+			if kind == 'columns':
+				header['columns'][tag] = {'dtype': block.dtype.str, 'offset': offset}
+				offset = _align(offset + block.nbytes)
+			else:
+				header['strings'][tag] = {'offset': offset, 'size': len(block), 'count': len(columns.categories[tag])}
+				offset = _align(offset + len(block))
+	header_bytes = json.dumps(header).encode('utf-8')
+
+	with open(file_path, 'wb') as snapshot_file:
+		snapshot_file.write(_PREAMBLE.pack(MAGIC, VERSION, len(header_bytes)))
+		snapshot_file.write(header_bytes)
+
+		for kind, tag, block in blocks:
+			snapshot_file.seek(header[kind][tag]['offset'])
+			snapshot_file.write(block.tobytes() if kind == 'columns' else block)
+
+
+def read_snapshot_header(file_path):
+	"""Returns the version and header of a snapshot file, raises a ValueError if it is not a snapshot file."""
+	with open(file_path, 'rb') as snapshot_file:
+		magic, version, header_length = _PREAMBLE.unpack(snapshot_file.read(_PREAMBLE.size))
+		if magic != MAGIC:
+			raise ValueError(f'{file_path} is not a snapshot file')
+		if version > VERSION:
+			raise ValueError(f'{file_path} has snapshot version {version}, only up to {VERSION} is supported')
+		return version, json.loads(snapshot_file.read(header_length).decode('utf-8'))
+
+
+def read_snapshot_columns(file_path):
+	"""
+	Reads a snapshot file into a ColumnarLibrary. Numeric columns are memory mapped, not read, so they are only loaded
+	from disk when they are used. Only the string tables are decoded.
+	"""
+	_, header = read_snapshot_header(file_path)
+	length = header['length']
+
+	columns = {}
+	for tag, column in header['columns'].items():
+		if length:
+			columns[tag] = np.memmap(file_path, dtype=np.dtype(column['dtype']), mode='r', offset=column['offset'], shape=(length,))
+		else:
+			columns[tag] = np.zeros(0, dtype=np.dtype(column['dtype']))
+
+	categories = {}
+	with open(file_path, 'rb') as snapshot_file:
+		for tag, strings in header['strings'].items():
+			snapshot_file.seek(strings['offset'])
+			categories[tag] = snapshot_file.read(strings['size']).decode('utf-8').split('\0') if strings['count'] else []
+
+	return ColumnarLibrary(columns, categories)
+
+
+def convert_mbl(mbl_path, snapshot_path=None):
+	"""Converts an .mbl file to a snapshot file next to it, or at snapshot_path. Returns the path of the snapshot."""
+	if not snapshot_path:
+		snapshot_path = os.path.splitext(mbl_path)[0] + SNAPSHOT_EXTENSION
+	write_snapshot(ColumnarLibrary.from_mbl(mbl_path), snapshot_path)
+	return snapshot_path
+
+
+def convert_mbls(folder='mbls/'):
+	"""Converts every .mbl file in folder that has no snapshot file yet. Returns the paths of the new snapshots."""
+	converted = []
+	for mbl_path in sorted(glob.glob(os.path.join(folder, '*.mbl'))):
+		if not os.path.exists(os.path.splitext(mbl_path)[0] + SNAPSHOT_EXTENSION):
+			converted.append(convert_mbl(mbl_path))
+	return converted
+
+
+if __name__ == '__main__':
+	# python -m mbp.snapshot [FOLDER] converts all .mbl files in FOLDER (mbls/ by default) to snapshot files
+	for path in convert_mbls(*sys.argv[1:2]):
+		print('Converted', path)
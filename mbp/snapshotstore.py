@@ -0,0 +1,323 @@
+import bisect
+import datetime
+import glob
+import json
+import os
+import shutil
+
+from mbp import plist
+from mbp.musicbeelibrary import MBLibrary, SNAPSHOT_EXTENSION, read_library_file
+
+DELTA_EXTENSION = '.mbd'
+DELTA_VERSION = 1
+
+# Tags a delta stores for tracks that are still in the library, any other change stores the track as removed and added
+DELTA_TAGS = ('track_id', 'play_count', 'play_date')
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+# NaT as int64 seconds, numpy is only imported when libraries are compared
+_NAT_SECONDS = -2 ** 63
+
+
+def date_stamp(date):
+	"""Returns the YYYYMMDD stamp used in the file names of the snapshots of date."""
+	return '{:0>4}{:0>2}{:0>2}'.format(date.year, date.month, date.day)
+
+
+def parse_stamp(stamp):
+	"""Returns the datetime.date of a YYYYMMDD stamp."""
+	return datetime.date(int(stamp[0:4]), int(stamp[4:6]), int(stamp[6:8]))
+
+
+def _comparable(columns, tag):
+	"""Returns the values of tag in columns as an array that can be compared: strings for categorical tags and
+	seconds for dates, so missing values compare equal."""
+	import numpy as np
+
+	from mbp.columnar import CATEGORICAL, DATES
+
+	if tag in CATEGORICAL:
+		return columns.strings(tag)
+	if tag in DATES:
+		return np.asarray(columns.get(tag)).view(np.int64)
+	return np.asarray(columns.get(tag))
+
+
+def _to_json(value, tag):
+	"""Converts a value from _comparable to a JSON compatible value, dates become plist date strings."""
+	from mbp.columnar import DATES
+
+	if tag in DATES:
+		return None if value == _NAT_SECONDS else plist.encode_date(_EPOCH + datetime.timedelta(seconds=value))
+	return value
+
+
+class SnapshotIndex:
+	"""
+	SnapshotIndex is a sorted index of the dates that have a saved library in a folder, persisted in the folder so it
+	only has to be built from the files once. It is rebuilt when the folder has changed since the index was written.
+	"""
+
+	FILE_NAME = 'index.txt'
+	# If a date has several files the first of these is used
+	EXTENSIONS = (SNAPSHOT_EXTENSION, DELTA_EXTENSION, '.mbl')
+
+	def __init__(self, folder):
+		self.folder = folder
+		self.file_path = os.path.join(folder, self.FILE_NAME)
+		self.dates = []
+		self.names = []
+		self.read()
+
+	def read(self):
+		"""Reads the index from disk, or builds it from the files in the folder if it is missing or out of date."""
+		try:
+			with open(self.file_path, 'r', encoding='utf-8') as index_file:
+				folder_mtime = int(index_file.readline())
+				if folder_mtime == os.stat(self.folder).st_mtime_ns:
+					entries = [line.split() for line in index_file]
+					self.dates = [parse_stamp(stamp) for stamp, _ in entries]
+					self.names = [name for _, name in entries]
+					return
+		except (IOError, ValueError):
+			pass
+
+		self.rebuild()
+
+	def rebuild(self):
+		"""Builds the index from the files in the folder and saves it."""
+		best = {}
+		for priority, extension in enumerate(self.EXTENSIONS):
+			for path in glob.glob(os.path.join(self.folder, '*' + extension)):
+				name = os.path.basename(path)
+				stamp = name[:-len(extension)]
+				if len(stamp) == 8 and stamp.isdigit() and (stamp not in best or priority < best[stamp][0]):
+					best[stamp] = (priority, name)
+
+		stamps = sorted(best)
+		self.dates = [parse_stamp(stamp) for stamp in stamps]
+		self.names = [best[stamp][1] for stamp in stamps]
+		self.save()
+
+	def save(self):
+		"""Saves the index, together with the modification time of the folder so later changes are noticed."""
+		if not os.path.exists(self.folder):
+			return
+
+		# Make sure the index file exists first, creating it changes the modification time of the folder
+		open(self.file_path, 'a').close()
+		folder_mtime = os.stat(self.folder).st_mtime_ns
+
+		with open(self.file_path, 'r+', encoding='utf-8') as index_file:
+			index_file.write('{}\n'.format(folder_mtime))
+			for date, name in zip(self.dates, self.names):
+				index_file.write('{} {}\n'.format(date_stamp(date), name))
+			index_file.truncate()
+
+	def add(self, date, name):
+		"""Adds the file name of the library saved for date to the index and saves it."""
+		i = bisect.bisect_left(self.dates, date)
+		if i < len(self.dates) and self.dates[i] == date:
+			self.names[i] = name
+		else:
+			self.dates.insert(i, date)
+			self.names.insert(i, name)
+		self.save()
+
+	def get_path(self, date):
+		"""Returns the path of the file saved for date, or None."""
+		i = bisect.bisect_left(self.dates, date)
+		if i < len(self.dates) and self.dates[i] == date:
+			return os.path.join(self.folder, self.names[i])
+		return None
+
+	def closest(self, date, after=False):
+		"""
+		Returns the (date, path) of the saved library closest to date, or None if there is none.
+		:param date: datetime.date to look for
+		:param after: False to look on or before date, True to look on or after date
+		"""
+		if after:
+			i = bisect.bisect_left(self.dates, date)
+		else:
+			i = bisect.bisect_right(self.dates, date) - 1
+
+		if 0 <= i < len(self.dates):
+			return self.dates[i], os.path.join(self.folder, self.names[i])
+		return None
+
+	def range(self, start, end):
+		"""Yields the (date, path) of every saved library from start up to and including end."""
+		for i in range(bisect.bisect_left(self.dates, start), bisect.bisect_right(self.dates, end)):
+			yield self.dates[i], os.path.join(self.folder, self.names[i])
+
+
+class SnapshotStore:
+	"""
+	SnapshotStore saves a library for every day in a folder, without storing a full copy for every day.
+	Every keyframe_interval days a full snapshot (keyframe) is written, on the days in between only a delta against the
+	last keyframe is written: the new track ids, play counts and play dates of tracks that changed, and the tracks that
+	were added or removed. Loading a day takes one keyframe and at most one delta, however far the day is from the
+	keyframe.
+	"""
+
+	def __init__(self, folder='mbls/', keyframe_interval=7):
+		"""
+		:param folder: folder the snapshots are stored in
+		:param keyframe_interval: maximum number of days between two keyframes
+		"""
+		self.folder = folder
+		self.keyframe_interval = keyframe_interval
+		self.index = SnapshotIndex(folder)
+
+	def get_path(self, date, extension):
+		return os.path.join(self.folder, date_stamp(date) + extension)
+
+	def find_keyframe(self, date):
+		"""Returns the path of the latest keyframe (snapshot or .mbl file) on or before date, or None if there is none."""
+		i = bisect.bisect_right(self.index.dates, date) - 1
+		while i >= 0 and self.index.names[i].endswith(DELTA_EXTENSION):
+			i -= 1
+		return os.path.join(self.folder, self.index.names[i]) if i >= 0 else None
+
+	def find_path(self, date):
+		"""Returns the path of the snapshot or delta of date, or None if nothing was saved on date."""
+		return self.index.get_path(date)
+
+	def save(self, mblibrary, date):
+		"""Saves mblibrary as the library of date, as a keyframe or as a delta against the last keyframe. Returns the
+		path of the written file."""
+		if not os.path.exists(self.folder):
+			os.makedirs(self.folder)
+
+		keyframe_path = self.find_keyframe(date - datetime.timedelta(days=1))
+
+		if not keyframe_path or (date - parse_stamp(os.path.basename(keyframe_path)[:8])).days >= self.keyframe_interval:
+			path = self.get_path(date, SNAPSHOT_EXTENSION)
+			from mbp.snapshot import write_snapshot
+			write_snapshot(mblibrary.columns, path)
+		else:
+			delta = self.create_delta(read_library_file(keyframe_path).columns, mblibrary.columns)
+			delta['keyframe'] = os.path.basename(keyframe_path)
+
+			path = self.get_path(date, DELTA_EXTENSION)
+			with open(path, 'w', encoding='utf-8') as delta_file:
+				json.dump(delta, delta_file)
+
+		self.index.add(date, os.path.basename(path))
+		return path
+
+	def save_unchanged(self, date):
+		"""Saves the library saved last before date again as the library of date, without reading it: as a copy of its
+		delta, or as a delta without changes if it is a keyframe. Returns the path of the written file."""
+		previous = self.index.closest(date - datetime.timedelta(days=1))
+		if not previous:
+			raise ValueError(f'No library saved before {date_stamp(date)} in {self.folder}')
+
+		path = self.get_path(date, DELTA_EXTENSION)
+		if previous[1].endswith(DELTA_EXTENSION):
+			shutil.copyfile(previous[1], path)
+		else:
+			with open(path, 'w', encoding='utf-8') as delta_file:
+				json.dump({'version': DELTA_VERSION, 'changed': [], 'removed': [], 'added': [], 'keyframe': os.path.basename(previous[1])}, delta_file)
+
+		self.index.add(date, os.path.basename(path))
+		return path
+
+	@staticmethod
+	def create_delta(keyframe, columns):
+		"""
+		Returns the delta that turns the ColumnarLibrary keyframe into the ColumnarLibrary columns, as a JSON compatible
+		dict of 'changed': [[key, track_id, play_count, play_date], ...], 'removed': [key, ...], 'added': [record, ...]
+		Keys are the ones of ColumnarLibrary.keys, records are tracks as stored in .mbl files.
+		"""
+		import numpy as np
+
+		old_keys = keyframe.keys()
+		new_keys = columns.keys()
+		old_index = {key: i for i, key in enumerate(old_keys)}
+
+		# Row in the keyframe of every track in columns that has a track with the same key in the keyframe
+		old_rows = np.array([old_index.get(key, -1) for key in new_keys], dtype=np.int64)
+		new_rows = np.flatnonzero(old_rows >= 0)
+		old_rows = old_rows[new_rows]
+
+		# Tracks are only kept if all tags but the DELTA_TAGS are equal
+		kept = np.ones(len(new_rows), dtype=bool)
+		for tag in columns.columns:
+			if tag not in DELTA_TAGS:
+				kept &= _comparable(keyframe, tag)[old_rows] == _comparable(columns, tag)[new_rows]
+		old_rows = old_rows[kept]
+		new_rows = new_rows[kept]
+
+		# Of those, only the tracks whose DELTA_TAGS differ are stored
+		differs = np.zeros(len(new_rows), dtype=bool)
+		for tag in DELTA_TAGS:
+			differs |= _comparable(keyframe, tag)[old_rows] != _comparable(columns, tag)[new_rows]
+		changed_rows = new_rows[differs]
+		changed_values = [[_to_json(v, tag) for v in _comparable(columns, tag)[changed_rows].tolist()] for tag in DELTA_TAGS]
+		changed = [[list(new_keys[row])] + list(values) for row, *values in zip(changed_rows.tolist(), *changed_values)]
+
+		is_added = np.ones(len(columns), dtype=bool)
+		is_added[new_rows] = False
+		added = [json.loads(str(t)) for t in columns.take(is_added).to_tracks()]
+
+		is_removed = np.ones(len(keyframe), dtype=bool)
+		is_removed[old_rows] = False
+		removed = [list(old_keys[i]) for i in np.flatnonzero(is_removed).tolist()]
+
+		return {'version': DELTA_VERSION, 'changed': changed, 'removed': removed, 'added': added}
+
+	@staticmethod
+	def apply_delta(keyframe, delta):
+		"""Returns the ColumnarLibrary that results from applying delta (see create_delta) to the keyframe. Tracks keep
+		the order of the keyframe, added tracks come last."""
+		import numpy as np
+
+		from mbp.columnar import ColumnarLibrary, DATES
+
+		index = {key: i for i, key in enumerate(keyframe.keys())}
+
+		columns = dict(keyframe.columns)
+		if delta['changed']:
+			rows = np.array([index[tuple(change[0])] for change in delta['changed']], dtype=np.int64)
+			for n, tag in enumerate(DELTA_TAGS):
+				values = [change[n + 1] for change in delta['changed']]
+				if tag in DATES:
+					values = np.array([plist.decode_date(v) if v else None for v in values], dtype=columns[tag].dtype)
+				column = np.array(columns[tag])
+				column[rows] = values
+				columns[tag] = column
+
+		result = ColumnarLibrary(columns, keyframe.categories)
+
+		if delta['removed']:
+			keep = np.ones(len(result), dtype=bool)
+			keep[[index[tuple(key)] for key in delta['removed']]] = False
+			result = result.take(keep)
+
+		if delta['added']:
+			result = result.concat(ColumnarLibrary.from_records(delta['added']))
+
+		return result
+
+	def load_columns(self, date):
+		"""Returns the ColumnarLibrary saved for date, raises a FileNotFoundError if nothing was saved on date."""
+		path = self.find_path(date)
+		if not path:
+			raise FileNotFoundError(f'No snapshot saved for {date_stamp(date)} in {self.folder}')
+
+		if not path.endswith(DELTA_EXTENSION):
+			return read_library_file(path).columns
+
+		with open(path, 'r', encoding='utf-8') as delta_file:
+			delta = json.load(delta_file)
+		if delta['version'] > DELTA_VERSION:
+			raise ValueError(f'{path} has delta version {delta["version"]}, only up to {DELTA_VERSION} is supported')
+
+		keyframe = read_library_file(os.path.join(self.folder, delta['keyframe'])).columns
+		return self.apply_delta(keyframe, delta)
+
+	def load(self, date, tagtrackers=None):
+		"""Returns the MBLibrary saved for date, evaluated with tagtrackers."""
+		return MBLibrary(columns=self.load_columns(date), tagtrackers=tagtrackers)
@@ -0,0 +1,42 @@
+import numpy as np
+
+# Tags a LibrarySummary needs columns of
+SUMMARY_TAGS = ('size', 'total_time', 'play_count')
+
+
+class LibrarySummary:
+	"""
+	LibrarySummary holds the totals of a library, computed once from its columns:
+	track_count, played_track_count (tracks played at least once), total_size (bytes), total_play_count, mean_play_count, total_time and total_play_time (ms), and the
+	name, play count and total time of the most played track.
+	"""
+
+	def __init__(self, columns, tracks=None):
+		"""
+		:param columns: ColumnarLibrary with at least the SUMMARY_TAGS, and name if tracks is omitted
+		:param tracks: list of the Tracks of the same library, the name of the most played track is read from it
+		"""
+		play_count = np.asarray(columns.get('play_count'))
+		total_time = np.asarray(columns.get('total_time'))
+
+		self.track_count = len(play_count)
+		self.played_track_count = int((play_count > 0).sum())
+		self.total_size = int(np.asarray(columns.get('size')).sum())
+		self.total_play_count = int(play_count.sum())
+		self.mean_play_count = self.total_play_count / self.track_count if self.track_count else 0
+		self.total_time = int(total_time.sum())
+		self.total_play_time = int((play_count * total_time).sum())
+
+		# The first track with the highest play count, like max(tracks)
+		self.most_played_name = None
+		self.most_played_play_count = 0
+		self.most_played_total_time = 0
+		if self.track_count:
+			i = int(np.argmax(play_count))
+			if tracks is not None:
+				self.most_played_name = tracks[i].name
+			else:
+				code = int(columns.get('name')[i])
+				self.most_played_name = columns.categories['name'][code] if code >= 0 else None
+			self.most_played_play_count = int(play_count[i])
+			self.most_played_total_time = int(total_time[i])
@@ -1,3 +1,14 @@
+def _product(track, tags):
+	"""Returns the product of the values of tags in track, or None if any of them is None."""
+	result = 1
+	for tag in tags:
+		value = track.get(tag)
+		if value is None:
+			return None
+		result *= value
+	return result
+
+
 class TagTracker:
 	"""A TagTracker tracks a certain tag.
 	Arguments:
@@ -27,15 +38,27 @@ class TagTracker:
 
 	Counts the number of songs that start with a particular letter:
 	TagTracker(tag=lambda t: t.get('name')[0])
+
+	When tag is a str and tag_data is a str, a tuple of str (their product is tracked) or omitted, the TagTracker is
+	declarative and can be evaluated for a whole library at once with evaluate_columns, e.g.:
+	TagTracker('artist', ('play_count', 'total_time'), unique=False)
 	"""
 	def __init__(self, tag, tag_data=None, unique=True, case_sensitive=False):
+		# Names of the tags used, only set if they are plain tags so the tracker can be evaluated on columns
+		self.key_tag = tag if isinstance(tag, str) else None
+		self.data_tags = None
+
 		if isinstance(tag, str):
 			self.tag = lambda t: t.get(tag)
 		else:
 			self.tag = tag
 
 		if isinstance(tag_data, str):
+			self.data_tags = (tag_data,)
 			self.tag_data = lambda t: t.get(tag_data)
+		elif isinstance(tag_data, tuple):
+			self.data_tags = tag_data
+			self.tag_data = lambda t: _product(t, tag_data)
 		else:
 			self.tag_data = tag_data
 
@@ -47,48 +70,137 @@ class TagTracker:
 	def evaluate(self, track):
 		"""Evaluates the given Track for the sought after tag. If the tag is found, and there is data in tag_data,
 		it is added to the tracker. """
+		key = self.tag(track)
+		value = self.tag_data(track) if self.tag_data else None
+
+		# If the track has the tag that we are tracking and it has the relevant data, add it
+		# is not None because if value returns False for value = 0
+		if key is None or (self.tag_data and value is None):
+			return
+
+		if not self.case_sensitive and isinstance(key, str):
+			# Use the capitalization we have seen first
+			key = self.case_map.setdefault(key.lower(), key)
+
 		if self.tag_data:
-			# If the track has the tag that we are tracking and it has the relevant data, add it
-			key = self.tag(track)
-			value = self.tag_data(track)
-
-			if key is not None and value is not None:  # is not None because if value returns False for value = 0
-				if not self.case_sensitive and isinstance(key, str) and key.lower() in self.case_map.keys():
-					key = self.case_map[key.lower()]
-				elif not self.case_sensitive and isinstance(key, str):
-					self.case_map[key.lower()] = key
-
-				# Check if this is a new tag we track
-				if key in self.data.keys():
-					# If not, add up if it's a number, otherwise append to list
-					if not self.unique and (isinstance(value, int) or isinstance(value, float)):
-						self.data[key] += value
-					else:
-						self.data[key].append(value)
-				else:
-					# It's a new tag, add as a new number or list
-					if not self.unique and (isinstance(value, int) or isinstance(value, float)):
-						self.data[key] = value
-					else:
-						self.data[key] = [value]
+			self.add_value(key, value)
 		else:
-			value = self.tag(track)
-			if value is not None:
-				if not self.case_sensitive and isinstance(value, str) and value.lower() in self.case_map.keys():
-					value = self.case_map[value.lower()]
-				elif not self.case_sensitive and isinstance(value, str):
-					self.case_map[value.lower()] = value
-
-				if value in self.data.keys():
-					if not self.unique and (isinstance(value, int) or isinstance(value, float)):
-						self.data[value] += value
-					else:
-						self.data[value] += 1
-				else:
-					if not self.unique and (isinstance(value, int) or isinstance(value, float)):
-						self.data[value] = value
-					else:
-						self.data[value] = 1
+			self.add_count(key)
+
+	def add_value(self, key, value):
+		"""Adds value under key, which has already been extracted and case normalized."""
+		# Check if this is a new tag we track
+		if key in self.data:
+			# If not, add up if it's a number, otherwise append to list
+			if not self.unique and (isinstance(value, int) or isinstance(value, float)):
+				self.data[key] += value
+			else:
+				self.data[key].append(value)
+		else:
+			# It's a new tag, add as a new number or list
+			if not self.unique and (isinstance(value, int) or isinstance(value, float)):
+				self.data[key] = value
+			else:
+				self.data[key] = [value]
+
+	def add_count(self, key):
+		"""Counts an occurrence of key, which has already been extracted and case normalized."""
+		if key in self.data:
+			if not self.unique and (isinstance(key, int) or isinstance(key, float)):
+				self.data[key] += key
+			else:
+				self.data[key] += 1
+		else:
+			if not self.unique and (isinstance(key, int) or isinstance(key, float)):
+				self.data[key] = key
+			else:
+				self.data[key] = 1
+
+	def is_declarative(self):
+		"""Whether this TagTracker only uses plain tags and can be evaluated with evaluate_columns."""
+		return self.key_tag is not None and (self.tag_data is None or self.data_tags is not None)
+
+	def get_tags(self):
+		"""Returns the names of the plain tags this TagTracker uses."""
+		tags = [self.key_tag] if self.key_tag is not None else []
+		return tags + list(self.data_tags) if self.data_tags else tags
+
+	def evaluate_columns(self, columns):
+		"""
+		Evaluates a whole ColumnarLibrary at once with a vectorized group-by, giving the same data as calling evaluate
+		for every track. Only possible for declarative TagTrackers that have not evaluated anything yet.
+		:param columns: ColumnarLibrary to evaluate
+		:return: True if the columns were evaluated, False if evaluate has to be used for every track instead
+		"""
+		from mbp import columnar
+		import numpy as np
+
+		if not self.is_declarative() or self.data:
+			return False
+		if self.key_tag not in columnar.NUMERIC and self.key_tag not in columnar.CATEGORICAL:
+			return False
+		if self.data_tags and any(tag not in columnar.NUMERIC for tag in self.data_tags):
+			return False
+		if any(tag not in columns.columns for tag in self.get_tags()):
+			return False
+
+		keys = columns.get(self.key_tag)
+		is_string = self.key_tag in columnar.CATEGORICAL
+
+		if is_string:
+			# Missing strings are None and are not tracked
+			rows = np.flatnonzero(keys >= 0)
+			codes = keys[rows]
+			if self.case_sensitive:
+				groups = codes
+			else:
+				# Factorize the lower case strings, so differently capitalized strings share a group
+				lower_ids = {}
+				fold = np.array([lower_ids.setdefault(c.lower(), len(lower_ids)) for c in columns.categories[self.key_tag]], dtype=np.int64)
+				groups = fold[codes] if len(fold) else codes
+		else:
+			rows = np.arange(len(keys))
+			groups = keys
+
+		uniques, first, inverse = np.unique(groups, return_index=True, return_inverse=True)
+		inverse = inverse.reshape(-1)
+
+		# Groups are stored in order of the first track that has them, like evaluate does
+		order = np.argsort(first, kind='stable')
+		rank = np.empty(len(order), dtype=np.int64)
+		rank[order] = np.arange(len(order))
+		group_of_row = rank[inverse]
+		first_rows = rows[first[order]]
+
+		# The first capitalization of a string that is seen is used as key, unless the case map already has one
+		if is_string:
+			strings = columns.categories[self.key_tag]
+			group_keys = [strings[c] for c in keys[first_rows].tolist()]
+			if not self.case_sensitive:
+				group_keys = [self.case_map.setdefault(key.lower(), key) for key in group_keys]
+		else:
+			group_keys = keys[first_rows].tolist()
+
+		if self.tag_data is None:
+			counts = np.bincount(group_of_row, minlength=len(group_keys))
+			if not self.unique and not is_string:
+				# Numbers are summed up, which is the number itself for every time it occurs
+				self.data = dict(zip(group_keys, (np.asarray(group_keys, dtype=np.int64) * counts).tolist()))
+			else:
+				self.data = dict(zip(group_keys, counts.tolist()))
+			return True
+
+		values = columns.product(*self.data_tags)[rows]
+		if not self.unique:
+			sums = np.zeros(len(group_keys), dtype=values.dtype)
+			np.add.at(sums, group_of_row, values)
+			self.data = dict(zip(group_keys, sums.tolist()))
+		else:
+			# Lists of values in track order for every group
+			by_group = np.argsort(group_of_row, kind='stable')
+			bounds = np.cumsum(np.bincount(group_of_row, minlength=len(group_keys)))[:-1]
+			self.data = {key: part.tolist() for key, part in zip(group_keys, np.split(values[by_group], bounds))}
+		return True
 
 	def reset(self):
 		"""
@@ -141,3 +253,56 @@ class TagTracker:
 		r = TagTracker(self.tag, self.tag_data, self.unique, self.case_sensitive)
 		r.data = self.data
 		return r
+
+
+class TagTrackerPlan:
+	"""
+	A TagTrackerPlan evaluates several TagTrackers in a single pass over the tracks.
+	TagTrackers are grouped by their tag (the same tag name, or the same function), so for every track the key is
+	extracted and case normalized only once per group, after which every TagTracker in the group adds its data.
+
+	TagTrackers in a group share one case map: the first capitalization of a key seen by any of them is used by all.
+	"""
+
+	def __init__(self, tagtrackers):
+		groups = {}
+		for tt in tagtrackers:
+			# Plain tags are grouped by name, functions by identity
+			group_id = (tt.key_tag if tt.key_tag is not None else tt.tag, tt.case_sensitive)
+			groups.setdefault(group_id, []).append(tt)
+
+		self.groups = []
+		for trackers in groups.values():
+			# Start from whatever the trackers have seen before
+			case_map = {}
+			for tt in trackers:
+				for lower, key in tt.case_map.items():
+					case_map.setdefault(lower, key)
+			# Bound methods are looked up once here instead of for every track
+			adders = [(tt.tag_data, tt.add_value) if tt.tag_data else (None, tt.add_count) for tt in trackers]
+			self.groups.append((trackers[0].tag, trackers[0].case_sensitive, case_map, trackers, adders))
+
+	def evaluate(self, track):
+		"""Evaluates the given Track for every TagTracker in this plan."""
+		for tag, case_sensitive, case_map, _, adders in self.groups:
+			key = tag(track)
+
+			if key is None:
+				continue
+
+			if not case_sensitive and isinstance(key, str):
+				key = case_map.setdefault(key.lower(), key)
+
+			for tag_data, add in adders:
+				if tag_data:
+					value = tag_data(track)
+					if value is not None:
+						add(key, value)
+				else:
+					add(key)
+
+	def finish(self):
+		"""Stores the shared case maps in the TagTrackers, call after the last evaluate."""
+		for _, _, case_map, trackers, _ in self.groups:
+			for tt in trackers:
+				tt.case_map = dict(case_map)
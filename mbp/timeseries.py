@@ -0,0 +1,46 @@
+import numpy as np
+
+from mbp.aggregates import DailyAggregates
+from mbp.snapshotstore import SnapshotStore
+
+
+class PlayTimeSeries:
+	"""
+	PlayTimeSeries holds the time played per day for every value of a tag (e.g. every artist) over a period.
+
+	The play time of every day is read from the DailyAggregates of the saved libraries, which are computed first for the
+	days that have none yet. Values are grouped like TagTracker does, differently capitalized values are one value.
+	"""
+
+	def __init__(self, start_date, end_date, tag='artist', store=None):
+		"""
+		:param start_date: datetime.date first day of the period
+		:param end_date: datetime.date last day of the period, inclusive
+		:param tag: tag to split the play time over, one of aggregates.DIMENSIONS
+		:param store: SnapshotStore to read the libraries from, the one in mbls/ if omitted
+		"""
+		self.start_date = start_date
+		self.end_date = end_date
+		self.tag = tag
+		self.store = store if store else SnapshotStore('mbls/')
+
+		self.total_days = (end_date - start_date).days + 1
+		# Values of tag, in the order of the columns of matrix
+		self.keys = []
+		# Minutes played per day (rows) per value of tag (columns)
+		self.matrix = np.zeros((self.total_days, 0))
+
+		self.build()
+
+	def build(self):
+		"""Fills the matrix from the daily aggregates of the period."""
+		aggregates = DailyAggregates(self.store.folder)
+		aggregates.backfill(store=self.store)
+
+		self.keys, play_time = aggregates.get_matrix(self.tag, self.start_date, self.end_date, value=1)
+		self.matrix = play_time / 60000
+
+	def get_totals(self):
+		"""Returns a dict of every value of tag to its minutes played over the whole period, highest first."""
+		totals = self.matrix.sum(axis=0)
+		return {self.keys[i]: totals[i].item() for i in np.argsort(-totals, kind='stable')}
@@ -1,8 +1,14 @@
 import json
 import re
+from types import MappingProxyType
+
+from mbp import plist
 
 TAGS = ['Track ID', 'Name', 'Artist', 'Album', 'Genre', 'Year', 'Size', 'Total Time', 'Date Added', 'Play Count', 'Play Date UTC', 'Location', 'Bit Rate']
 TAG_NAMES = ['track_id', 'name', 'artist', 'album', 'genre', 'year', 'size', 'total_time', 'date_added', 'play_count', 'play_date', 'location', 'bitrate']
+# Maps the keys in the iTunes XML file to the names used in Track
+TAG_MAP = dict(zip(TAGS, TAG_NAMES))
+_TAG_SET = frozenset(TAG_NAMES)
 
 
 def encode_track(track):
@@ -17,6 +23,9 @@ def encode_track(track):
 class Track:
 	"""Track is a data storage class for all data regarding a single track."""
 
+	# Fixed layout, every tag is a slot so a Track has no per-instance dict
+	__slots__ = tuple(TAG_NAMES)
+
 	def __init__(self, track_id=-1, name=None, artist=None, album=None, genre=None, year=0, size=0, total_time=0, date_added=None, play_count=0, play_date=None, location=None, bitrate=0):
 		"""Initializes a Track object with specified data."""
 		if isinstance(year, str):
@@ -27,25 +36,49 @@ class Track:
 			else:
 				year = 0
 
-		self.data = {
-			'track_id': int(track_id),
-			'name': name,
-			'artist': artist,
-			'album': album,
-			'genre': genre,
-			'year': int(year),
-			'size': int(size),
-			'total_time': int(total_time),
-			'date_added': date_added,
-			'play_count': int(play_count),
-			'play_date': play_date,
-			'location': location,
-			'bitrate': int(bitrate)
-		}
+		# Dates are stored as datetimes, .mbl files store them as strings
+		if isinstance(date_added, str):
+			date_added = plist.decode_date(date_added)
+		if isinstance(play_date, str):
+			play_date = plist.decode_date(play_date)
+
+		self.track_id = int(track_id)
+		self.name = name
+		self.artist = artist
+		self.album = album
+		self.genre = genre
+		self.year = int(year)
+		self.size = int(size)
+		self.total_time = int(total_time)
+		self.date_added = date_added
+		self.play_count = int(play_count)
+		self.play_date = play_date
+		self.location = location
+		self.bitrate = int(bitrate)
+
+	@property
+	def data(self):
+		"""Returns the data of this Track as a read-only mapping of tag name to value, writing to it raises a TypeError.
+		Set tags on the Track itself or assign a dict to data instead."""
+		return MappingProxyType({tag: getattr(self, tag) for tag in TAG_NAMES})
+
+	@data.setter
+	def data(self, data):
+		for tag, value in data.items():
+			if tag in _TAG_SET:
+				setattr(self, tag, value)
+
+	@property
+	def identity(self):
+		"""
+		Returns the identity of this Track: a hash of name, artist, album and size, the tags encode_track uses.
+		It is computed on every call, so it is never out of date after a tag was set.
+		"""
+		return hash((self.name, self.artist, self.album, self.size))
 
 	def get(self, identifier_string):
-		if identifier_string in TAG_NAMES:
-			return self.data[identifier_string]
+		if identifier_string in _TAG_SET:
+			return getattr(self, identifier_string)
 		return None
 
 	# # Comparison functions
@@ -54,40 +87,40 @@ class Track:
 	#
 	# Comparison of play counts
 	def __ne__(self, other):
-		return self.data['play_count'] != other.data['play_count']
+		return self.play_count != other.play_count
 
 	def __lt__(self, other):
-		return self.data['play_count'] < other.data['play_count']
+		return self.play_count < other.play_count
 
 	def __le__(self, other):
-		return self.data['play_count'] <= other.data['play_count']
+		return self.play_count <= other.play_count
 
 	def __gt__(self, other):
-		return self.data['play_count'] > other.data['play_count']
+		return self.play_count > other.play_count
 
 	def __ge__(self, other):
-		return self.data['play_count'] >= other.data['play_count']
+		return self.play_count >= other.play_count
 
 	# to String
 	def __str__(self):
-		return json.dumps(self.data)
+		return json.dumps(dict(self.data), default=plist.encode_date)
 
 	# Addition functions
 	def __add__(self, other):
-		return Track(play_count=self.data['play_count'] + other.data['play_count'], size=self.data['size'] + other.data['size'], total_time=self.data['total_time'] + other.data['total_time'])
+		return Track(play_count=self.play_count + other.play_count, size=self.size + other.size, total_time=self.total_time + other.total_time)
 
 	def __radd__(self, other):
 		if other == 0:
-			return Track(play_count=self.data['play_count'], size=self.data['size'], total_time=self.data['total_time'])
+			return Track(play_count=self.play_count, size=self.size, total_time=self.total_time)
 		return self.__add__(other)
 
 	# Subtraction functions
 	def __sub__(self, other):
-		return Track(play_count=self.data['play_count'] - other.data['play_count'], size=self.data['size'] - other.data['size'], total_time=self.data['total_time'] - other.data['total_time'])
+		return Track(play_count=self.play_count - other.play_count, size=self.size - other.size, total_time=self.total_time - other.total_time)
 
 	def __rsub__(self, other):
 		if other == 0:
-			return Track(play_count=self.data['play_count'], size=self.data['size'], total_time=self.data['total_time'])
+			return Track(play_count=self.play_count, size=self.size, total_time=self.total_time)
 		return self.__add__(other)
 
 	# Equality operator
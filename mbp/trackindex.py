@@ -0,0 +1,70 @@
+import itertools
+import operator
+
+from mbp.track import TAG_NAMES
+
+# Tags tracks are bucketed on, every pair of them is a bucket
+BUCKET_TAGS = ('name', 'artist', 'album', 'location')
+
+_bucket_values = operator.attrgetter(*BUCKET_TAGS)
+_PAIRS = list(itertools.combinations(range(len(BUCKET_TAGS)), 2))
+
+
+class TrackIndex:
+	"""
+	TrackIndex answers whether a library contains a Track without comparing it to every track of the library.
+	A track is contained if a track of the library has the same name and artist, or is equal to it (Track.__eq__).
+
+	Track.__eq__ needs 80% of the tags both tracks have to be equal, so two tracks that both have all BUCKET_TAGS
+	can only be equal if at least two of those are equal. Tracks are therefore put in a bucket for every pair of
+	BUCKET_TAGS, and only the tracks in the buckets of a track are compared with it. Tracks that miss any of the
+	BUCKET_TAGS are compared with every track, like before.
+	"""
+
+	def __init__(self, tracks):
+		"""
+		:param tracks: list of Tracks to index
+		"""
+		self.tracks = tracks
+		self.names = set()
+		self.buckets = {}
+		# Tracks that miss one of the BUCKET_TAGS, they are candidates for every track
+		self.sparse = []
+
+		for t in tracks:
+			self.names.add((t.name, t.artist))
+			keys = self.bucket_keys(t)
+			if keys:
+				for key in keys:
+					self.buckets.setdefault(key, []).append(t)
+			else:
+				self.sparse.append(t)
+
+	@staticmethod
+	def bucket_keys(track):
+		"""Returns the keys of the buckets of track, or None if track misses one of the BUCKET_TAGS."""
+		values = _bucket_values(track)
+		if not all(values):
+			return None
+		return [(i, j, values[i], values[j]) for i, j in _PAIRS]
+
+	def candidates(self, track):
+		"""Returns the tracks that can be equal to track."""
+		keys = self.bucket_keys(track)
+		if not keys:
+			# With at most 4 tags to compare a single different tag is below 80%, so a track with a name and artist can
+			# only be equal to tracks with the same name and artist, which contains checks first, or to sparse tracks
+			if track.name and track.artist and sum(1 for tag in TAG_NAMES if tag not in ('play_count', 'play_date') and track.get(tag)) <= 4:
+				return self.sparse
+			return self.tracks
+
+		candidates = {}
+		for key in keys:
+			for t in self.buckets.get(key, []):
+				candidates[id(t)] = t
+		return list(candidates.values()) + self.sparse
+
+	def contains(self, track):
+		if (track.name, track.artist) in self.names:
+			return True
+		return any(t == track for t in self.candidates(track))
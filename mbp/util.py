@@ -1,7 +1,5 @@
 import os
 
-import numpy as np
-
 
 def create_path(path):
 	"""Creates path if it does not exist yet. Returns path."""
@@ -19,4 +17,6 @@ def create_path(path):
 
 
 def moving_average(x, w):
+	# numpy is imported here so mbp.config, which uses this module, does not import it
+	import numpy as np
 	return np.convolve(x, np.ones(w), 'valid') / w
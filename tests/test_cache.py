@@ -0,0 +1,135 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from lastfm.cache import ResponseCache, make_key
+
+RESPONSE = {'similartracks': {'track': [{'name': 'Song', 'artist': {'name': 'Artist'}, 'match': '0.5'}]}}
+
+
+def args(i):
+	return [['artist', 'Artist'], ['track', 'Song {}'.format(i)]]
+
+
+class Clock:
+	"""Stands in for time.time in lastfm.cache, so the order of accesses does not depend on the resolution of the clock."""
+
+	def __init__(self, now=1000.0):
+		self.now = now
+
+	def __call__(self):
+		return self.now
+
+	def tick(self, seconds=1.0):
+		self.now += seconds
+
+
+class TestResponseCache(unittest.TestCase):
+
+	def setUp(self):
+		self.folder = tempfile.TemporaryDirectory()
+		self.file_path = os.path.join(self.folder.name, 'cache.db')
+		self.clock = Clock()
+		patcher = mock.patch('lastfm.cache.time.time', self.clock)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def tearDown(self):
+		self.folder.cleanup()
+
+	def accessed(self, method, request_args):
+		"""Returns the access time of a response as stored on disk, read with a connection of its own."""
+		connection = sqlite3.connect(self.file_path)
+		try:
+			return connection.execute('SELECT accessed FROM responses WHERE key = ?', (make_key(method, request_args),)).fetchone()[0]
+		finally:
+			connection.close()
+
+	def test_get_returns_stored_response(self):
+		with ResponseCache(self.file_path) as cache:
+			self.assertIsNone(cache.get('track.getsimilar', args(0)))
+			cache.put('track.getsimilar', args(0), RESPONSE)
+			# Case and surrounding whitespace of the values are ignored
+			self.assertEqual(cache.get('track.getsimilar', [['track', ' song 0'], ['artist', 'ARTIST']]), RESPONSE)
+			self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+	def test_responses_expire_after_ttl(self):
+		with ResponseCache(self.file_path, ttls={'track.getsimilar': 60}) as cache:
+			cache.put('track.getsimilar', args(0), RESPONSE)
+			cache.put('track.getsimilar', args(1), RESPONSE, created=self.clock.now - 50)
+
+			self.clock.tick(30)
+			self.assertIsNotNone(cache.get('track.getsimilar', args(0)))
+			self.assertIsNone(cache.get('track.getsimilar', args(1)))
+			self.assertEqual([a for a, _, _ in cache.get_all('track.getsimilar')], [sorted([['artist', 'artist'], ['track', 'song 0']])])
+
+			self.clock.tick(31)
+			self.assertIsNone(cache.get('track.getsimilar', args(0)))
+			self.assertEqual(list(cache.get_all('track.getsimilar')), [])
+
+	def test_evict_removes_expired_then_least_recently_used(self):
+		with ResponseCache(self.file_path, ttls={'artist.getinfo': 10}) as cache:
+			cache.put('artist.getinfo', [['artist', 'Expired']], RESPONSE)
+			# Every response has the same size, the cache fits four of them
+			cache.max_size = cache.size * 4
+			for i in range(3):
+				self.clock.tick()
+				cache.put('track.getsimilar', args(i), RESPONSE)
+			self.assertEqual(len(cache), 4)
+
+			# Removing the expired response makes room for song 3
+			self.clock.tick(20)
+			self.assertIsNotNone(cache.get('track.getsimilar', args(0)))
+			cache.put('track.getsimilar', args(3), RESPONSE)
+			self.assertIsNone(cache.get('artist.getinfo', [['artist', 'Expired']]))
+			self.assertEqual(len(cache), 4)
+
+			# Song 0 was used after song 1, which is now the least recently used
+			self.clock.tick()
+			cache.put('track.getsimilar', args(4), RESPONSE)
+			self.assertIsNone(cache.get('track.getsimilar', args(1)))
+			for i in (0, 2, 3, 4):
+				self.assertIsNotNone(cache.get('track.getsimilar', args(i)), i)
+			self.assertLessEqual(cache.size, cache.max_size)
+
+	def test_hit_does_not_write(self):
+		with ResponseCache(self.file_path) as cache:
+			cache.put('track.getsimilar', args(0), RESPONSE)
+			stored = self.accessed('track.getsimilar', args(0))
+			changes = cache.connection.total_changes
+
+			self.clock.tick()
+			self.assertIsNotNone(cache.get('track.getsimilar', args(0)))
+			self.assertEqual(cache.connection.total_changes, changes)
+			self.assertFalse(cache.connection.in_transaction)
+			self.assertEqual(self.accessed('track.getsimilar', args(0)), stored)
+
+			# The access time is written before the next response is stored
+			cache.put('track.getsimilar', args(1), RESPONSE)
+			self.assertEqual(self.accessed('track.getsimilar', args(0)), self.clock.now)
+
+	def test_close_writes_access_times(self):
+		with ResponseCache(self.file_path) as cache:
+			cache.put('track.getsimilar', args(0), RESPONSE)
+			self.clock.tick(5)
+			cache.get('track.getsimilar', args(0))
+			self.assertNotEqual(self.accessed('track.getsimilar', args(0)), self.clock.now)
+
+		self.assertEqual(self.accessed('track.getsimilar', args(0)), self.clock.now)
+		with self.assertRaises(sqlite3.ProgrammingError):
+			cache.get('track.getsimilar', args(0))
+
+	def test_reopened_cache_keeps_responses_and_size(self):
+		with ResponseCache(self.file_path) as cache:
+			cache.put('track.getsimilar', args(0), RESPONSE)
+			size = cache.size
+
+		with ResponseCache(self.file_path) as cache:
+			self.assertEqual(cache.size, size)
+			self.assertEqual(cache.get('track.getsimilar', args(0)), RESPONSE)
+
+
+if __name__ == '__main__':
+	unittest.main()
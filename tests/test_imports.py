@@ -0,0 +1,26 @@
+import os
+import unittest
+
+from benchmark import measure_imports
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+
+# Budget of the import of main.py in ms, the same as the default of python benchmark.py imports
+BUDGET_MS = 100
+
+
+class TestImports(unittest.TestCase):
+	"""main.py is imported by every -saveOnly run, the modules in benchmark.LAZY_MODULES must only be imported by the
+	functions that use them."""
+
+	def test_main_imports_no_lazy_modules(self):
+		_, _, lazy = measure_imports(MAIN)
+		self.assertEqual(lazy, [], 'Imported by main.py, import them in the functions that use them instead')
+
+	def test_main_import_time_within_budget(self):
+		total, _, _ = measure_imports(MAIN)
+		self.assertLessEqual(total, BUDGET_MS)
+
+
+if __name__ == '__main__':
+	unittest.main()
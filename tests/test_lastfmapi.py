@@ -0,0 +1,71 @@
+import time
+import unittest
+
+from lastfm.lastfmapi import LastFMAPI
+from lastfm.ratelimit import TokenBucket
+from lastfm.standin import StandInServer, similar_tracks_fixtures
+from mbp.track import Track
+
+TRACKS = [Track(artist='Artist {}'.format(i % 7), name='Song {}'.format(i)) for i in range(30)]
+
+
+def similar_request(track):
+	return 'track.getsimilar', [['artist', track.artist], ['track', track.name]]
+
+
+class TestTokenBucket(unittest.TestCase):
+
+	def test_acquire_waits_for_tokens(self):
+		bucket = TokenBucket(50, capacity=5)
+		start = time.monotonic()
+		for _ in range(25):
+			bucket.acquire()
+		# The first 5 tokens are there already, the other 20 take 1 / 50 s each
+		self.assertGreaterEqual(time.monotonic() - start, 20 / 50 * 0.9)
+
+
+class TestLastFMAPI(unittest.TestCase):
+
+	def setUp(self):
+		self.fixtures = similar_tracks_fixtures(TRACKS, similar=5)
+
+	def test_request_many_retries_until_every_lookup_succeeds(self):
+		with StandInServer(self.fixtures, latency=0.005, jitter=0.01, error_rate=0.2, seed=1) as standin:
+			api = LastFMAPI('test', api_root=standin.url, workers=8, requests_per_second=1000, retries=6, backoff=0.001)
+			responses = api.request_many([similar_request(t) for t in TRACKS])
+
+			self.assertEqual(responses, [fixture['response'] for fixture in self.fixtures])
+			self.assertGreater(standin.error_count, 0)
+			self.assertEqual(standin.request_count, len(TRACKS) + standin.error_count)
+
+	def test_errors_that_are_not_temporary_are_not_retried(self):
+		with StandInServer(self.fixtures) as standin:
+			api = LastFMAPI('test', api_root=standin.url, backoff=0.001)
+			response = api.request('track.getsimilar', [['artist', 'Unknown'], ['track', 'Unknown']])
+
+			self.assertEqual(response['error'], 6)
+			self.assertEqual(standin.request_count, 1)
+
+	def test_last_error_is_returned_when_retries_run_out(self):
+		with StandInServer(self.fixtures, error_rate=1.0) as standin:
+			api = LastFMAPI('test', api_root=standin.url, retries=2, backoff=0.001)
+			response = api.request(*similar_request(TRACKS[0]))
+
+			self.assertEqual(response['error'], 16)
+			self.assertEqual(standin.request_count, 3)
+
+	def test_request_rate_respects_the_bucket(self):
+		rate = 20
+		with StandInServer(self.fixtures, latency=0.001, error_rate=0.1, seed=2) as standin:
+			api = LastFMAPI('test', api_root=standin.url, workers=8, requests_per_second=rate, retries=6, backoff=0.001)
+			start = time.monotonic()
+			responses = api.request_many([similar_request(t) for t in TRACKS])
+			elapsed = time.monotonic() - start
+
+			self.assertTrue(all('error' not in response for response in responses))
+			# The bucket starts with rate tokens, every request after those waits for a new one
+			self.assertGreaterEqual(elapsed, (standin.request_count - rate) / rate * 0.9)
+
+
+if __name__ == '__main__':
+	unittest.main()
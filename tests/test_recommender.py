@@ -0,0 +1,116 @@
+import json
+import os
+import tempfile
+import unittest
+
+from lastfm.cache import ResponseCache
+from lastfm.lastfmapi import LastFMAPI
+from lastfm.standin import StandInServer
+from mbp.musicbeelibrary import MBLibrary
+from mbp.ranking import Ranking
+from mbp.recommender import Recommender
+from mbp.similaritygraph import SimilarityGraph
+from mbp.tagtracker import TagTracker
+from mbp.track import Track
+
+
+def similar_fixture(artist, name, similars):
+	"""Returns a track.getsimilar fixture of the track by artist named name, similars is a list of (artist, name, match)."""
+	return {
+		'method': 'track.getsimilar',
+		'args': [['artist', artist], ['track', name]],
+		'response': {'similartracks': {'track': [{'name': n, 'artist': {'name': a}, 'match': str(m)} for a, n, m in similars]}},
+	}
+
+
+# A is played 3 times and B once, both are similar to X, the Beatles song is in the library in another capitalization
+FIXTURES = [
+	similar_fixture('A', 'a', [('X', 'x', 0.5), ('Y', 'y', 0.9), ('The Beatles', 'Help', 1.0), ('B', 'b', 0.2)]),
+	similar_fixture('B', 'b', [('X', 'x', 0.5), ('Z', 'z', 0.1)]),
+]
+
+# (artist, name, score, match) in order: score is plays times similarity, match the share of the plays it is similar to
+EXPECTED = [
+	('Y', 'y', 2.7, 0.75),
+	('X', 'x', 2.0, 1.0),
+	('Z', 'z', 0.1, 0.25),
+]
+
+
+def create_library():
+	tracker = TagTracker(lambda t: t, 'play_count', unique=False)
+	library = MBLibrary(tracks=[
+		Track(artist='A', name='a', play_count=3),
+		Track(artist='B', name='b', play_count=1),
+		Track(artist='the beatles ', name='HELP', play_count=0),
+	], tagtrackers=[tracker])
+	return library, Ranking(tracker, '{:>5}', top=2)
+
+
+class TestSimilarityGraph(unittest.TestCase):
+
+	def test_score_sums_similarity_times_weight(self):
+		graph = SimilarityGraph()
+		for fixture in FIXTURES:
+			args = dict(fixture['args'])
+			graph.add_response(args['artist'], args['track'], fixture['response'])
+		a = graph.get_node('A', 'a')
+		b = graph.get_node('B', 'b')
+		x = graph.get_node('X', 'x')
+
+		scores = graph.score({a: 3, b: 1})
+		self.assertAlmostEqual(scores[x], 3 * 0.5 + 0.5)
+		self.assertAlmostEqual(scores[b], 3 * 0.2)
+		self.assertEqual(graph.score({a: 3, b: 1}, similarity=False)[x], 4)
+
+	def test_new_response_replaces_similar_tracks(self):
+		graph = SimilarityGraph()
+		graph.add_response('A', 'a', FIXTURES[0]['response'])
+		graph.add_response('A', 'a', FIXTURES[1]['response'])
+		scores = graph.score({graph.get_node('A', 'a'): 1})
+		self.assertEqual(scores[graph.get_node('Y', 'y')], 0)
+		self.assertAlmostEqual(scores[graph.get_node('Z', 'z')], 0.1)
+
+
+class TestRecommender(unittest.TestCase):
+
+	def assertRecommendations(self, recommendations):
+		self.assertEqual([(r[0].artist, r[0].name) for r in recommendations], [(artist, name) for artist, name, _, _ in EXPECTED])
+		for r, (_, _, score, match) in zip(recommendations, EXPECTED):
+			self.assertAlmostEqual(r[1], score)
+			self.assertAlmostEqual(r[2], match)
+
+	def test_recommendations_from_seeded_cache(self):
+		library, ranking = create_library()
+		with tempfile.TemporaryDirectory() as folder:
+			seed_path = os.path.join(folder, 'fixtures.json')
+			with open(seed_path, 'w', encoding='utf-8') as seed_file:
+				json.dump(FIXTURES, seed_file)
+
+			with ResponseCache(os.path.join(folder, 'cache.db')) as cache:
+				cache.seed(seed_path)
+				api = LastFMAPI('test', cache=cache, offline=True)
+				recommender = Recommender(ranking, api, based_on=2, amount=10, library=library)
+				self.assertRecommendations(recommender.get_recommendations())
+
+	def test_recommendations_from_standin(self):
+		library, ranking = create_library()
+		with StandInServer(FIXTURES) as standin, ResponseCache(':memory:') as cache:
+			api = LastFMAPI('test', cache=cache, api_root=standin.url)
+			recommender = Recommender(ranking, api, based_on=2, amount=10, library=library)
+			self.assertRecommendations(recommender.get_recommendations())
+			self.assertEqual(standin.request_count, 2)
+
+			# The similar tracks are in the graph now, only the scoring is done again
+			self.assertRecommendations(recommender.get_recommendations())
+			self.assertEqual(standin.request_count, 2)
+
+	def test_amount_limits_recommendations(self):
+		library, ranking = create_library()
+		with StandInServer(FIXTURES) as standin:
+			recommender = Recommender(ranking, LastFMAPI('test', api_root=standin.url), based_on=2, amount=2, library=library)
+			self.assertEqual([(r[0].artist, r[0].name) for r in recommender.get_recommendations()], [('Y', 'y'), ('X', 'x')])
+
+
+if __name__ == '__main__':
+	unittest.main()